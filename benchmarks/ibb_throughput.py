@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+    Slixmpp: The Slick XMPP Library
+    This file is part of Slixmpp.
+
+    See the file LICENSE for copying permission.
+
+Measure the throughput of an XEP-0047 in-band bytestream sending a file,
+for several send windows, over the mock transport of the test suite. The
+peer acknowledges every data chunk after a simulated round-trip time.
+
+Usage::
+
+    python3 benchmarks/ibb_throughput.py [-s SIZE] [-r RTT] [-b BLOCK_SIZE]
+"""
+
+import io
+import re
+import sys
+import time
+import asyncio
+from argparse import ArgumentParser
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from slixmpp import ClientXMPP
+from slixmpp.plugins.xep_0047 import IBBytestream
+from slixmpp.test import TestTransport
+
+
+ID = re.compile(rb'<iq[^>]* id="([^"]+)"')
+
+RESULT = ('<iq type="result" id="%s" to="juliet@capulet.lit/balcony" '
+          'from="romeo@montague.lit/orchard" />')
+
+
+class PeerTransport(TestTransport):
+
+    """Acknowledge every Iq written after ``rtt`` seconds."""
+
+    rtt = 0.01
+
+    def write(self, data):
+        loop = self.xmpp.loop
+        for iq_id in ID.findall(data):
+            reply = RESULT % iq_id.decode()
+            loop.call_later(self.rtt, self.xmpp.data_received, reply)
+        return len(data)
+
+
+def run(xmpp, data, block_size, window):
+    stream = IBBytestream(xmpp, 'bench', block_size,
+                          xmpp.boundjid, 'romeo@montague.lit/orchard',
+                          window=window)
+    stream.stream_started = True
+    start = time.perf_counter()
+    xmpp.loop.run_until_complete(stream.sendfile(io.BytesIO(data)))
+    return len(data) / 1024 / (time.perf_counter() - start)
+
+
+def main():
+    parser = ArgumentParser(description='Measure IBB throughput.')
+    parser.add_argument('-s', '--size', type=int, default=256 * 1024,
+                        help='bytes to send')
+    parser.add_argument('-r', '--rtt', type=float, default=0.01,
+                        help='simulated round-trip time, in seconds')
+    parser.add_argument('-b', '--block-size', type=int, default=4096,
+                        help='size of the data chunks')
+    args = parser.parse_args()
+
+    xmpp = ClientXMPP('juliet@capulet.lit/balcony', 'secret')
+    xmpp.register_plugin('xep_0047')
+    PeerTransport.rtt = args.rtt
+    xmpp.connection_made(PeerTransport(xmpp))
+    xmpp.session_bind_event.set()
+    xmpp.data_received(xmpp.stream_header)
+
+    data = bytes(range(256)) * (args.size // 256)
+
+    print('%-8s %12s' % ('window', 'KB/s'))
+    for window in (1, 2, 4, 8, 16, 32):
+        print('%-8d %12.0f' % (window,
+                               run(xmpp, data, args.block_size, window)))
+
+
+if __name__ == '__main__':
+    main()
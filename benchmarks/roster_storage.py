@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+    Slixmpp: The Slick XMPP Library
+    This file is part of Slixmpp.
+
+    See the file LICENSE for copying permission.
+
+Measure how long a component roster stored in SQLite blocks the event
+loop, when adding contacts and when loading them at startup, with a
+datastore writing each item as it changes and with the write-behind
+datastore. The time spent writing in the background is shown apart.
+
+Usage::
+
+    python3 benchmarks/roster_storage.py [-n NUMBER]
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import time
+import asyncio
+from argparse import ArgumentParser
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from slixmpp import ComponentXMPP
+from slixmpp.roster import SQLiteRosterStorage, WriteBehindRoster
+from slixmpp.roster.sqlite import FIELDS, SCHEMA
+
+
+OWNER = 'bot.example.com'
+
+
+class SyncSQLiteRoster:
+
+    """A datastore interface writing every change on the spot."""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(SCHEMA)
+
+    def entries(self, owner, db_state=None):
+        if owner is None:
+            query = self.conn.execute('SELECT DISTINCT owner FROM roster')
+        else:
+            query = self.conn.execute(
+                    'SELECT jid FROM roster WHERE owner = ?', (owner,))
+        return [row[0] for row in query]
+
+    def load(self, owner, jid, db_state):
+        row = self.conn.execute(
+                'SELECT name, groups, "from", "to", pending_in, '
+                'pending_out, whitelisted FROM roster '
+                'WHERE owner = ? AND jid = ?', (owner, jid)).fetchone()
+        if row is None:
+            return None
+        state = dict(zip(FIELDS, row))
+        state['groups'] = json.loads(state['groups'])
+        return state
+
+    def save(self, owner, jid, state, db_state):
+        with self.conn:
+            self.conn.execute(
+                    'INSERT OR REPLACE INTO roster VALUES '
+                    '(?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (owner, jid, state['name'], json.dumps(state['groups']))
+                    + tuple(bool(state[field]) for field in FIELDS[2:]))
+
+
+def make_xmpp():
+    return ComponentXMPP(OWNER, 'secret', 'localhost', 5347)
+
+
+def add_contacts(xmpp, number):
+    roster = xmpp.roster[OWNER]
+    for i in range(number):
+        roster.add('user%d@example.com' % i, name='User %d' % i,
+                   groups=['Contacts'], afrom=True, save=True)
+
+
+def run_sync(path, number):
+    xmpp = make_xmpp()
+    xmpp.roster.set_backend(SyncSQLiteRoster(path), save=False)
+    start = time.perf_counter()
+    add_contacts(xmpp, number)
+    add = time.perf_counter() - start
+
+    start = time.perf_counter()
+    xmpp = make_xmpp()
+    xmpp.roster.set_backend(SyncSQLiteRoster(path), save=False)
+    load = time.perf_counter() - start
+    assert len(xmpp.roster[OWNER]) == number
+    return add, 0.0, load
+
+
+def run_write_behind(path, number):
+    loop = asyncio.get_event_loop()
+    xmpp = make_xmpp()
+    backend = WriteBehindRoster(SQLiteRosterStorage(path))
+    loop.run_until_complete(backend.open())
+    xmpp.roster.set_backend(backend, save=False)
+    start = time.perf_counter()
+    add_contacts(xmpp, number)
+    add = time.perf_counter() - start
+    start = time.perf_counter()
+    loop.run_until_complete(backend.close())
+    flush = time.perf_counter() - start
+
+    backend = WriteBehindRoster(SQLiteRosterStorage(path))
+    loop.run_until_complete(backend.open())
+    start = time.perf_counter()
+    xmpp = make_xmpp()
+    xmpp.roster.set_backend(backend, save=False)
+    load = time.perf_counter() - start
+    loop.run_until_complete(backend.close())
+    assert len(xmpp.roster[OWNER]) == number
+    return add, flush, load
+
+
+def main():
+    parser = ArgumentParser(description='Measure roster storage.')
+    parser.add_argument('-n', '--number', type=int, default=5000,
+                        help='contacts in the roster')
+    args = parser.parse_args()
+
+    print('%-14s %12s %14s %12s' % ('datastore', 'add (ms)',
+                                    'background (ms)', 'load (ms)'))
+    with TemporaryDirectory() as tmpdir:
+        for name, run in (('sync', run_sync),
+                          ('write-behind', run_write_behind)):
+            path = os.path.join(tmpdir, name + '.db')
+            add, flush, load = run(path, args.number)
+            print('%-14s %12.0f %14.0f %12.0f' % (name, add * 1000,
+                                                  flush * 1000, load * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+    Slixmpp: The Slick XMPP Library
+    This file is part of Slixmpp.
+
+    See the file LICENSE for copying permission.
+
+Measure the memory used by stanza objects, in bytes per stanza, for
+received messages (built from XML, the way the stream does it) and for
+messages built by the application. The XML trees themselves are
+included, since they are kept alive by the stanzas.
+
+Usage::
+
+    python3 benchmarks/stanza_memory.py [-n NUMBER]
+"""
+
+import gc
+import sys
+import tracemalloc
+from argparse import ArgumentParser
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from slixmpp import ClientXMPP
+from slixmpp.xmlstream import ET
+
+
+RECEIVED = """
+  <message xmlns="jabber:client" to="juliet@capulet.lit/balcony"
+           from="romeo@montague.lit/orchard" type="chat" id="ktx72v49">
+    <body>Art thou not Romeo, and a Montague?</body>
+    <active xmlns="http://jabber.org/protocol/chatstates" />
+    <request xmlns="urn:xmpp:receipts" />
+    <delay xmlns="urn:xmpp:delay" from="capulet.lit"
+           stamp="2002-09-10T23:08:25Z" />
+  </message>
+"""
+
+
+def measure(build, number):
+    """Return the bytes allocated per object kept alive by ``build``."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    kept = [build() for _ in range(number)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    del kept
+    return size / number
+
+
+def main():
+    parser = ArgumentParser(description='Measure stanza memory use.')
+    parser.add_argument('-n', '--number', type=int, default=5000,
+                        help='stanzas kept alive per measurement')
+    args = parser.parse_args()
+
+    xmpp = ClientXMPP('juliet@capulet.lit/balcony', 'secret')
+    for plugin in ('xep_0085', 'xep_0184', 'xep_0203'):
+        xmpp.register_plugin(plugin)
+    data = RECEIVED.strip()
+
+    def received():
+        msg = xmpp._build_stanza(ET.fromstring(data))
+        msg['body']
+        return msg
+
+    def created():
+        return xmpp.make_message('romeo@montague.lit', 'Hi!', mtype='chat')
+
+    # Warm up the caches (JIDs, compiled paths, interned strings).
+    received()
+    created()
+
+    print('%-10s %14s' % ('stanza', 'bytes/stanza'))
+    print('%-10s %14.0f' % ('received', measure(received, args.number)))
+    print('%-10s %14.0f' % ('created', measure(created, args.number)))
+
+
+if __name__ == '__main__':
+    main()
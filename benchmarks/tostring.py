@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+    Slixmpp: The Slick XMPP Library
+    This file is part of Slixmpp.
+
+    See the file LICENSE for copying permission.
+
+Compare the speed of :func:`slixmpp.xmlstream.tostring.tostring` with the
+:class:`slixmpp.xmlstream.tostring.Serializer` used by the stream to send
+stanzas, on a few typical stanzas.
+
+Usage::
+
+    python3 benchmarks/tostring.py [-n NUMBER]
+"""
+
+import sys
+import timeit
+from argparse import ArgumentParser
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from slixmpp import ClientXMPP
+from slixmpp.xmlstream import ET
+from slixmpp.xmlstream.tostring import tostring
+
+
+STANZAS = {
+    'message': """
+      <message xmlns="jabber:client" to="juliet@capulet.lit/balcony"
+               from="romeo@montague.lit/orchard" type="chat" id="ktx72v49"
+               xml:lang="en">
+        <body>Art thou not Romeo, &amp; a Montague?</body>
+        <active xmlns="http://jabber.org/protocol/chatstates" />
+        <request xmlns="urn:xmpp:receipts" />
+      </message>
+    """,
+    'presence': """
+      <presence xmlns="jabber:client" from="romeo@montague.lit/orchard"
+                id="pres1">
+        <show>away</show>
+        <status>Walking in the orchard</status>
+        <priority>5</priority>
+        <c xmlns="http://jabber.org/protocol/caps" hash="sha-1"
+           node="https://slixmpp.readthedocs.io"
+           ver="QgayPKawpkPSDYmwT/WM94uAlu0=" />
+      </presence>
+    """,
+    'pubsub': """
+      <iq xmlns="jabber:client" type="set" id="pub1"
+          to="pubsub.shakespeare.lit">
+        <pubsub xmlns="http://jabber.org/protocol/pubsub">
+          <publish node="princely_musings">
+            <item id="ae890ac52d0df67ed7cfdf51b644e901">
+              <entry xmlns="http://www.w3.org/2005/Atom">
+                <title>Soliloquy</title>
+                <summary>To be, or not to be: that is the question.</summary>
+                <link rel="alternate" type="text/html"
+                      href="http://denmark.lit/2003/12/13/atom03" />
+                <id>tag:denmark.lit,2003:entry-32397</id>
+                <published>2003-12-13T18:30:02Z</published>
+                <updated>2003-12-13T18:30:02Z</updated>
+              </entry>
+            </item>
+          </publish>
+        </pubsub>
+      </iq>
+    """,
+}
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark stanza serialization.')
+    parser.add_argument('-n', '--number', type=int, default=20000,
+                        help='serializations per stanza and method')
+    args = parser.parse_args()
+
+    xmpp = ClientXMPP('romeo@montague.lit/orchard', 'secret')
+    serializer = xmpp.serializer
+
+    print('%-10s %14s %14s %8s' % ('stanza', 'tostring (µs)',
+                                   'Serializer (µs)', 'speedup'))
+    for name, data in STANZAS.items():
+        xml = ET.fromstring(data.strip())
+
+        def old():
+            return tostring(xml, xmlns=xmpp.default_ns, stream=xmpp,
+                            top_level=True).encode('utf-8')
+
+        def new():
+            return serializer.serialize(xml, xmlns=xmpp.default_ns,
+                                        top_level=True)
+
+        assert old() == new()
+        old_time = min(timeit.repeat(old, number=args.number, repeat=3))
+        new_time = min(timeit.repeat(new, number=args.number, repeat=3))
+        print('%-10s %14.2f %14.2f %7.2fx' % (
+            name,
+            old_time / args.number * 1e6,
+            new_time / args.number * 1e6,
+            old_time / new_time))
+
+
+if __name__ == '__main__':
+    main()
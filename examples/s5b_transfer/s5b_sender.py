@@ -54,11 +54,7 @@ class S5BSender(slixmpp.ClientXMPP):
             proxy = await self['xep_0065'].handshake(self.receiver)
 
             # Send the entire file.
-            while True:
-                data = self.file.read(1048576)
-                if not data:
-                    break
-                await proxy.write(data)
+            await proxy.sendfile(self.file)
 
             # And finally close the stream.
             proxy.transport.write_eof()
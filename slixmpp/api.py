@@ -24,7 +24,7 @@ class APIWrapper(object):
             def partial(handler, op, jid=None, node=None):
                 return getattr(self.api, attr)(handler, self.name, op)
             return partial
-        elif attr in ('run', 'restore_default', 'unregister'):
+        elif attr in ('run', 'get_handler', 'restore_default', 'unregister'):
             def partial(*args, **kwargs):
                 return getattr(self.api, attr)(self.name, *args, **kwargs)
             return partial
@@ -97,6 +97,26 @@ class APIRegistry(object):
         :param JID ifrom: Optionally provide the requesting JID.
         :param tuple args: Optional positional arguments to the handler.
         """
+        handler, jid, node = self._resolve(ctype, op, jid, node)
+        if handler:
+            try:
+                return handler(jid, node, ifrom, args)
+            except TypeError:
+                # To preserve backward compatibility, drop the ifrom
+                # parameter for existing handlers that don't understand it.
+                return handler(jid, node, args)
+
+    def get_handler(self, ctype, op, jid=None, node=None):
+        """Return the API callback :meth:`run` would execute.
+
+        :param string ctype: The name of the API to use.
+        :param string op: The API operation to perform.
+        :param JID jid: Optionally provide specific JID.
+        :param string node: Optionally provide specific node.
+        """
+        return self._resolve(ctype, op, jid, node)[0]
+
+    def _resolve(self, ctype, op, jid, node):
         self._setup(ctype, op)
 
         if not jid:
@@ -127,14 +147,7 @@ class APIRegistry(object):
             handler = self._handlers[ctype][op]['jid'].get(jid, None)
         if handler is None:
             handler = self._handlers[ctype][op].get('global', None)
-
-        if handler:
-            try:
-                return handler(jid, node, ifrom, args)
-            except TypeError:
-                # To preserve backward compatibility, drop the ifrom
-                # parameter for existing handlers that don't understand it.
-                return handler(jid, node, args)
+        return handler, jid, node
 
     def register(self, handler, ctype, op, jid=None, node=None, default=False):
         """Register an API callback, with JID+node specificity.
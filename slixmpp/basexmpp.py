@@ -24,6 +24,7 @@ from slixmpp.stanza.roster import Roster
 
 from slixmpp.xmlstream import XMLStream, JID
 from slixmpp.xmlstream import ET, register_stanza_plugin
+from slixmpp.xmlstream import PRIORITY_HIGH, PRIORITY_NORMAL
 from slixmpp.xmlstream.matcher import MatchXPath
 from slixmpp.xmlstream.handler import Callback
 from slixmpp.xmlstream.stanzabase import XML_NS
@@ -207,6 +208,28 @@ class BaseXMPP(XMLStream):
             log.warning('Legacy XMPP 0.9 protocol detected.')
             self.event('legacy_protocol')
 
+    def get_send_priority(self, data):
+        """Let replies to requests overtake other queued stanzas.
+
+        Overrides XMLStream.get_send_priority
+        """
+        if isinstance(data, Iq) and data['type'] in ('result', 'error'):
+            return PRIORITY_HIGH
+        return PRIORITY_NORMAL
+
+    def reject_stanza(self, xml):
+        """Tell the sender of a dropped request to retry later.
+
+        Overrides XMLStream.reject_stanza
+        """
+        XMLStream.reject_stanza(self, xml)
+        if xml.tag == '{%s}iq' % self.default_ns \
+                and xml.get('type') in ('get', 'set'):
+            iq = self._build_stanza(xml).reply(clear=True)
+            iq['error']['type'] = 'wait'
+            iq['error']['condition'] = 'resource-constraint'
+            iq.send()
+
     def process(self, *, forever=True, timeout=None):
         self.init_plugins()
         XMLStream.process(self, forever=forever, timeout=timeout)
@@ -268,6 +291,10 @@ class BaseXMPP(XMLStream):
         """Return a plugin given its name, if it has been registered."""
         return self.plugin.get(key, default)
 
+    def _admission_domains(self):
+        """Also exempt the stanzas sent by the domain we are bound to."""
+        return (self.boundjid.domain, self.default_domain)
+
     def Message(self, *args, **kwargs):
         """Create a Message stanza associated with this stream."""
         msg = Message(self, *args, **kwargs)
@@ -658,6 +685,9 @@ class BaseXMPP(XMLStream):
     def _handle_stream_error(self, error):
         self.event('stream_error', error)
 
+        if error['condition'] != 'see-other-host':
+            self.wire_trace.dump(log)
+
         if error['condition'] == 'see-other-host':
             other_host = error['see_other_host']
             if not other_host:
@@ -17,6 +17,7 @@ import logging
 
 from slixmpp.jid import JID
 from slixmpp.stanza import StreamFeatures
+from slixmpp.roster import SQLiteRosterStorage, WriteBehindRoster
 from slixmpp.basexmpp import BaseXMPP
 from slixmpp.exceptions import XMPPError
 from slixmpp.xmlstream import XMLStream
@@ -77,6 +78,11 @@ class ClientXMPP(BaseXMPP):
 
         self.credentials = {}
 
+        #: The :class:`~slixmpp.roster.WriteBehindRoster` set by
+        #: :meth:`set_roster_cache`, if any.
+        self.roster_cache = None
+        self._roster_cache_loading = None
+
         self.password = password
 
         self.stream_header = "<stream:stream to='%s' %s %s %s %s>" % (
@@ -234,12 +240,52 @@ class ClientXMPP(BaseXMPP):
         """
         return self.client_roster.remove(jid)
 
+    def set_roster_cache(self, path):
+        """Keep the roster and its version in an SQLite database.
+
+        The cache is loaded by the next :meth:`get_roster`, which then
+        only receives the changes since the stored version when the
+        server supports roster versioning.
+
+        :param path: The file of the database, created if needed.
+        """
+        self.roster_cache = WriteBehindRoster(SQLiteRosterStorage(path))
+        self._roster_cache_loading = None
+
+    async def _load_roster_cache(self):
+        if self._roster_cache_loading is None:
+            cache = self.roster_cache
+
+            async def load():
+                try:
+                    await cache.open()
+                except BaseException:
+                    # Try again with the next get_roster().
+                    self._roster_cache_loading = None
+                    raise
+                self.roster.set_backend(cache, save=False)
+
+            self._roster_cache_loading = asyncio.ensure_future(load())
+        await asyncio.shield(self._roster_cache_loading)
+
     def get_roster(self, callback=None, timeout=None, timeout_callback=None):
         """Request the roster from the server.
 
+        With a roster cache (see :meth:`set_roster_cache`), it is loaded
+        first and the request is made from a task.
+
         :param callback: Reference to a stream handler function. Will
                          be executed when the roster is received.
         """
+        if self.roster_cache is not None:
+            async def get_roster():
+                await self._load_roster_cache()
+                return await self._request_roster(callback, timeout,
+                                                  timeout_callback)
+            return asyncio.ensure_future(get_roster())
+        return self._request_roster(callback, timeout, timeout_callback)
+
+    def _request_roster(self, callback, timeout, timeout_callback):
         iq = self.Iq()
         iq['type'] = 'get'
         iq.enable('roster')
@@ -294,8 +340,12 @@ class ClientXMPP(BaseXMPP):
                 raise XMPPError(condition='service-unavailable')
 
         roster = self.client_roster
-        if iq['roster']['ver']:
-            roster.version = iq['roster']['ver']
+        if iq['type'] == 'result':
+            if iq.xml.find('{jabber:iq:roster}query') is None:
+                # The roster did not change since our version.
+                return
+            if self.roster_cache is not None:
+                self._remove_stale_roster_items(iq['roster']['items'])
         items = iq['roster']['items']
 
         valid_subscriptions = ('to', 'from', 'both', 'none', 'remove')
@@ -309,6 +359,11 @@ class ClientXMPP(BaseXMPP):
 
                 roster[jid].save(remove=(item['subscription'] == 'remove'))
 
+        # Only once the items are saved, so that a roster cache never
+        # holds a version newer than its items.
+        if iq['roster']['ver']:
+            roster.version = iq['roster']['ver']
+
         if iq['type'] == 'set':
             resp = self.Iq(stype='result',
                            sto=iq['from'],
@@ -316,6 +371,17 @@ class ClientXMPP(BaseXMPP):
             resp.enable('roster')
             resp.send()
 
+    def _remove_stale_roster_items(self, items):
+        """Forget the cached roster entries absent from a full roster."""
+        roster = self.client_roster
+        for jid in list(roster.keys()):
+            if jid in items:
+                continue
+            item = roster[jid]
+            if item['from'] or item['to'] or item['pending_out'] or \
+               item['name'] or item['groups']:
+                item.save(remove=True)
+
     def _handle_session_bind(self, jid):
         """Set the client roster to the JID set by the server.
 
@@ -39,6 +39,7 @@ class FeatureMechanisms(BasePlugin):
         'unencrypted_digest': False,
         'unencrypted_cram': False,
         'unencrypted_scram': True,
+        'scram_key_store': None,
         'order': 100
     }
 
@@ -180,6 +181,10 @@ class FeatureMechanisms(BasePlugin):
             log.exception("A credential value did not pass SASLprep.")
             self.xmpp.disconnect()
 
+        if self.scram_key_store is not None and \
+                isinstance(self.mech, sasl.SCRAM):
+            self.mech.key_store = self.scram_key_store
+
         resp = stanza.Auth(self.xmpp)
         resp['mechanism'] = self.mech.name
         try:
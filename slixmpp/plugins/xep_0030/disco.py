@@ -6,15 +6,18 @@
     See the file LICENSE for copying permission.
 """
 
+import copy
 import asyncio
 import logging
 
 from slixmpp import Iq
 from slixmpp import future_wrapper
+from slixmpp.exceptions import IqError, IqTimeout
 from slixmpp.plugins import BasePlugin
 from slixmpp.xmlstream.handler import Callback
 from slixmpp.xmlstream.matcher import StanzaPath
-from slixmpp.xmlstream import register_stanza_plugin, JID
+from slixmpp.xmlstream import register_stanza_plugin, JID, ET
+from slixmpp.util import LRUCache
 from slixmpp.plugins.xep_0030 import stanza, DiscoInfo, DiscoItems
 from slixmpp.plugins.xep_0030 import StaticDisco
 
@@ -67,6 +70,14 @@ class XEP_0030(BasePlugin):
                             static node handlers.
         default_handlers -- A dictionary mapping operations to the default
                             global handler (by default, the static handlers).
+        cache            -- The LRUCache of remote disco#info and
+                            disco#items results, holding at most
+                            cache_size entries for cache_ttl seconds,
+                            optionally persisted to cache_backend.
+        request_stats    -- Counters of the remote queries: 'sent' ones,
+                            'coalesced' ones which waited for the reply
+                            to an identical query already in flight, and
+                            'cancelled' ones given up by all their callers.
         xmpp             -- The main Slixmpp object.
 
     Methods:
@@ -92,6 +103,9 @@ class XEP_0030(BasePlugin):
     stanza = stanza
     default_config = {
         'use_cache': True,
+        'cache_size': 4096,
+        'cache_ttl': 3600,
+        'cache_backend': None,
         'wrap_results': False
     }
 
@@ -112,6 +126,9 @@ class XEP_0030(BasePlugin):
         register_stanza_plugin(Iq, DiscoInfo)
         register_stanza_plugin(Iq, DiscoItems)
 
+        self.cache = LRUCache(size=self.cache_size, ttl=self.cache_ttl,
+                              backend=self.cache_backend, encode=str,
+                              decode=self._decode_cached)
         self.static = StaticDisco(self.xmpp, self)
 
         self._disco_ops = [
@@ -119,13 +136,17 @@ class XEP_0030(BasePlugin):
                 'get_items', 'set_items', 'del_items', 'add_identity',
                 'del_identity', 'add_feature', 'del_feature', 'add_item',
                 'del_item', 'del_identities', 'del_features', 'cache_info',
-                'get_cached_info', 'supports', 'has_identity']
+                'get_cached_info', 'cache_items', 'get_cached_items',
+                'supports', 'has_identity']
 
         for op in self._disco_ops:
             self.api.register(getattr(self.static, op), op, default=True)
 
         self.domain_infos = {}
 
+        self.request_stats = {'sent': 0, 'coalesced': 0, 'cancelled': 0}
+        self._in_flight = {}
+
     def session_bind(self, jid):
         self.add_feature('http://jabber.org/protocol/disco#info')
 
@@ -181,6 +202,7 @@ class XEP_0030(BasePlugin):
             handler -- The handler function to use.
         """
         self.api.register(handler, htype, jid, node)
+        self.static.invalidate()
 
     def del_node_handler(self, htype, jid, node):
         """
@@ -204,6 +226,7 @@ class XEP_0030(BasePlugin):
             node  -- The node from which to remove the handler.
         """
         self.api.unregister(htype, jid, node)
+        self.static.invalidate()
 
     def restore_defaults(self, jid=None, node=None, handlers=None):
         """
@@ -227,6 +250,7 @@ class XEP_0030(BasePlugin):
             handlers = self._disco_ops
         for op in handlers:
             self.api.restore_default(op, jid, node)
+        self.static.invalidate()
 
     def supports(self, jid=None, node=None, feature=None, local=False,
                        cached=True, ifrom=None):
@@ -404,9 +428,7 @@ class XEP_0030(BasePlugin):
         iq['to'] = jid
         iq['type'] = 'get'
         iq['disco_info']['node'] = node if node else ''
-        return iq.send(timeout=kwargs.get('timeout', None),
-                       callback=kwargs.get('callback', None),
-                       timeout_callback=kwargs.get('timeout_callback', None))
+        return self._send_query('info', iq, kwargs)
 
     def set_info(self, jid=None, node=None, info=None):
         """
@@ -418,7 +440,8 @@ class XEP_0030(BasePlugin):
         self.api['set_info'](jid, node, None, info)
 
     @future_wrapper
-    def get_items(self, jid=None, node=None, local=False, **kwargs):
+    def get_items(self, jid=None, node=None, local=False, cached=None,
+                  **kwargs):
         """
         Retrieve the disco#items results from a given JID/node combination.
 
@@ -438,6 +461,9 @@ class XEP_0030(BasePlugin):
                         no stanzas need to be sent.
                         Otherwise, a disco stanza must be sent to the
                         remove JID to retrieve the items.
+            cached   -- If true, then look for the disco items data from
+                        the local cache system. If no results are found,
+                        send the query as usual. Defaults to false.
             ifrom    -- Specifiy the sender's JID.
             timeout  -- The time in seconds to block while waiting for
                         a reply. If None, then wait indefinitely.
@@ -456,6 +482,15 @@ class XEP_0030(BasePlugin):
                     kwargs)
             return self._wrap(kwargs.get('ifrom', None), jid, items)
 
+        if cached:
+            log.debug("Looking up cached disco#items data " + \
+                      "for %s, node %s.", jid, node)
+            items = self.api['get_cached_items'](jid, node,
+                    kwargs.get('ifrom', None),
+                    kwargs)
+            if items is not None:
+                return self._wrap(kwargs.get('ifrom', None), jid, items)
+
         iq = self.xmpp.Iq()
         # Check dfrom parameter for backwards compatibility
         iq['from'] = kwargs.get('ifrom', kwargs.get('dfrom', ''))
@@ -466,9 +501,7 @@ class XEP_0030(BasePlugin):
             raise NotImplementedError("XEP 0059 has not yet been fixed")
             return self.xmpp['xep_0059'].iterate(iq, 'disco_items')
         else:
-            return iq.send(timeout=kwargs.get('timeout', None),
-                           callback=kwargs.get('callback', None),
-                           timeout_callback=kwargs.get('timeout_callback', None))
+            return self._send_query('items', iq, kwargs)
 
     def set_items(self, jid=None, node=None, **kwargs):
         """
@@ -672,19 +705,34 @@ class XEP_0030(BasePlugin):
         if iq['type'] == 'get':
             log.debug("Received disco info query from " + \
                       "<%s> to <%s>.", iq['from'], iq['to'])
+            node = iq['disco_info']['node']
+            key = (iq['to'].full, node)
+            # Replies are only reused while the static handler serves
+            # this JID and node, custom handlers may answer differently.
+            static = self.api.get_handler('get_info', iq['to'], node) \
+                    == self.static.get_info
+            snapshot = self.static.snapshots.get(key, None) \
+                    if static else None
+            if snapshot is not None:
+                iq = iq.reply()
+                iq.set_payload(copy.deepcopy(snapshot))
+                iq.send()
+                return
             info = self.api['get_info'](iq['to'],
-                                        iq['disco_info']['node'],
+                                        node,
                                         iq['from'],
                                         iq)
             if isinstance(info, Iq):
                 info['id'] = iq['id']
                 info.send()
             else:
-                node = iq['disco_info']['node']
                 iq = iq.reply()
                 if info:
+                    static = static and self.static.is_static(info)
                     info = self._fix_default_info(info)
                     info['node'] = node
+                    if static:
+                        self.static.snapshot(key[0], node, info)
                     iq.set_payload(info.xml)
                 iq.send()
         elif iq['type'] == 'result':
@@ -729,8 +777,31 @@ class XEP_0030(BasePlugin):
         elif iq['type'] == 'result':
             log.debug("Received disco items result from " + \
                       "%s to %s.", iq['from'], iq['to'])
+            if self.use_cache and 'rsm' not in iq['disco_items'].loaded_plugins:
+                if self.xmpp.is_component:
+                    ito = iq['to'].full
+                else:
+                    ito = None
+                self.api['cache_items'](iq['from'],
+                                        iq['disco_items']['node'],
+                                        ito,
+                                        iq)
             self.xmpp.event('disco_items', iq)
 
+    def _decode_cached(self, data):
+        """
+        Rebuild a disco#info or disco#items result read from the
+        persistent cache backend, where it is stored as XML.
+
+        Arguments:
+            data -- The XML string of the disco#info or disco#items
+                    element.
+        """
+        xml = ET.fromstring(data)
+        if xml.tag == DiscoItems.tag_name():
+            return DiscoItems(xml)
+        return DiscoInfo(xml)
+
     def _fix_default_info(self, info):
         """
         Disco#info results for a JID are required to include at least
@@ -761,6 +832,94 @@ class XEP_0030(BasePlugin):
                 info.add_feature(info.namespace)
         return result
 
+    def _send_query(self, kind, iq, kwargs):
+        """
+        Send a disco query, unless an identical one (same kind, target,
+        node and sender) is still waiting for its reply, in which case
+        the caller waits for that reply instead.
+
+        Each caller gets its own future, with its own timeout and
+        callbacks; cancelling it does not affect the other callers. The
+        shared query is sent with the default timeout rather than the
+        one of any caller, and is abandoned once all of its callers are
+        gone.
+
+        Arguments:
+            kind   -- Either 'info' or 'items'.
+            iq     -- The query to send.
+            kwargs -- The arguments given to get_info or get_items.
+        """
+        key = (kind, iq['to'].full, iq['disco_%s' % kind]['node'],
+               iq['from'].full)
+        flight = self._in_flight.get(key)
+        if flight is None or flight[0].done():
+            shared = iq.send(timeout=None)
+            flight = self._in_flight[key] = [shared, iq, 0]
+            self.request_stats['sent'] += 1
+
+            def end_flight(shared):
+                if self._in_flight.get(key) is flight:
+                    del self._in_flight[key]
+            shared.add_done_callback(end_flight)
+        else:
+            self.request_stats['coalesced'] += 1
+            log.debug("Waiting for the disco#%s query already sent " + \
+                      "to %s, node %s.", kind, key[1], key[2])
+        shared, iq = flight[0], flight[1]
+        flight[2] += 1
+
+        future = asyncio.Future()
+        callback = kwargs.get('callback', None)
+        timeout_callback = kwargs.get('timeout_callback', None)
+        timeout = kwargs.get('timeout', None)
+        handle = None
+        if timeout is not None:
+            def expire():
+                if not future.done():
+                    future.set_exception(IqTimeout(iq))
+                    if timeout_callback is not None:
+                        timeout_callback(iq)
+            handle = self.xmpp.loop.call_later(timeout, expire)
+
+        def deliver(shared):
+            if future.done():
+                return
+            if shared.cancelled():
+                future.cancel()
+                return
+            exc = shared.exception()
+            if exc is not None:
+                future.set_exception(exc)
+                if isinstance(exc, IqTimeout):
+                    if timeout_callback is not None:
+                        timeout_callback(iq)
+                    return
+                if not isinstance(exc, IqError):
+                    return
+                result = exc.iq
+            else:
+                result = shared.result()
+                future.set_result(result)
+            if callback is not None:
+                if asyncio.iscoroutinefunction(callback):
+                    asyncio.ensure_future(callback(result))
+                else:
+                    callback(result)
+
+        def leave(future):
+            if handle is not None:
+                handle.cancel()
+            shared.remove_done_callback(deliver)
+            flight[2] -= 1
+            if flight[2] == 0 and not shared.done():
+                # Nobody is waiting for the reply anymore.
+                self.request_stats['cancelled'] += 1
+                shared.cancel()
+
+        shared.add_done_callback(deliver)
+        future.add_done_callback(leave)
+        return future
+
     def _wrap(self, ito, ifrom, payload, force=False):
         """
         Ensure that results are wrapped in an Iq stanza
@@ -6,6 +6,7 @@
     See the file LICENSE for copying permission.
 """
 
+import copy
 import logging
 
 from slixmpp import Iq
@@ -28,10 +29,21 @@ class StaticDisco(object):
     StaticDisco provides a set of node handlers that will store
     static sets of disco info and items in memory.
 
+    Results received from other entities are not part of these nodes,
+    they are kept in the bounded cache of the XEP-0030 plugin instead.
+
     Attributes:
-        nodes -- A dictionary mapping (JID, node) tuples to a dict
-                 containing a disco#info and a disco#items stanza.
-        xmpp  -- The main Slixmpp object.
+        nodes     -- A dictionary mapping (JID, node) tuples to a dict
+                     containing a disco#info and a disco#items stanza.
+        snapshots -- A dictionary mapping (JID, node) tuples to the
+                     ready to send XML of a disco#info reply. They
+                     are dropped when the info of the node is read
+                     with get_info, which the caller may modify;
+                     call invalidate() after modifying a stanza
+                     obtained earlier.
+        version   -- A number incremented each time the info of any
+                     node changes, and the snapshots are dropped.
+        xmpp      -- The main Slixmpp object.
     """
 
     def __init__(self, xmpp, disco):
@@ -45,9 +57,47 @@ class StaticDisco(object):
             xmpp -- The main Slixmpp object.
         """
         self.nodes = {}
+        self.snapshots = {}
+        self.version = 0
         self.xmpp = xmpp
         self.disco = disco
 
+    def is_static(self, info):
+        """
+        Check if a disco#info stanza is the one stored for a node.
+
+        Arguments:
+            info -- The disco#info stanza to check.
+        """
+        return any(info is node['info'] for node in self.nodes.values())
+
+    def snapshot(self, jid, node, info):
+        """
+        Keep a copy of the disco#info reply for a JID/node combination,
+        until the info of any node changes.
+
+        Arguments:
+            jid  -- The JID the reply is sent from.
+            node -- The node of the reply.
+            info -- The complete disco#info stanza sent.
+        """
+        self.snapshots[(jid, node)] = copy.deepcopy(info.xml)
+
+    def invalidate(self):
+        """
+        Drop all the disco#info snapshots, after a change of the
+        info of a node or of the node handlers.
+        """
+        self.snapshots.clear()
+        self.version += 1
+
+    def _drop_snapshots(self, jid, node):
+        bare = JID(jid).bare
+        node = node or ''
+        for key in [key for key in self.snapshots
+                    if key[1] == node and JID(key[0]).bare == bare]:
+            del self.snapshots[key]
+
     def add_node(self, jid=None, node=None, ifrom=None):
         """
         Create a new set of stanzas for the provided
@@ -201,6 +251,7 @@ class StaticDisco(object):
             else:
                 raise XMPPError(condition='item-not-found')
         else:
+            self._drop_snapshots(jid, node)
             return self.get_node(jid, node)['info']
 
     def set_info(self, jid, node, ifrom, data):
@@ -209,6 +260,7 @@ class StaticDisco(object):
 
         The data parameter is a disco#info substanza.
         """
+        self.invalidate()
         new_node = self.add_node(jid, node)
         new_node['info'] = data
 
@@ -218,6 +270,7 @@ class StaticDisco(object):
 
         The data parameter is not used.
         """
+        self.invalidate()
         if self.node_exists(jid, node):
             self.get_node(jid, node)['info'] = DiscoInfo()
 
@@ -265,6 +318,7 @@ class StaticDisco(object):
             name     -- Optional human readable name for this identity.
             lang     -- Optional standard xml:lang value.
         """
+        self.invalidate()
         new_node = self.add_node(jid, node)
         new_node['info'].add_identity(
                 data.get('category', ''),
@@ -280,6 +334,7 @@ class StaticDisco(object):
             identities -- A list of identities in tuple form:
                             (category, type, name, lang)
         """
+        self.invalidate()
         identities = data.get('identities', set())
         new_node = self.add_node(jid, node)
         new_node['info']['identities'] = identities
@@ -294,6 +349,7 @@ class StaticDisco(object):
             name     -- Optional human readable name for this identity.
             lang     -- Optional, standard xml:lang value.
         """
+        self.invalidate()
         if self.node_exists(jid, node):
             self.get_node(jid, node)['info'].del_identity(
                     data.get('category', ''),
@@ -307,6 +363,7 @@ class StaticDisco(object):
 
         The data parameter is not used.
         """
+        self.invalidate()
         if self.node_exists(jid, node):
             del self.get_node(jid, node)['info']['identities']
 
@@ -317,6 +374,7 @@ class StaticDisco(object):
         The data parameter should include:
             feature -- The namespace of the supported feature.
         """
+        self.invalidate()
         new_node = self.add_node(jid, node)
         new_node['info'].add_feature(
                 data.get('feature', ''))
@@ -328,6 +386,7 @@ class StaticDisco(object):
         The data parameter should include:
             features -- The new set of supported features.
         """
+        self.invalidate()
         features = data.get('features', set())
         new_node = self.add_node(jid, node)
         new_node['info']['features'] = features
@@ -339,6 +398,7 @@ class StaticDisco(object):
         The data parameter should include:
             feature -- The namespace of the removed feature.
         """
+        self.invalidate()
         if self.node_exists(jid, node):
             self.get_node(jid, node)['info'].del_feature(
                     data.get('feature', ''))
@@ -349,6 +409,7 @@ class StaticDisco(object):
 
         The data parameter is not used.
         """
+        self.invalidate()
         if not self.node_exists(jid, node):
             return
         del self.get_node(jid, node)['info']['features']
@@ -382,6 +443,13 @@ class StaticDisco(object):
                     data.get('ijid', ''),
                     node=data.get('inode', None))
 
+    def _cache_key(self, kind, jid, node, ifrom):
+        if isinstance(jid, JID):
+            jid = jid.full
+        if isinstance(ifrom, JID):
+            ifrom = ifrom.full
+        return (kind, jid or '', node or '', ifrom or '')
+
     def cache_info(self, jid, node, ifrom, data):
         """
         Cache disco information for an external JID.
@@ -393,8 +461,8 @@ class StaticDisco(object):
         if isinstance(data, Iq):
             data = data['disco_info']
 
-        new_node = self.add_node(jid, node, ifrom)
-        new_node['info'] = data
+        self.disco.cache.store(self._cache_key('info', jid, node, ifrom),
+                               data)
 
     def get_cached_info(self, jid, node, ifrom, data):
         """
@@ -402,7 +470,28 @@ class StaticDisco(object):
 
         The data parameter is not used.
         """
-        if not self.node_exists(jid, node, ifrom):
-            return None
-        else:
-            return self.get_node(jid, node, ifrom)['info']
+        return self.disco.cache.retrieve(
+                self._cache_key('info', jid, node, ifrom))
+
+    def cache_items(self, jid, node, ifrom, data):
+        """
+        Cache disco items for an external JID.
+
+        The data parameter is the Iq result stanza
+        containing the disco items to cache, or
+        the disco#items substanza itself.
+        """
+        if isinstance(data, Iq):
+            data = data['disco_items']
+
+        self.disco.cache.store(self._cache_key('items', jid, node, ifrom),
+                               data)
+
+    def get_cached_items(self, jid, node, ifrom, data):
+        """
+        Retrieve cached disco items data.
+
+        The data parameter is not used.
+        """
+        return self.disco.cache.retrieve(
+                self._cache_key('items', jid, node, ifrom))
@@ -23,6 +23,8 @@ class XEP_0047(BasePlugin):
     default_config = {
         'block_size': 4096,
         'max_block_size': 8192,
+        'window': 1,
+        'max_buffer': 65536,
         'auto_accept': False,
     }
 
@@ -106,11 +108,13 @@ class XEP_0047(BasePlugin):
         self._preauthed_sids[(jid, sid, ifrom)] = True
 
     def open_stream(self, jid, block_size=None, sid=None, use_messages=False,
-                    ifrom=None, timeout=None, callback=None):
+                    ifrom=None, timeout=None, callback=None, window=None):
         if sid is None:
             sid = str(uuid.uuid4())
         if block_size is None:
             block_size = self.block_size
+        if window is None:
+            window = self.window
 
         iq = self.xmpp.Iq()
         iq['type'] = 'set'
@@ -121,7 +125,8 @@ class XEP_0047(BasePlugin):
         iq['ibb_open']['stanza'] = 'message' if use_messages else 'iq'
 
         stream = IBBytestream(self.xmpp, sid, block_size,
-                              iq['from'], iq['to'], use_messages)
+                              iq['from'], iq['to'], use_messages,
+                              window=window, max_buffer=self.max_buffer)
 
         stream_future = asyncio.Future()
 
@@ -157,7 +162,8 @@ class XEP_0047(BasePlugin):
             raise XMPPError('resource-constraint')
 
         stream = IBBytestream(self.xmpp, sid, size,
-                              iq['to'], iq['from'])
+                              iq['to'], iq['from'],
+                              max_buffer=self.max_buffer)
         stream.stream_started = True
         self.api['set_stream'](stream.self_jid, stream.sid, stream.peer_jid, stream)
         iq.reply().send()
@@ -10,7 +10,11 @@ VALID_B64 = re.compile(r'[A-Za-z0-9\+\/]*=*')
 
 
 def to_b64(data):
-    return bytes(base64.b64encode(bytes(data))).decode('utf-8')
+    # Any bytes-like object, like a memoryview of a larger buffer, is
+    # encoded without being copied first.
+    if not isinstance(data, (bytearray, memoryview)):
+        data = bytes(data)
+    return base64.b64encode(data).decode('ascii')
 
 
 def from_b64(data):
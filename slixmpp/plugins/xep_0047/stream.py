@@ -1,6 +1,7 @@
 import asyncio
 import socket
 import logging
+import collections
 
 from slixmpp.stanza import Iq
 from slixmpp.exceptions import XMPPError
@@ -9,13 +10,176 @@ from slixmpp.exceptions import XMPPError
 log = logging.getLogger(__name__)
 
 
+class IBBReader(object):
+
+    """
+    The data received on an in-band bytestream, read with the same
+    coroutines as an :class:`asyncio.StreamReader`.
+
+    When more than ``limit`` bytes are buffered, the stream stops
+    acknowledging the chunks it receives, which makes the sender wait,
+    until enough of them are read.
+    """
+
+    def __init__(self, stream, limit):
+        self.stream = stream
+        self.limit = limit
+        self._buffer = bytearray()
+        self._eof = False
+        self._waiter = None
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def feed_data(self, data):
+        self._buffer += data
+        self._wakeup()
+
+    def feed_eof(self):
+        self._eof = True
+        self._wakeup()
+
+    def at_eof(self):
+        """Return ``True`` if the buffer is empty and the stream closed."""
+        return self._eof and not self._buffer
+
+    def _wakeup(self):
+        waiter = self._waiter
+        if waiter is not None:
+            self._waiter = None
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def _wait_for_data(self):
+        self._waiter = asyncio.Future()
+        try:
+            await self._waiter
+        finally:
+            self._waiter = None
+
+    def _take(self, n):
+        data = bytes(self._buffer[:n])
+        del self._buffer[:n]
+        if len(self._buffer) <= self.limit:
+            self.stream._release_acks()
+        return data
+
+    def read_nowait(self, n=-1):
+        """Read up to ``n`` bytes already received, without waiting."""
+        if n < 0:
+            n = len(self._buffer)
+        return self._take(n)
+
+    async def read(self, n=-1):
+        """Read up to ``n`` bytes, or until the end of the stream if
+        ``n`` is negative."""
+        if n == 0:
+            return b''
+        if n < 0:
+            while not self._eof:
+                await self._wait_for_data()
+            return self._take(len(self._buffer))
+        if not self._buffer and not self._eof:
+            await self._wait_for_data()
+        return self._take(n)
+
+    async def readexactly(self, n):
+        """Read exactly ``n`` bytes.
+
+        :raises asyncio.IncompleteReadError: if the stream ends first.
+        """
+        while len(self._buffer) < n:
+            if self._eof:
+                data = self._take(len(self._buffer))
+                raise asyncio.IncompleteReadError(data, n)
+            await self._wait_for_data()
+        return self._take(n)
+
+    async def readuntil(self, separator=b'\n'):
+        """Read data up to and including ``separator``.
+
+        :raises asyncio.IncompleteReadError: if the stream ends first.
+        """
+        start = 0
+        while True:
+            index = self._buffer.find(separator, start)
+            if index != -1:
+                return self._take(index + len(separator))
+            if self._eof:
+                data = self._take(len(self._buffer))
+                raise asyncio.IncompleteReadError(data, None)
+            start = max(0, len(self._buffer) - len(separator) + 1)
+            await self._wait_for_data()
+
+    async def readline(self):
+        """Read one line, or the rest of the data at the end of the
+        stream."""
+        try:
+            return await self.readuntil(b'\n')
+        except asyncio.IncompleteReadError as e:
+            return e.partial
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        line = await self.readline()
+        if line == b'':
+            raise StopAsyncIteration
+        return line
+
+
+class IBBRecvQueue(object):
+
+    """
+    The former queue of received chunks, kept as a view of an
+    :class:`IBBReader` for existing code. Each item is at most
+    ``block_size`` bytes of the data not read yet.
+    """
+
+    def __init__(self, reader, block_size):
+        self.reader = reader
+        self.block_size = block_size
+
+    def qsize(self):
+        return -(-len(self.reader) // self.block_size)
+
+    def empty(self):
+        return not len(self.reader)
+
+    def get_nowait(self):
+        if not len(self.reader):
+            raise asyncio.QueueEmpty
+        return self.reader.read_nowait(self.block_size)
+
+    async def get(self):
+        return await self.reader.read(self.block_size)
+
+
 class IBBytestream(object):
 
-    def __init__(self, xmpp, sid, block_size, jid, peer, use_messages=False):
+    """
+    An in-band bytestream.
+
+    Up to ``window`` data chunks may be sent before their
+    acknowledgement is received. With a window larger than one,
+    :meth:`send` returns as soon as the chunk is sent, and a failure
+    to deliver a chunk is raised once, by the next :meth:`send` or by
+    :meth:`drain`.
+
+    Received data is read from :attr:`reader`, which buffers up to
+    ``max_buffer`` bytes before delaying the acknowledgements.
+    :attr:`recv_queue` still gives it in chunks, like the queue it
+    replaces.
+    """
+
+    def __init__(self, xmpp, sid, block_size, jid, peer, use_messages=False,
+                 window=1, max_buffer=65536):
         self.xmpp = xmpp
         self.sid = sid
         self.block_size = block_size
         self.use_messages = use_messages
+        self.window = window
 
         if jid is None:
             jid = xmpp.boundjid
@@ -29,13 +193,29 @@ class IBBytestream(object):
         self.stream_in_closed = False
         self.stream_out_closed = False
 
-        self.recv_queue = asyncio.Queue()
+        #: The :class:`IBBReader` of the received data.
+        self.reader = IBBReader(self, max_buffer)
+        #: An :class:`IBBRecvQueue` view of :attr:`reader`.
+        self.recv_queue = IBBRecvQueue(self.reader, block_size)
+        self._held_acks = collections.deque()
+
+        self._window = asyncio.Semaphore(window)
+        self._in_flight = set()
+        self._send_error = None
 
     async def send(self, data, timeout=None):
         if not self.stream_started or self.stream_out_closed:
             raise socket.error
+        self._raise_send_error()
         if len(data) > self.block_size:
             data = data[:self.block_size]
+        if not self.use_messages:
+            await self._window.acquire()
+            if self._send_error is not None:
+                self._window.release()
+                self._raise_send_error()
+        # Sequence numbers are only taken once the chunk can be sent
+        # right away, so that they are sent in order.
         self.send_seq = (self.send_seq + 1) % 65535
         seq = self.send_seq
         if self.use_messages:
@@ -55,20 +235,68 @@ class IBBytestream(object):
             iq['ibb_data']['sid'] = self.sid
             iq['ibb_data']['seq'] = seq
             iq['ibb_data']['data'] = data
-            await iq.send(timeout=timeout)
+            future = iq.send(timeout=timeout)
+            self._in_flight.add(future)
+            future.add_done_callback(self._chunk_done)
+            if self.window == 1:
+                try:
+                    await future
+                finally:
+                    # The error, if any, is raised right here.
+                    self._send_error = None
         return len(data)
 
+    def _chunk_done(self, future):
+        self._in_flight.discard(future)
+        self._window.release()
+        if future.cancelled():
+            return
+        exc = future.exception()
+        if exc is not None and self._send_error is None:
+            self._send_error = exc
+
+    def _raise_send_error(self):
+        # Each failure is only raised once, the caller decides whether
+        # to go on or to close the stream.
+        if self._send_error is not None:
+            error, self._send_error = self._send_error, None
+            raise error
+
+    async def drain(self):
+        """Wait until all the chunks sent are acknowledged."""
+        if self._in_flight:
+            await asyncio.wait(list(self._in_flight))
+        self._raise_send_error()
+
     async def sendall(self, data, timeout=None):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        view = memoryview(data)
         sent_len = 0
-        while sent_len < len(data):
-            sent_len += await self.send(data[sent_len:self.block_size], timeout=timeout)
+        while sent_len < len(view):
+            sent_len += await self.send(
+                    view[sent_len:sent_len + self.block_size],
+                    timeout=timeout)
+        await self.drain()
 
     async def sendfile(self, file, timeout=None):
+        """Send the content of a file opened in binary mode.
+
+        The file is read in a thread, ahead of the chunks being sent.
+        """
+        loop = self.xmpp.loop
+        size = self.block_size * self.window
+        read = loop.run_in_executor(None, file.read, size)
         while True:
-            data = file.read(self.block_size)
+            data = await read
             if not data:
                 break
-            await self.send(data, timeout=timeout)
+            read = loop.run_in_executor(None, file.read, size)
+            view = memoryview(data)
+            for start in range(0, len(view), self.block_size):
+                await self.send(view[start:start + self.block_size],
+                                timeout=timeout)
+        await self.drain()
 
     def _recv_data(self, stanza):
         new_seq = stanza['ibb_data']['seq']
@@ -82,19 +310,53 @@ class IBBytestream(object):
             self.close()
             raise XMPPError('not-acceptable')
 
-        self.recv_queue.put_nowait(data)
+        self.reader.feed_data(data)
         self.xmpp.event('ibb_stream_data', self)
 
         if isinstance(stanza, Iq):
-            stanza.reply().send()
+            reply = stanza.reply()
+            if self._held_acks or len(self.reader) > self.reader.limit:
+                self._held_acks.append(reply)
+            else:
+                reply.send()
+
+    def _release_acks(self):
+        while self._held_acks:
+            self._held_acks.popleft().send()
+
+    async def recvfile(self, file):
+        """Write all the data received to a file opened in binary mode,
+        until the stream is closed.
+
+        The file is written in a thread.
+
+        :returns: The number of bytes written.
+        """
+        loop = self.xmpp.loop
+        size = 0
+        while True:
+            data = await self.reader.read(self.reader.limit or 65536)
+            if not data:
+                return size
+            await loop.run_in_executor(None, file.write, data)
+            size += len(data)
 
     def recv(self, *args, **kwargs):
         return self.read()
 
     def read(self):
-        if not self.stream_started or self.stream_in_closed:
+        """Return all the data received and not read yet, without
+        waiting, instead of a single chunk as before. The result is
+        empty if nothing is buffered.
+
+        Use :attr:`reader` to wait for data.
+
+        :raises socket.error: if the stream is not started, or closed
+                              and all its data read.
+        """
+        if not self.stream_started or self.reader.at_eof():
             raise socket.error
-        return self.recv_queue.get_nowait()
+        return self.reader.read_nowait()
 
     def close(self, timeout=None):
         iq = self.xmpp.Iq()
@@ -105,6 +367,7 @@ class IBBytestream(object):
         self.stream_out_closed = True
         def _close_stream(_):
             self.stream_in_closed = True
+            self.reader.feed_eof()
         future = iq.send(timeout=timeout, callback=_close_stream)
         self.xmpp.event('ibb_stream_end', self)
         return future
@@ -112,6 +375,8 @@ class IBBytestream(object):
     def _closed(self, iq):
         self.stream_in_closed = True
         self.stream_out_closed = True
+        self.reader.feed_eof()
+        self._release_acks()
         iq.reply().send()
         self.xmpp.event('ibb_stream_end', self)
 
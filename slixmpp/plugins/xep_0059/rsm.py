@@ -6,6 +6,9 @@
     See the file LICENSE for copying permission.
 """
 
+import asyncio
+import collections
+import copy
 import logging
 
 import slixmpp
@@ -27,7 +30,7 @@ class ResultIterator:
 
     def __init__(self, query, interface, results='substanzas', amount=10,
                        start=None, reverse=False, recv_interface=None,
-                       pre_cb=None, post_cb=None):
+                       pre_cb=None, post_cb=None, prefetch=0, parallel=0):
         """
         Arguments:
            query     -- The template query
@@ -40,6 +43,14 @@ class ResultIterator:
            reverse   -- If True, page backwards through the results
            pre_cb    -- Callback to run before sending the stanza
            post_cb   -- Callback to run after receiving the reply
+           prefetch  -- How many pages to request ahead of the one
+                        being processed
+           parallel  -- If the first reply gives the count and index
+                        of the results, how many of the other pages to
+                        request at once, by index. Pages are still
+                        returned in order. The callbacks then get copies
+                        of the query, and must not rely on the pages
+                        being sent one after the other.
 
         Example:
            q = Iq()
@@ -61,7 +72,11 @@ class ResultIterator:
         self.post_cb = post_cb
         self.results = results
         self.reverse = reverse
+        self.prefetch = prefetch
+        self.parallel = parallel
         self._stop = False
+        self._pages = None
+        self._filler = None
 
     def __aiter__(self):
         return self
@@ -77,6 +92,84 @@ class ResultIterator:
               results will be the items before the current page
               of items.
         """
+        if not self.prefetch and self.parallel < 2:
+            return await self._next_page()
+        if self._filler is None:
+            self._pages = asyncio.Queue(max(1, self.prefetch))
+            self._filler = asyncio.ensure_future(self._fill())
+        page = await self._pages.get()
+        if isinstance(page, Exception):
+            # Keep ending the iteration for the next calls.
+            self._pages.put_nowait(page)
+            raise page
+        return page
+
+    def cancel(self):
+        """Stop requesting pages ahead, when the iteration is
+        abandoned before its end."""
+        self._stop = True
+        if self._filler is not None:
+            self._filler.cancel()
+
+    async def _fill(self):
+        """Queue the pages ahead of the consumer."""
+        try:
+            while True:
+                page = await self._next_page()
+                await self._pages.put(page)
+                rsm = page[self.recv_interface]['rsm']
+                if self.parallel > 1 and rsm['count'] and rsm['first_index']:
+                    ranges = self._ranges(
+                            int(rsm['first_index']),
+                            len(page[self.recv_interface][self.results]),
+                            int(rsm['count']))
+                    await self._fill_ranges(ranges)
+                    raise StopAsyncIteration
+        except XMPPError:
+            await self._pages.put(StopAsyncIteration())
+        except Exception as e:
+            await self._pages.put(e)
+
+    async def _fill_ranges(self, ranges):
+        fetches = collections.deque()
+        for index, amount in ranges:
+            fetches.append(asyncio.ensure_future(
+                self._fetch_range(index, amount)))
+            if len(fetches) >= self.parallel:
+                await self._pages.put(await fetches.popleft())
+        while fetches:
+            await self._pages.put(await fetches.popleft())
+
+    def _ranges(self, first, num_items, count):
+        """Return the (index, amount) of the pages not fetched yet."""
+        if self.reverse:
+            end = first
+            while end > 0:
+                start = max(0, end - self.amount)
+                yield start, end - start
+                end = start
+        else:
+            start = first + num_items
+            while start < count:
+                yield start, min(self.amount, count - start)
+                start += self.amount
+
+    async def _fetch_range(self, index, amount):
+        query = copy.copy(self.query)
+        query['id'] = query.stream.new_id()
+        rsm = query[self.interface]['rsm']
+        del rsm['after']
+        del rsm['before']
+        rsm['index'] = str(index)
+        rsm['max'] = str(amount)
+        if self.pre_cb:
+            self.pre_cb(query)
+        r = await query.send()
+        if self.post_cb:
+            self.post_cb(r)
+        return r
+
+    async def _next_page(self):
         if self._stop:
             raise StopAsyncIteration
         self.query[self.interface]['rsm']['before'] = self.reverse
@@ -142,7 +235,8 @@ class XEP_0059(BasePlugin):
         self.xmpp['xep_0030'].add_feature(Set.namespace)
 
     def iterate(self, stanza, interface, results='substanzas',reverse=False,
-                recv_interface=None, pre_cb=None, post_cb=None):
+                recv_interface=None, pre_cb=None, post_cb=None,
+                prefetch=0, parallel=0):
         """
         Create a new result set iterator for a given stanza query.
 
@@ -168,7 +262,12 @@ class XEP_0059(BasePlugin):
                          gather results.
             results   -- The name of the interface containing the
                          query results (typically just 'substanzas').
+            prefetch  -- How many pages to request ahead of the one
+                         being processed.
+            parallel  -- How many pages to request at once by index,
+                         when the server gives the count of results.
         """
         return ResultIterator(stanza, interface, results, reverse=reverse,
                               recv_interface=recv_interface, pre_cb=pre_cb,
-                              post_cb=post_cb)
+                              post_cb=post_cb, prefetch=prefetch,
+                              parallel=parallel)
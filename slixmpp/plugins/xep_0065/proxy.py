@@ -1,6 +1,7 @@
 import asyncio
 import logging
 import socket
+import time
 
 from hashlib import sha1
 from uuid import uuid4
@@ -24,7 +25,13 @@ class XEP_0065(BasePlugin):
     description = "XEP-0065: SOCKS5 Bytestreams"
     dependencies = {'xep_0030'}
     default_config = {
-        'auto_accept': False
+        'auto_accept': False,
+        #: Seconds allowed to each streamhost to complete the SOCKS5
+        #: handshake.
+        'connect_timeout': 10,
+        #: Seconds to wait for a streamhost before also trying the next
+        #: one.
+        'race_delay': 0.25,
     }
 
     def plugin_init(self):
@@ -33,6 +40,10 @@ class XEP_0065(BasePlugin):
         self._proxies = {}
         self._sessions = {}
         self._preauthed_sids = {}
+        #: Smoothed handshake time of each streamhost JID, in seconds.
+        self.latency = {}
+        #: Smoothed handshake time of each (JID, host, port) address.
+        self.address_latency = {}
 
         self.xmpp.register_handler(
             Callback('Socks5 Bytestreams',
@@ -72,14 +83,13 @@ class XEP_0065(BasePlugin):
             log.warning('Received unknown SOCKS5 proxy: %s', proxy)
             return
 
+        host, port = self._proxies[proxy]
         try:
-            self._sessions[sid] = (await self._connect_proxy(
+            self._sessions[sid] = await self._connect_streamhost(
                     self._get_dest_sha1(sid, self.xmpp.boundjid, to),
-                    self._proxies[proxy][0],
-                    self._proxies[proxy][1]))[1]
-        except socket.error:
+                    proxy, host, port)
+        except (socket.error, asyncio.TimeoutError):
             return None
-        addr, port = await self._sessions[sid].connected
 
         # Request that the proxy activate the session with the target.
         await self.activate(proxy, sid, to, timeout=timeout)
@@ -100,7 +110,8 @@ class XEP_0065(BasePlugin):
         iq['from'] = ifrom
         iq['type'] = 'set'
         iq['socks']['sid'] = sid
-        for proxy, (host, port) in self._proxies.items():
+        for proxy in self._by_latency(self._proxies):
+            host, port = self._proxies[proxy]
             iq['socks'].add_streamhost(proxy, host, port)
         return iq.send(timeout=timeout, callback=callback)
 
@@ -173,46 +184,115 @@ class XEP_0065(BasePlugin):
 
         dest = self._get_dest_sha1(sid, requester, target)
 
-        proxy_futures = []
-        for streamhost in streamhosts:
-            proxy_futures.append(self._connect_proxy(
-                    dest,
-                    streamhost['host'],
-                    streamhost['port']))
-
-        async def gather(futures, iq, streamhosts):
-            proxies = await asyncio.gather(*futures, return_exceptions=True)
-            for streamhost, proxy in zip(streamhosts, proxies):
-                if isinstance(proxy, ValueError):
-                    continue
-                elif isinstance(proxy, socket.error):
-                    log.error('Socket error while connecting to the proxy.')
-                    continue
-                proxy = proxy[1]
-                # TODO: what if the future never happens?
-                try:
-                    addr, port = await proxy.connected
-                except socket.error:
-                    log.exception('Socket error while connecting to the proxy.')
-                    continue
-                # TODO: make a better choice than just the first working one.
-                used_streamhost = streamhost['jid']
-                conn = proxy
-                break
-            else:
-                raise XMPPError(etype='cancel', condition='item-not-found')
-
-            # TODO: close properly the connection to the other proxies.
+        async def race():
+            try:
+                streamhost, conn = await self._race_streamhosts(
+                        dest, streamhosts)
+            except XMPPError as e:
+                iq.exception(e)
+                return
 
-            iq = iq.reply()
+            reply = iq.reply()
             self._sessions[sid] = conn
-            iq['socks']['sid'] = sid
-            iq['socks']['streamhost_used']['jid'] = used_streamhost
-            iq.send()
+            reply['socks']['sid'] = sid
+            reply['socks']['streamhost_used']['jid'] = streamhost['jid']
+            reply.send()
             self.xmpp.event('socks5_stream', conn)
             self.xmpp.event('stream:%s:%s' % (sid, requester), conn)
 
-        asyncio.ensure_future(gather(proxy_futures, iq, streamhosts))
+        asyncio.ensure_future(race())
+
+    async def _race_streamhosts(self, dest, streamhosts):
+        """Connect to the first streamhost to complete the SOCKS5
+        handshake.
+
+        Streamhosts are tried in the order offered, from the fastest
+        address seen so far, each one
+        starting when the previous has failed or has not answered within
+        ``race_delay`` seconds.  The connections which lose the race are
+        cancelled and closed.
+
+        Returns the (streamhost, :class:`Socks5Protocol`) pair which won.
+        """
+        latency = self.address_latency
+        def address(streamhost):
+            return (streamhost['jid'], streamhost['host'], streamhost['port'])
+        # A JID may be offered with several addresses, all of them are
+        # tried.
+        candidates = sorted(streamhosts,
+                            key=lambda streamhost: (
+                                address(streamhost) not in latency,
+                                latency.get(address(streamhost), 0)))
+        attempts = {}
+        winner = None
+        try:
+            while winner is None and (candidates or attempts):
+                if candidates:
+                    streamhost = candidates.pop(0)
+                    attempt = asyncio.ensure_future(self._connect_streamhost(
+                            dest, streamhost['jid'],
+                            streamhost['host'], streamhost['port']))
+                    attempts[attempt] = streamhost
+                done, _ = await asyncio.wait(
+                        attempts,
+                        timeout=self.race_delay if candidates else None,
+                        return_when=asyncio.FIRST_COMPLETED)
+                for attempt in done:
+                    streamhost = attempts.pop(attempt)
+                    if attempt.exception() is not None:
+                        log.debug('Failed to connect to streamhost %s: %r',
+                                  streamhost['jid'], attempt.exception())
+                    elif winner is None:
+                        winner = (streamhost, attempt.result())
+                    else:
+                        attempt.result().close()
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+            if attempts:
+                await asyncio.wait(attempts)
+        if winner is None:
+            raise XMPPError(etype='cancel', condition='item-not-found')
+        return winner
+
+    async def _connect_streamhost(self, dest, jid, host, port):
+        """Connect to a streamhost, and record the time its handshake
+        took, or ``connect_timeout`` if it failed, for the address and
+        for the JID."""
+        start = time.monotonic()
+        transport = None
+
+        async def connect():
+            nonlocal transport
+            transport, conn = await self._connect_proxy(dest, host, port)
+            await conn.connected
+            return conn
+
+        try:
+            conn = await asyncio.wait_for(connect(), self.connect_timeout)
+        except BaseException as e:
+            if transport is not None:
+                transport.close()
+            if not isinstance(e, asyncio.CancelledError):
+                self._record_latency(jid, host, port, self.connect_timeout)
+            raise
+        self._record_latency(jid, host, port, time.monotonic() - start)
+        return conn
+
+    def _record_latency(self, jid, host, port, latency):
+        for latencies, key in ((self.latency, jid),
+                               (self.address_latency, (jid, host, port))):
+            previous = latencies.get(key)
+            if previous is None:
+                latencies[key] = latency
+            else:
+                latencies[key] = previous + (latency - previous) / 4
+
+    def _by_latency(self, jids):
+        """Sort JIDs from the fastest streamhost, those never tried
+        coming last in their original order."""
+        return sorted(jids, key=lambda jid: (jid not in self.latency,
+                                             self.latency.get(jid, 0)))
 
     def activate(self, proxy, sid, target, ifrom=None, timeout=None, callback=None):
         """Activate the socks5 session that has been negotiated."""
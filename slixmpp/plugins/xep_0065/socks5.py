@@ -5,6 +5,7 @@ import enum
 import logging
 import socket
 import struct
+import time
 
 from slixmpp.stringprep import punycode, StringprepError
 
@@ -79,8 +80,49 @@ class AddressType(enum.IntEnum):
     ipv6 = 4
 
 
+class Socks5StreamProtocol(asyncio.StreamReaderProtocol):
+    '''Protocol of a SOCKS5 session once it is used as a pair of streams.'''
+
+    def __init__(self, socks5, reader, loop):
+        super().__init__(reader, loop=loop)
+        self.socks5 = socks5
+
+    def data_received(self, data):
+        self.socks5.bytes_received += len(data)
+        super().data_received(data)
+
+    def connection_lost(self, exc):
+        super().connection_lost(exc)
+        self.socks5.connection_lost(exc)
+
+
+class Socks5StreamWriter(asyncio.StreamWriter):
+    '''StreamWriter counting the bytes sent over a SOCKS5 session.'''
+
+    def __init__(self, socks5, transport, protocol, reader, loop):
+        super().__init__(transport, protocol, reader, loop)
+        self.socks5 = socks5
+
+    def write(self, data):
+        self.socks5.bytes_sent += len(data)
+        super().write(data)
+
+    def writelines(self, data):
+        data = list(data)
+        self.socks5.bytes_sent += sum(map(len, data))
+        super().writelines(data)
+
+    async def sendfile(self, file, offset=0, count=None):
+        '''Send a file, see :meth:`Socks5Protocol.sendfile`.'''
+        await self.drain()
+        return await self.socks5.sendfile(file, offset, count)
+
+
 class Socks5Protocol(asyncio.Protocol):
-    '''This implements SOCKS5 as an asyncio protocol.'''
+    '''This implements SOCKS5 as an asyncio protocol.
+
+    Once connected, the data received is sent as ``socks5_data`` events,
+    unless :meth:`get_streams` has been called.'''
 
     def __init__(self, dest_addr, dest_port, event):
         self.methods = {Method.none}
@@ -91,6 +133,11 @@ class Socks5Protocol(asyncio.Protocol):
         self.event = event
         self.paused = asyncio.Future()
         self.paused.set_result(None)
+        self.streams = None
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.start_time = None
+        self.end_time = None
 
     def register_method(self, method):
         '''Register a SOCKS5 method.'''
@@ -115,6 +162,7 @@ class Socks5Protocol(asyncio.Protocol):
 
         # If we are already connected, this is a data packet.
         if self.connected.done():
+            self.bytes_received += len(data)
             return self.event('socks5_data', data)
 
         # Every SOCKS5 message starts with the protocol version.
@@ -129,6 +177,8 @@ class Socks5Protocol(asyncio.Protocol):
 
     def connection_lost(self, exc):
         log.debug('SOCKS5 connection closed.')
+        if self.start_time is not None:
+            self.end_time = time.monotonic()
         self.event('socks5_closed', exc)
 
     def pause_writing(self):
@@ -139,8 +189,87 @@ class Socks5Protocol(asyncio.Protocol):
 
     async def write(self, data):
         await self.paused
+        self.bytes_sent += len(data)
         self.transport.write(data)
 
+    async def sendfile(self, file, offset=0, count=None):
+        '''Send ``count`` bytes of a file opened in binary mode, or all
+        of it, starting at ``offset``.
+
+        This uses :meth:`asyncio.loop.sendfile`, which lets the kernel
+        copy the file to the socket when the transport allows it, and
+        falls back to reading and writing it otherwise, as on Python
+        versions before 3.7.
+
+        Returns the number of bytes sent.'''
+        await self.paused
+        loop = asyncio.get_event_loop()
+        if not hasattr(loop, 'sendfile'):
+            return await self._sendfile_fallback(file, offset, count)
+        sent = await loop.sendfile(self.transport, file, offset, count)
+        self.bytes_sent += sent
+        return sent
+
+    async def _sendfile_fallback(self, file, offset, count):
+        loop = asyncio.get_event_loop()
+        file.seek(offset)
+        sent = 0
+        while count is None or sent < count:
+            size = 2**16 if count is None else min(2**16, count - sent)
+            data = await loop.run_in_executor(None, file.read, size)
+            if not data:
+                break
+            if self.streams is not None:
+                # The writer's protocol now gets the flow control.
+                writer = self.streams[1]
+                writer.write(data)
+                await writer.drain()
+            else:
+                await self.write(data)
+            sent += len(data)
+        return sent
+
+    def get_streams(self, limit=2**16):
+        '''Return an (:class:`asyncio.StreamReader`,
+        :class:`asyncio.StreamWriter`) pair for this session.
+
+        The data received from then on goes to the reader instead of
+        ``socks5_data`` events, and reading stops while the reader holds
+        more than twice ``limit`` bytes.'''
+        if self.streams is None:
+            if not self.connected.done():
+                raise ProtocolError('SOCKS5 session not connected yet.')
+            loop = asyncio.get_event_loop()
+            reader = asyncio.StreamReader(limit=limit, loop=loop)
+            protocol = Socks5StreamProtocol(self, reader, loop)
+            self.transport.set_protocol(protocol)
+            protocol.connection_made(self.transport)
+            writer = Socks5StreamWriter(self, self.transport, protocol,
+                                        reader, loop)
+            self.streams = (reader, writer)
+        return self.streams
+
+    def close(self):
+        '''Close the session.'''
+        self.transport.close()
+
+    def stats(self):
+        '''Return the byte counters and throughput of this session.
+
+        Rates are in bytes per second, since the session was connected
+        and until it was closed.'''
+        duration = 0.0
+        if self.start_time is not None:
+            end = self.end_time or time.monotonic()
+            duration = end - self.start_time
+        return {
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'duration': duration,
+            'send_rate': self.bytes_sent / duration if duration else 0.0,
+            'recv_rate': self.bytes_received / duration if duration else 0.0,
+        }
+
     def _send_methods(self):
         '''Send the methods request, first thing a client should do.'''
 
@@ -207,7 +336,9 @@ class Socks5Protocol(asyncio.Protocol):
             addr, port = self._parse_result(data)
         except ReplyError as exception:
             self.connected.set_exception(exception)
+            return
         self.connected.set_result((addr, port))
+        self.start_time = time.monotonic()
         self.event('socks5_connected', (addr, port))
 
     def _parse_result(self, data):
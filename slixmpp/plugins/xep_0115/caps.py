@@ -6,19 +6,21 @@
     See the file LICENSE for copying permission.
 """
 
+import os
 import logging
 import hashlib
 import base64
 
 from slixmpp import __version__
 from slixmpp.stanza import StreamFeatures, Presence, Iq
-from slixmpp.xmlstream import register_stanza_plugin, JID
+from slixmpp.xmlstream import register_stanza_plugin, JID, ET
 from slixmpp.xmlstream.handler import Callback
 from slixmpp.xmlstream.matcher import StanzaPath
-from slixmpp.util import MemoryCache
+from slixmpp.util import MemoryCache, FileSystemCache
 from slixmpp import asyncio
 from slixmpp.exceptions import XMPPError, IqError, IqTimeout
 from slixmpp.plugins import BasePlugin
+from slixmpp.plugins.xep_0030 import DiscoInfo
 from slixmpp.plugins.xep_0115 import stanza, StaticCaps
 
 
@@ -29,6 +31,13 @@ class XEP_0115(BasePlugin):
 
     """
     XEP-0115: Entity Capabilities
+
+    Configuration values:
+        cache      -- The cache of disco#info results, indexed by
+                      verification string. Defaults to a MemoryCache.
+        cache_dir  -- An optional directory where validated caps are
+                      saved, and from which they are loaded into the
+                      cache at startup.
     """
 
     name = 'xep_0115'
@@ -40,6 +49,7 @@ class XEP_0115(BasePlugin):
         'caps_node': None,
         'broadcast': True,
         'cache': None,
+        'cache_dir': None,
     }
 
     def plugin_init(self):
@@ -53,6 +63,20 @@ class XEP_0115(BasePlugin):
         if self.cache is None:
             self.cache = MemoryCache()
 
+        self.store = None
+        if self.cache_dir is not None:
+            self.store = FileSystemCache(self.cache_dir, 'caps',
+                                         encode=str,
+                                         decode=self._decode_caps)
+
+        # Verification strings being queried, mapped to futures set
+        # to whether the query was successful.
+        self._queries = {}
+
+        # Our own verification strings, by sender of the presence,
+        # until a verification string is assigned.
+        self._stamps = {}
+
         register_stanza_plugin(Presence, stanza.Capabilities)
         register_stanza_plugin(StreamFeatures, stanza.Capabilities)
 
@@ -94,6 +118,36 @@ class XEP_0115(BasePlugin):
         disco.assign_verstring = self.assign_verstring
         disco.get_verstring = self.get_verstring
 
+        if self.store is not None:
+            self._load_store()
+
+    def _decode_caps(self, data):
+        return DiscoInfo(ET.fromstring(data))
+
+    def _load_store(self):
+        """Load all the caps saved in cache_dir into the cache."""
+        try:
+            names = os.listdir(self.store.base_dir)
+        except OSError:
+            return
+        loaded = 0
+        for name in names:
+            # See FileSystemStorage, base64 has no underscore.
+            ver = name.replace('_', '/')
+            info = self.store.retrieve(ver)
+            if info is None:
+                continue
+            for hash in ('sha-1', 'md5'):
+                if self.generate_verstring(info, hash) == ver:
+                    self.cache.store(ver, info)
+                    loaded += 1
+                    break
+            else:
+                log.debug("Removing invalid saved caps: %s", ver)
+                self.store.remove(ver)
+        log.debug("Loaded %s saved caps from %s.", loaded,
+                  self.store.base_dir)
+
     def plugin_end(self):
         self.xmpp['xep_0030'].del_feature(feature=stanza.Capabilities.namespace)
         self.xmpp.del_filter('out', self._filter_add_caps)
@@ -114,7 +168,11 @@ class XEP_0115(BasePlugin):
         if stanza['type'] not in ('available', 'chat', 'away', 'dnd', 'xa'):
             return stanza
 
-        ver = self.get_verstring(stanza['from'])
+        sender = stanza['from'].full
+        if sender in self._stamps:
+            ver = self._stamps[sender]
+        else:
+            ver = self._stamps[sender] = self.get_verstring(sender)
         if ver:
             stanza['caps']['node'] = self.caps_node
             stanza['caps']['hash'] = self.hash
@@ -165,7 +223,15 @@ class XEP_0115(BasePlugin):
             except XMPPError:
                 return
 
+        # Only query one of the entities advertising a verification
+        # string at a time; ask another one if that query failed.
+        while ver in self._queries:
+            if await asyncio.shield(self._queries[ver]):
+                self.assign_verstring(pres['from'], ver)
+                return
+
         log.debug("New caps verification string: %s", ver)
+        query = self._queries[ver] = asyncio.Future()
         try:
             node = '%s#%s' % (pres['caps']['node'], ver)
             caps = await self.xmpp['xep_0030'].get_info(pres['from'], node,
@@ -177,8 +243,13 @@ class XEP_0115(BasePlugin):
             if self._validate_caps(caps, pres['caps']['hash'],
                                          pres['caps']['ver']):
                 self.assign_verstring(pres['from'], pres['caps']['ver'])
+                query.set_result(True)
         except XMPPError:
             log.debug("Could not retrieve disco#info results for caps for %s", node)
+        finally:
+            del self._queries[ver]
+            if not query.done():
+                query.set_result(False)
 
     def _validate_caps(self, caps, hash, check_verstring):
         # Check Identities
@@ -318,6 +389,12 @@ class XEP_0115(BasePlugin):
             jid = self.xmpp.boundjid.full
         if isinstance(jid, JID):
             jid = jid.full
+        if jid in self._stamps or jid == self.xmpp.boundjid.full:
+            # Only our own verification strings are stamped, the ones
+            # of contacts are assigned for each of their presences.
+            self._stamps.pop(jid, None)
+            if jid == self.xmpp.boundjid.full:
+                self._stamps.pop('', None)
         return self.api['assign_verstring'](jid, args={
             'verstring': verstring})
 
@@ -128,6 +128,8 @@ class StaticCaps(object):
         if not verstring or not info:
             return
         self.caps.cache.store(verstring, info)
+        if self.caps.store is not None:
+            self.caps.store.store(verstring, info)
 
     def assign_verstring(self, jid, node, ifrom, data):
         if isinstance(jid, JID):
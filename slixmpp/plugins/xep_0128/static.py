@@ -57,6 +57,7 @@ class StaticExtendedDisco(object):
         info = self.static.get_node(jid, node)['info']
         for form in forms:
             info.append(form)
+        self.static.invalidate()
 
     def del_extended_info(self, jid, node, ifrom, data):
         """
@@ -68,3 +69,4 @@ class StaticExtendedDisco(object):
             info = self.static.get_node(jid, node)['info']
             for form in info['substanza']:
                 info.xml.remove(form.xml)
+            self.static.invalidate()
@@ -6,12 +6,13 @@
     See the file LICENSE for copying permission.
 """
 
+import time
 import asyncio
 import logging
 import collections
 
 from slixmpp.stanza import Message, Presence, Iq, StreamFeatures
-from slixmpp.xmlstream import register_stanza_plugin
+from slixmpp.xmlstream import register_stanza_plugin, ET, PRIORITY_HIGH
 from slixmpp.xmlstream.handler import Callback, Waiter
 from slixmpp.xmlstream.matcher import MatchXPath, MatchMany
 from slixmpp.plugins.base import BasePlugin
@@ -24,10 +25,37 @@ log = logging.getLogger(__name__)
 MAX_SEQ = 2 ** 32
 
 
+#: An outgoing stanza waiting for an ack: its sequence number, the name,
+#: ``id`` and ``to`` of the stanza, its serialized bytes, and the
+#: :func:`time.monotonic` time it was sent at.
+Unacked = collections.namedtuple('Unacked', ['seq', 'name', 'id', 'to',
+                                             'data', 'time'])
+
+
 class XEP_0198(BasePlugin):
 
     """
     XEP-0198: Stream Management
+
+    Unacked stanzas are kept as the bytes written on the stream, in
+    :class:`Unacked` tuples. The :term:`stanza_acked` event still
+    receives stanza objects, parsed back from these bytes only when the
+    event is handled.
+
+    An ack is requested once ``window`` stanzas or ``window_bytes`` bytes
+    have been sent since the last request, or when a stanza has been
+    waiting for ``max_ack_delay`` seconds, but only one request is
+    outstanding at a time, unless ``max_ack_delay`` is ``0``. Requests
+    are sent along with the next write on the stream.
+
+    To resume the stream after a crash of the process, a ``state_cache``
+    can be given, for example::
+
+        xmpp.register_plugin('xep_0198', {
+            'state_cache': FileSystemCache(directory, 'sm',
+                                           encode=json.dumps,
+                                           decode=json.loads)
+        })
     """
 
     name = 'xep_0198'
@@ -43,6 +71,15 @@ class XEP_0198(BasePlugin):
         #: every sent stanza. Defaults to ``5``.
         'window': 5,
 
+        #: The number of bytes of stanzas to wait between sending ack
+        #: requests to the server. ``0`` disables it.
+        'window_bytes': 0,
+
+        #: The number of seconds after which an ack is requested for
+        #: unacked stanzas, however few, or requested again when the
+        #: server did not answer. ``0`` disables it.
+        'max_ack_delay': 30,
+
         #: The stream management ID for the stream. Knowing this value is
         #: required in order to do stream resumption.
         'sm_id': None,
@@ -57,6 +94,17 @@ class XEP_0198(BasePlugin):
         #: requested when enabling stream management. Defaults to ``True``.
         'allow_resume': True,
 
+        #: The number of bytes of unacked stanzas above which an ack is
+        #: requested without waiting for the window to be full. ``0``
+        #: disables it.
+        'max_unacked_bytes': 1 << 20,
+
+        #: An optional :class:`~slixmpp.util.cache.Cache` where the
+        #: stream management state and the unacked stanzas are saved,
+        #: after each turn of the event loop changing them, and from
+        #: which they are loaded when the plugin starts.
+        'state_cache': None,
+
         'order': 10100,
         'resume_order': 9000
     }
@@ -74,6 +122,27 @@ class XEP_0198(BasePlugin):
         self.enabled = False
         self.unacked_queue = collections.deque()
 
+        #: The number of bytes in :attr:`unacked_queue`.
+        self.unacked_bytes = 0
+
+        #: Counters of the ack ``'requests'`` sent, the ``'acks'``
+        #: received and the number of stanzas ``'acked'``, and the time
+        #: in seconds between sending a stanza and receiving its ack:
+        #: ``'latency_last'``, ``'latency_max'``, and ``'latency_avg'``,
+        #: a moving average.
+        self.ack_stats = {'requests': 0, 'acks': 0, 'acked': 0,
+                          'latency_last': 0.0, 'latency_max': 0.0,
+                          'latency_avg': 0.0}
+
+        self._outgoing = None
+        self._ack_requested = False
+        self._bytes_counter = 0
+        self._ack_timer = None
+        self._save_handle = None
+
+        if self.state_cache is not None:
+            self._load_state()
+
         register_stanza_plugin(StreamFeatures, stanza.StreamManagement)
         self.xmpp.register_stanza(stanza.Enable)
         self.xmpp.register_stanza(stanza.Enabled)
@@ -130,6 +199,7 @@ class XEP_0198(BasePlugin):
 
         self.xmpp.add_filter('in', self._handle_incoming)
         self.xmpp.add_filter('out_sync', self._handle_outgoing)
+        self.xmpp.add_filter('out_raw', self._handle_outgoing_raw)
 
         self.xmpp.add_event_handler('session_end', self.session_end)
 
@@ -142,6 +212,11 @@ class XEP_0198(BasePlugin):
         self.xmpp.del_event_handler('session_end', self.session_end)
         self.xmpp.del_filter('in', self._handle_incoming)
         self.xmpp.del_filter('out_sync', self._handle_outgoing)
+        self.xmpp.del_filter('out_raw', self._handle_outgoing_raw)
+        self._cancel_ack_timer()
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
         self.xmpp.remove_handler('Stream Management Enabled')
         self.xmpp.remove_handler('Stream Management Resumed')
         self.xmpp.remove_handler('Stream Management Failed')
@@ -157,22 +232,97 @@ class XEP_0198(BasePlugin):
     def session_end(self, event):
         """Reset stream management state."""
         self.enabled = False
-        self.unacked_queue.clear()
+        self._clear_queue()
         self.sm_id = None
         self.handled = 0
         self.seq = 0
         self.last_ack = 0
+        self._save_state()
+
+    def _clear_queue(self):
+        self.unacked_queue.clear()
+        self.unacked_bytes = 0
+        self._ack_requested = False
+        self.window_counter = self.window
+        self._bytes_counter = 0
+        self._cancel_ack_timer()
+
+    def _load_state(self):
+        """Restore the state saved in the state cache, if any."""
+        state = self.state_cache.retrieve(self.xmpp.boundjid.bare)
+        if not state or not state.get('sm_id'):
+            return
+        self.sm_id = state['sm_id']
+        self.handled = state['handled']
+        self.seq = state['seq']
+        self.last_ack = state['last_ack']
+        now = time.monotonic()
+        for seq, name, id, to, data in state['unacked']:
+            data = data.encode('utf-8')
+            self.unacked_queue.append(Unacked(seq, name, id, to, data, now))
+            self.unacked_bytes += len(data)
+        log.debug('Loaded stream management state for %s, %s unacked '
+                  'stanzas.', self.sm_id, len(self.unacked_queue))
+
+    def _save_state(self):
+        """Save the state at the end of this turn of the event loop."""
+        if self.state_cache is None or self._save_handle is not None:
+            return
+        self._save_handle = self.xmpp.loop.call_soon(self._write_state)
+
+    def _write_state(self):
+        self._save_handle = None
+        key = self.xmpp.boundjid.bare
+        if not self.sm_id:
+            self.state_cache.remove(key)
+            return
+        self.state_cache.store(key, {
+            'sm_id': self.sm_id,
+            'handled': self.handled,
+            'seq': self.seq,
+            'last_ack': self.last_ack,
+            'unacked': [(entry.seq, entry.name, entry.id, entry.to,
+                         entry.data.decode('utf-8'))
+                        for entry in self.unacked_queue],
+        })
 
     def send_ack(self):
         """Send the current ack count to the server."""
         ack = stanza.Ack(self.xmpp)
         ack['h'] = self.handled
-        self.xmpp.send_raw(str(ack))
+        self.xmpp.send_raw(str(ack), priority=PRIORITY_HIGH)
 
     def request_ack(self, e=None):
         """Request an ack from the server."""
         req = stanza.RequestAck(self.xmpp)
-        self.xmpp.send_raw(str(req))
+        self.xmpp.send_raw(str(req), priority=PRIORITY_HIGH)
+
+    def _schedule_ack_request(self):
+        """Request an ack along with the next write on the stream."""
+        self._ack_requested = True
+        self.window_counter = self.window
+        self._bytes_counter = 0
+        self.ack_stats['requests'] += 1
+        self.xmpp.piggyback(str(stanza.RequestAck(self.xmpp)))
+        self._start_ack_timer()
+
+    def _start_ack_timer(self):
+        self._cancel_ack_timer()
+        if self.max_ack_delay:
+            self._ack_timer = self.xmpp.loop.call_later(self.max_ack_delay,
+                                                        self._ack_timeout)
+
+    def _cancel_ack_timer(self):
+        if self._ack_timer is not None:
+            self._ack_timer.cancel()
+            self._ack_timer = None
+
+    def _ack_timeout(self):
+        self._ack_timer = None
+        if self.enabled and self.unacked_queue and self.xmpp.transport:
+            log.debug('No ack for %s seconds, requesting one.',
+                      self.max_ack_delay)
+            self._schedule_ack_request()
 
     async def _handle_sm_feature(self, features):
         """
@@ -195,7 +345,7 @@ class XEP_0198(BasePlugin):
                 enable.send()
                 self.enabled = True
                 self.handled = 0
-                self.unacked_queue.clear()
+                self._clear_queue()
 
                 waiter = Waiter('enabled_or_failed',
                         MatchMany([
@@ -231,6 +381,7 @@ class XEP_0198(BasePlugin):
         self.xmpp.features.add('stream_management')
         if stanza['id']:
             self.sm_id = stanza['id']
+            self._save_state()
         self.xmpp.event('sm_enabled', stanza)
 
     def _handle_resumed(self, stanza):
@@ -240,8 +391,8 @@ class XEP_0198(BasePlugin):
         """
         self.xmpp.features.add('stream_management')
         self._handle_ack(stanza)
-        for id, stanza in self.unacked_queue:
-            self.xmpp.send(stanza, use_filters=False)
+        for entry in self.unacked_queue:
+            self.xmpp.send_raw(entry.data)
         self.xmpp.event('session_resumed', stanza)
 
     def _handle_failed(self, stanza):
@@ -253,7 +404,7 @@ class XEP_0198(BasePlugin):
         Raises an :term:`sm_failed` event.
         """
         self.enabled = False
-        self.unacked_queue.clear()
+        self._clear_queue()
         self.xmpp.event('sm_failed', stanza)
 
     def _handle_ack(self, ack):
@@ -261,7 +412,12 @@ class XEP_0198(BasePlugin):
 
         Raises a :term:`stanza_acked` event for each acked stanza.
         """
+        self._ack_requested = False
+        self._cancel_ack_timer()
+        self.ack_stats['acks'] += 1
         if ack['h'] == self.last_ack:
+            if self.unacked_queue:
+                self._start_ack_timer()
             return
 
         num_acked = (ack['h'] - self.last_ack) % MAX_SEQ
@@ -278,10 +434,32 @@ class XEP_0198(BasePlugin):
             log.error('Inconsistent sequence numbers from the server,'
                       ' ignoring and replacing ours with them.')
             num_acked = len(self.unacked_queue)
+        stats = self.ack_stats
+        now = time.monotonic()
         for x in range(num_acked):
-            seq, stanza = self.unacked_queue.popleft()
-            self.xmpp.event('stanza_acked', stanza)
+            entry = self.unacked_queue.popleft()
+            self.unacked_bytes -= len(entry.data)
+            latency = now - entry.time
+            stats['latency_last'] = latency
+            stats['latency_max'] = max(stats['latency_max'], latency)
+            if stats['acked']:
+                stats['latency_avg'] += (latency - stats['latency_avg']) / 8
+            else:
+                stats['latency_avg'] = latency
+            stats['acked'] += 1
+            if self.xmpp.event_handled('stanza_acked'):
+                self.xmpp.event('stanza_acked', self._parse_entry(entry))
         self.last_ack = ack['h']
+        if self.unacked_queue:
+            self._start_ack_timer()
+        self._save_state()
+
+    def _parse_entry(self, entry):
+        """Rebuild the stanza object of an :class:`Unacked` entry."""
+        ns = self.xmpp.default_ns.encode('utf-8')
+        root = ET.fromstring(b'<stream xmlns="' + ns + b'">' +
+                             entry.data + b'</stream>')
+        return self.xmpp._build_stanza(root[0])
 
     def _handle_request_ack(self, req):
         """Handle an ack request by sending an ack."""
@@ -295,21 +473,45 @@ class XEP_0198(BasePlugin):
         if isinstance(stanza, (Message, Presence, Iq)):
             # Sequence numbers are mod 2^32
             self.handled = (self.handled + 1) % MAX_SEQ
+            self._save_state()
         return stanza
 
     def _handle_outgoing(self, stanza):
-        """Store outgoing stanzas in a queue to be acked."""
+        """Note the outgoing stanzas to be acked."""
+        # Reset first, in case the previous stanza was dropped by another
+        # filter before reaching _handle_outgoing_raw.
+        self._outgoing = None
         if not self.enabled:
             return stanza
 
         if isinstance(stanza, (Message, Presence, Iq)):
-            seq = None
-            # Sequence numbers are mod 2^32
-            self.seq = (self.seq + 1) % MAX_SEQ
-            seq = self.seq
-            self.unacked_queue.append((seq, stanza))
-            self.window_counter -= 1
-            if self.window_counter == 0:
-                self.window_counter = self.window
-                self.request_ack()
+            self._outgoing = (stanza.name, stanza['id'], stanza['to'].full)
         return stanza
+
+    def _handle_outgoing_raw(self, data):
+        """Count the stanzas written and store their bytes in a queue
+        to be acked."""
+        if self._outgoing is None:
+            return data
+
+        # Sequence numbers are mod 2^32
+        self.seq = (self.seq + 1) % MAX_SEQ
+        self.unacked_queue.append(Unacked(self.seq, *self._outgoing, data,
+                                          time.monotonic()))
+        self._outgoing = None
+        self.unacked_bytes += len(data)
+        self.window_counter -= 1
+        self._bytes_counter += len(data)
+        # Without the timer, a request left unanswered would stop all the
+        # later ones, so they are sent again each window.
+        if not self._ack_requested or not self.max_ack_delay:
+            if self.window_counter <= 0 \
+                    or self.window_bytes \
+                    and self._bytes_counter >= self.window_bytes \
+                    or self.max_unacked_bytes \
+                    and self.unacked_bytes > self.max_unacked_bytes:
+                self._schedule_ack_request()
+            elif self._ack_timer is None:
+                self._start_ack_timer()
+        self._save_state()
+        return data
@@ -9,7 +9,7 @@
 from slixmpp.plugins.base import register_plugin
 
 from slixmpp.plugins.xep_0313.stanza import Result, MAM, Preferences
-from slixmpp.plugins.xep_0313.mam import XEP_0313
+from slixmpp.plugins.xep_0313.mam import XEP_0313, ArchiveIterator
 
 
 register_plugin(XEP_0313)
@@ -6,12 +6,13 @@
     See the file LICENSE for copying permission
 """
 
+import asyncio
 import logging
 
 import slixmpp
 from slixmpp.stanza import Message, Iq
 from slixmpp.exceptions import XMPPError
-from slixmpp.xmlstream.handler import Collector
+from slixmpp.xmlstream.handler import Callback, Collector
 from slixmpp.xmlstream.matcher import StanzaPath
 from slixmpp.xmlstream import register_stanza_plugin
 from slixmpp.plugins import BasePlugin
@@ -21,6 +22,111 @@ from slixmpp.plugins.xep_0313 import stanza
 log = logging.getLogger(__name__)
 
 
+class ArchiveIterator:
+
+    """
+    An asynchronous iterator over archived messages, returned by
+    :meth:`XEP_0313.iterate`.
+
+    Call :meth:`cancel` when leaving the iteration before its end, to
+    stop receiving results and save the checkpoint.
+    """
+
+    def __init__(self, xmpp, jid=None, start=None, end=None, with_jid=None,
+                 ifrom=None, reverse=False, after=None, amount=10,
+                 timeout=None, cache=None, checkpoint=None):
+        self.xmpp = xmpp
+        self.jid = jid
+        self.start = start
+        self.end = end
+        self.with_jid = with_jid
+        self.ifrom = ifrom
+        self.reverse = reverse
+        self.amount = amount
+        self.timeout = timeout
+        self.cache = cache
+        self.checkpoint = checkpoint
+
+        self.query_id = None
+        self._queue = asyncio.Queue()
+        self._last_id = after
+        self._position = after
+        self._next_page = None
+        self._finished = False
+        self._done = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._done:
+            raise StopAsyncIteration
+        if self.query_id is None:
+            self.query_id = self.xmpp.new_id()
+            self.xmpp.register_handler(Callback(
+                'MAM_Stream_%s' % self.query_id,
+                StanzaPath('message/mam_result@queryid=%s' % self.query_id),
+                self._queue.put_nowait))
+            self._request(self._position)
+        queue = self._queue
+        try:
+            if self._next_page is not None and queue.qsize() < self.amount:
+                self._request(self._next_page)
+                self._next_page = None
+            while not (self._finished and queue.empty()):
+                item = await queue.get()
+                if isinstance(item, asyncio.Future):
+                    self._page_done(item)
+                    continue
+                self._last_id = item['mam_result']['id']
+                return item
+        except BaseException:
+            self.cancel()
+            raise
+        self.cancel()
+        raise StopAsyncIteration
+
+    def cancel(self):
+        """Stop the iteration, and save the last archive id yielded."""
+        if self._done:
+            return
+        self._done = True
+        if self.query_id is not None:
+            self.xmpp.remove_handler('MAM_Stream_%s' % self.query_id)
+        self._save()
+
+    def _request(self, position):
+        iq = self.xmpp.Iq()
+        iq['to'] = self.jid
+        iq['from'] = self.ifrom
+        iq['type'] = 'set'
+        iq['mam']['queryid'] = self.query_id
+        iq['mam']['start'] = self.start
+        iq['mam']['end'] = self.end
+        iq['mam']['with'] = self.with_jid
+        iq['mam']['rsm']['max'] = str(self.amount)
+        if self.reverse:
+            iq['mam']['rsm']['before'] = position or True
+        elif position:
+            iq['mam']['rsm']['after'] = position
+        iq.send(timeout=self.timeout).add_done_callback(self._queue.put_nowait)
+
+    def _page_done(self, future):
+        fin = future.result()['mam_fin']
+        position = fin['rsm']['first'] if self.reverse else fin['rsm']['last']
+        if fin['complete'] or not position:
+            self._finished = True
+        elif self._queue.qsize() < self.amount:
+            self._request(position)
+        else:
+            self._next_page = position
+        self._save()
+
+    def _save(self):
+        if self.cache is not None and self._last_id is not None:
+            self.cache.store(self.checkpoint, self._last_id)
+
+
 class XEP_0313(BasePlugin):
 
     """
@@ -31,6 +137,11 @@ class XEP_0313(BasePlugin):
     description = 'XEP-0313: Message Archive Management'
     dependencies = {'xep_0030', 'xep_0050', 'xep_0059', 'xep_0297'}
     stanza = stanza
+    default_config = {
+        #: A :class:`slixmpp.util.Cache` keeping the last archive id
+        #: yielded by :meth:`iterate` for each ``checkpoint`` key.
+        'checkpoint_cache': None,
+    }
 
     def plugin_init(self):
         register_stanza_plugin(Iq, stanza.MAM)
@@ -91,6 +202,40 @@ class XEP_0313(BasePlugin):
 
         return iq.send(timeout=timeout, callback=wrapped_cb)
 
+    def iterate(self, jid=None, start=None, end=None, with_jid=None,
+                ifrom=None, reverse=False, after=None, amount=10,
+                timeout=None, checkpoint=None):
+        """
+        Iterate over the archived messages, as they are received.
+
+        Returns an :class:`ArchiveIterator`, used with ``async for``.
+        The archive is queried one page of ``amount`` messages at a time.
+        The next page is requested as soon as the previous one is
+        complete, unless a whole page is still waiting to be consumed,
+        so at most two pages are buffered.
+
+        Every archive id yielded (``msg['mam_result']['id']``) can be
+        given as ``after`` to resume from the following message. With
+        ``checkpoint`` and the ``checkpoint_cache`` config, the last id
+        is saved under that key after each page and when the iteration
+        stops, and used as ``after`` when it is not given.
+
+        Arguments:
+            reverse -- Page backwards from the end of the archive, or
+                       from before ``after``. Messages are still in
+                       chronological order within each page, so
+                       checkpoints are only meaningful going forward.
+            amount  -- The number of messages per page.
+        """
+        cache = self.checkpoint_cache if checkpoint is not None else None
+        if after is None and cache is not None:
+            after = cache.retrieve(checkpoint)
+        return ArchiveIterator(self.xmpp, jid=jid, start=start, end=end,
+                               with_jid=with_jid, ifrom=ifrom,
+                               reverse=reverse, after=after, amount=amount,
+                               timeout=timeout, cache=cache,
+                               checkpoint=checkpoint)
+
     def get_preferences(self, timeout=None, callback=None):
         iq = self.xmpp.Iq()
         iq['type'] = 'get'
@@ -154,6 +154,20 @@ class Fin(ElementBase):
     name = 'fin'
     namespace = 'urn:xmpp:mam:2'
     plugin_attrib = 'mam_fin'
+    interfaces = {'complete'}
+
+    def get_complete(self):
+        return self.xml.attrib.get('complete', '') in ('true', '1')
+
+    def set_complete(self, value):
+        if value:
+            self.xml.attrib['complete'] = 'true'
+        else:
+            self._del_attr('complete')
+
+    def del_complete(self):
+        self._del_attr('complete')
+
 
 class Result(ElementBase):
     name = 'result'
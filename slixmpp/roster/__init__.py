@@ -9,3 +9,5 @@
 from slixmpp.roster.item import RosterItem
 from slixmpp.roster.single import RosterNode
 from slixmpp.roster.multi import Roster
+from slixmpp.roster.storage import RosterStorage, WriteBehindRoster
+from slixmpp.roster.sqlite import SQLiteRosterStorage
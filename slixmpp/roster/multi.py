@@ -24,7 +24,9 @@ class Roster(object):
     Rosters may be stored and persisted in an external datastore. An
     interface object to the datastore that loads and saves roster items may
     be provided. See the documentation for the RosterItem class for the
-    methods that the datastore interface object must provide.
+    methods that the datastore interface object must provide. An
+    interface object with a flush() coroutine, such as
+    WriteBehindRoster, is flushed when the stream is disconnected.
 
     Attributes:
         xmpp           -- The main Slixmpp instance.
@@ -58,6 +60,11 @@ class Roster(object):
                 self.add(node)
 
         self.xmpp.add_filter('out', self._save_last_status)
+        self.xmpp.add_event_handler('disconnected', self._flush_backend)
+
+    async def _flush_backend(self, event):
+        if self.db and hasattr(self.db, 'flush'):
+            await self.db.flush()
 
     def _save_last_status(self, stanza):
 
@@ -0,0 +1,128 @@
+"""
+    Slixmpp: The Slick XMPP Library
+    This file is part of Slixmpp.
+
+    See the file LICENSE for copying permission.
+"""
+
+import asyncio
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from slixmpp.roster.storage import RosterStorage
+
+
+FIELDS = ('name', 'groups', 'from', 'to', 'pending_in', 'pending_out',
+          'whitelisted')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS roster (
+    owner TEXT NOT NULL,
+    jid TEXT NOT NULL,
+    name TEXT NOT NULL,
+    groups TEXT NOT NULL,
+    "from" INTEGER NOT NULL,
+    "to" INTEGER NOT NULL,
+    pending_in INTEGER NOT NULL,
+    pending_out INTEGER NOT NULL,
+    whitelisted INTEGER NOT NULL,
+    PRIMARY KEY (owner, jid)
+)
+"""
+
+VERSION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS roster_version (
+    owner TEXT PRIMARY KEY,
+    ver TEXT NOT NULL
+)
+"""
+
+
+class SQLiteRosterStorage(RosterStorage):
+
+    """
+    A :class:`RosterStorage` keeping the rosters in an SQLite database.
+
+    The database is only used from a dedicated thread, so that the
+    event loop never waits for the disk.
+    """
+
+    def __init__(self, path):
+        """
+        Arguments:
+            path -- The file of the database, created if needed.
+        """
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._conn = None
+
+    def _run(self, func, *args):
+        loop = asyncio.get_event_loop()
+        return loop.run_in_executor(self._executor, func, *args)
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute(SCHEMA)
+            self._conn.execute(VERSION_SCHEMA)
+            self._conn.commit()
+        return self._conn
+
+    def _load_all(self):
+        rosters = {}
+        cursor = self._connect().execute(
+                'SELECT owner, jid, name, groups, "from", "to", pending_in, '
+                'pending_out, whitelisted FROM roster')
+        for row in cursor:
+            state = dict(zip(FIELDS, row[2:]))
+            state['groups'] = json.loads(state['groups'])
+            for field in FIELDS[2:]:
+                state[field] = bool(state[field])
+            rosters.setdefault(row[0], {})[row[1]] = state
+        return rosters
+
+    def _load_versions(self):
+        cursor = self._connect().execute(
+                'SELECT owner, ver FROM roster_version')
+        return dict(cursor)
+
+    def _save_many(self, changes, versions):
+        conn = self._connect()
+        saved = []
+        removed = []
+        for owner, jid, state in changes:
+            if state is None:
+                removed.append((owner, jid))
+            else:
+                saved.append((owner, jid, state['name'],
+                               json.dumps(state['groups']))
+                             + tuple(bool(state[field])
+                                     for field in FIELDS[2:]))
+        with conn:
+            conn.executemany(
+                    'INSERT OR REPLACE INTO roster VALUES '
+                    '(?, ?, ?, ?, ?, ?, ?, ?, ?)', saved)
+            conn.executemany(
+                    'DELETE FROM roster WHERE owner = ? AND jid = ?', removed)
+            conn.executemany(
+                    'INSERT OR REPLACE INTO roster_version VALUES (?, ?)',
+                    versions.items())
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def load_all(self):
+        return await self._run(self._load_all)
+
+    async def load_versions(self):
+        return await self._run(self._load_versions)
+
+    async def save_many(self, changes, versions):
+        await self._run(self._save_many, changes, versions)
+
+    async def close(self):
+        await self._run(self._close)
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,198 @@
+"""
+    Slixmpp: The Slick XMPP Library
+    This file is part of Slixmpp.
+
+    See the file LICENSE for copying permission.
+"""
+
+import asyncio
+import copy
+import logging
+
+
+log = logging.getLogger(__name__)
+
+
+class RosterStorage(object):
+
+    """
+    Interface of an asynchronous roster datastore, used through a
+    :class:`WriteBehindRoster`.
+
+    Roster item states are the dictionaries described in
+    :class:`slixmpp.roster.item.RosterItem`.
+    """
+
+    async def load_all(self):
+        """
+        Return every stored roster, as a dictionary mapping each owner
+        JID to a dictionary of the item states by JID.
+        """
+        raise NotImplementedError
+
+    async def load_versions(self):
+        """
+        Return the stored roster versions, as a dictionary mapping
+        owner JIDs to version IDs.
+        """
+        return {}
+
+    async def save_many(self, changes, versions):
+        """
+        Store a batch of changes, at once if possible.
+
+        Arguments:
+            changes  -- A list of (owner_jid, jid, item_state) tuples,
+                        an item_state of None removing the item.
+            versions -- A dictionary of the new roster versions by
+                        owner JID. They must not be stored before the
+                        changes, or an interrupted write could leave a
+                        version newer than the items.
+        """
+        raise NotImplementedError
+
+    async def close(self):
+        """Release the resources of the datastore."""
+
+
+class WriteBehindRoster(object):
+
+    """
+    A roster datastore interface, as expected by
+    :class:`slixmpp.roster.multi.Roster`, which keeps every roster in
+    memory and writes the changes to a :class:`RosterStorage` in the
+    background.
+
+    All the rosters are read at once by :meth:`open`, which must be
+    awaited before the interface is given to the roster. Changes to
+    the same item are coalesced, and written in batches at most
+    ``interval`` seconds after the first of them, as soon as
+    ``batch_size`` items have changed, and on :meth:`flush` or
+    :meth:`close`. The roster flushes its datastore on disconnection.
+    Errors of the background writes are logged, and their changes kept
+    for the next write; only :meth:`flush` and :meth:`close` raise them.
+
+    Roster versions are kept along with the items, so that a client
+    roster saved this way only needs the changes from the server when
+    it reconnects (see :meth:`slixmpp.ClientXMPP.set_roster_cache`).
+
+    Example:
+        backend = WriteBehindRoster(SQLiteRosterStorage('roster.db'))
+        await backend.open()
+        xmpp.roster.set_backend(backend)
+    """
+
+    def __init__(self, storage, interval=1.0, batch_size=1000):
+        """
+        Arguments:
+            storage    -- The RosterStorage to write to.
+            interval   -- Seconds a change may wait before being written.
+            batch_size -- Number of changed items triggering a write.
+        """
+        self.storage = storage
+        self.interval = interval
+        self.batch_size = batch_size
+        self._rosters = {}
+        self._dirty = {}
+        self._versions = {}
+        self._dirty_versions = {}
+        self._handle = None
+        self._lock = asyncio.Lock()
+
+    async def open(self):
+        """Load every roster from the datastore."""
+        self._rosters = await self.storage.load_all()
+        self._versions = await self.storage.load_versions()
+
+    def entries(self, owner, db_state=None):
+        """
+        Return the owners of the stored rosters, or the JIDs of the
+        items of ``owner``.
+        """
+        if owner is None:
+            return list(self._rosters)
+        return list(self._rosters.get(owner, ()))
+
+    def load(self, owner, jid, db_state):
+        """Return the stored state of a roster item, if any."""
+        state = self._rosters.get(owner, {}).get(jid)
+        if state is None:
+            return None
+        return copy.deepcopy(state)
+
+    def save(self, owner, jid, item_state, db_state):
+        """Record the state of a roster item, to be written later."""
+        if item_state.get('removed', False):
+            self._rosters.get(owner, {}).pop(jid, None)
+            state = None
+        else:
+            state = copy.deepcopy(item_state)
+            self._rosters.setdefault(owner, {})[jid] = state
+        self._dirty[(owner, jid)] = state
+        self._schedule()
+
+    def version(self, owner):
+        """Return the stored roster version of ``owner``."""
+        return self._versions.get(owner, '')
+
+    def set_version(self, owner, version):
+        """Record the roster version of ``owner``, to be written later."""
+        if self._versions.get(owner, '') == version:
+            return
+        self._versions[owner] = version
+        self._dirty_versions[owner] = version
+        self._schedule()
+
+    def _schedule(self):
+        if len(self._dirty) >= self.batch_size:
+            asyncio.ensure_future(self._flush_in_background())
+        elif self._handle is None:
+            loop = asyncio.get_event_loop()
+            self._handle = loop.call_later(self.interval, self._flush_later)
+
+    def _flush_later(self):
+        self._handle = None
+        asyncio.ensure_future(self._flush_in_background())
+
+    async def _flush_in_background(self):
+        # Failures are logged by flush() and the changes kept for the
+        # next attempt, only explicit calls need to see them.
+        try:
+            await self.flush()
+        except Exception:
+            pass
+
+    @property
+    def pending(self):
+        """The number of changes not written yet."""
+        return len(self._dirty) + len(self._dirty_versions)
+
+    async def flush(self):
+        """Write all the pending changes."""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        # Writes are made one at a time, to keep them in order.
+        async with self._lock:
+            if not self._dirty and not self._dirty_versions:
+                return
+            changes = [(owner, jid, state)
+                       for (owner, jid), state in self._dirty.items()]
+            versions = self._dirty_versions
+            self._dirty = {}
+            self._dirty_versions = {}
+            try:
+                await self.storage.save_many(changes, versions)
+            except BaseException:
+                log.exception('Failed to save %d roster items', len(changes))
+                # Newer changes made in the meantime take precedence.
+                for owner, jid, state in changes:
+                    self._dirty.setdefault((owner, jid), state)
+                for owner, version in versions.items():
+                    self._dirty_versions.setdefault(owner, version)
+                raise
+
+    async def close(self):
+        """Write all the pending changes and close the datastore."""
+        await self.flush()
+        await self.storage.close()
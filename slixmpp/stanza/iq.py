@@ -8,9 +8,7 @@
 
 from slixmpp.stanza.rootstanza import RootStanza
 from slixmpp.xmlstream import StanzaBase, ET
-from slixmpp.xmlstream.handler import Waiter, Callback, CoroutineCallback
 from slixmpp.xmlstream.asyncio import asyncio
-from slixmpp.xmlstream.matcher import MatchIDSender, MatcherId
 from slixmpp.exceptions import IqTimeout, IqError
 
 
@@ -177,13 +175,12 @@ class Iq(RootStanza):
         :rtype: asyncio.Future
         """
         if self.stream.session_bind_event.is_set():
-            matcher = MatchIDSender({
-                'id': self['id'],
-                'self': self.stream.boundjid,
-                'peer': self['to']
-            })
+            selfjid = self.stream.boundjid
+            peerjid = self['to']
+            peers = {'', selfjid.bare, selfjid.host,
+                     peerjid.full, peerjid.bare, peerjid.host}
         else:
-            matcher = MatcherId(self['id'])
+            peers = None
 
         future = asyncio.Future()
 
@@ -192,62 +189,48 @@ class Iq(RootStanza):
             timeout = 120
 
         def callback_success(result):
-            type_ = result['type']
-            if type_ == 'result':
+            if future.done():
+                return
+            if result['type'] == 'result':
                 future.set_result(result)
-            elif type_ == 'error':
-                future.set_exception(IqError(result))
             else:
-                # Most likely an iq addressed to ourself, rearm the callback.
-                handler = constr(handler_name,
-                                 matcher,
-                                 callback_success,
-                                 once=True)
-                self.stream.register_handler(handler)
-                return
+                future.set_exception(IqError(result))
 
-            if timeout is not None:
-                self.stream.cancel_schedule('IqTimeout_%s' % self['id'])
             if callback is not None:
-                callback(result)
+                if asyncio.iscoroutinefunction(callback):
+                    async def callback_routine():
+                        try:
+                            await callback(result)
+                        except Exception as e:
+                            result.exception(e)
+                    asyncio.ensure_future(callback_routine())
+                else:
+                    callback(result)
 
         def callback_timeout():
-            future.set_exception(IqTimeout(self))
-            self.stream.remove_handler('IqCallback_%s' % self['id'])
+            if not future.done():
+                future.set_exception(IqTimeout(self))
             if timeout_callback is not None:
                 timeout_callback(self)
 
         if self['type'] in ('get', 'set'):
-            handler_name = 'IqCallback_%s' % self['id']
-            if asyncio.iscoroutinefunction(callback):
-                constr = CoroutineCallback
-            else:
-                constr = Callback
-            if timeout is not None:
-                self.stream.schedule('IqTimeout_%s' % self['id'],
-                                     timeout,
-                                     callback_timeout,
-                                     repeat=False)
-            handler = constr(handler_name,
-                             matcher,
-                             callback_success,
-                             once=True)
-            self.stream.register_handler(handler)
+            self.stream.add_pending_iq(self['id'],
+                                       callback_success,
+                                       peers=peers,
+                                       timeout=timeout,
+                                       timeout_callback=callback_timeout)
+
+            def forget(future):
+                # Nobody is waiting for the reply anymore.
+                if future.cancelled():
+                    peer = '' if peers is not None else None
+                    self.stream.del_pending_iq(self['id'], peer)
+            future.add_done_callback(forget)
         else:
             future.set_result(None)
         StanzaBase.send(self)
         return future
 
-    def _handle_result(self, iq):
-        # we got the IQ, so don't fire the timeout
-        self.stream.cancel_schedule('IqTimeout_%s' % self['id'])
-        self.callback(iq)
-
-    def _fire_timeout(self):
-        # don't fire the handler for the IQ, if it finally does come in
-        self.stream.remove_handler('IqCallback_%s' % self['id'])
-        self.timeout_callback(self)
-
     def _set_stanza_values(self, values):
         """
         Set multiple stanza interface values using a dictionary.
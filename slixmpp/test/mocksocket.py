@@ -169,6 +169,7 @@ class TestTransport(object):
     def __init__(self, xmpp):
         self.xmpp = xmpp
         self.socket = TestSocket()
+        self.reading = True
     # ------------------------------------------------------------------
     # Testing Interface
 
@@ -237,6 +238,12 @@ class TestTransport(object):
     def get_extra_info(self, *args, **kwargs):
         return self.socket
 
+    def pause_reading(self):
+        self.reading = False
+
+    def resume_reading(self):
+        self.reading = True
+
     def abort(self, *args, **kwargs):
         return
 
@@ -7,7 +7,11 @@
 """
 
 import os
+import hashlib
 import logging
+import time
+
+from collections import OrderedDict
 
 log = logging.getLogger(__name__)
 
@@ -68,6 +72,107 @@ class MemoryPerJidCache(PerJidCache):
             del cache[key]
         return True
 
+class LRUCache(Cache):
+    """
+    A bounded in-memory cache, evicting the least recently used entries
+    and the ones older than their time to live.
+
+    Entries may also be written to a persistent ``backend``, any other
+    :class:`Cache`, which is read when an entry is not in memory. Keys
+    which are not strings are given to the backend as the hex digest of
+    their ``repr()``. With an ``encode`` function, the backend is given
+    strings holding the expiry and the encoded value, as needed by a
+    :class:`FileSystemCache`; otherwise it is given ``(expires, value)``
+    tuples, with ``expires`` a :func:`time.time` timestamp or ``None``.
+
+    :param int size: The number of entries kept in memory.
+    :param float ttl: The default lifetime of entries, in seconds.
+                      ``None`` keeps them until evicted.
+    :param backend: An optional :class:`Cache` to persist entries.
+    :param encode: An optional function turning a value into a string.
+    :param decode: The function turning such a string back into a value.
+    """
+
+    def __init__(self, size=1024, ttl=None, backend=None, *, encode=None,
+                 decode=None):
+        self.size = size
+        self.ttl = ttl
+        self.backend = backend
+        self.encode = encode
+        self.decode = decode
+        self.cache = OrderedDict()
+        #: Counters of the cache accesses: ``'hits'``, ``'misses'``, and
+        #: ``'expired'`` and ``'evicted'`` entries.
+        self.stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evicted': 0}
+
+    def retrieve(self, key):
+        entry = self.cache.get(key)
+        if entry is None and self.backend is not None:
+            entry = self._load(key)
+            if entry is not None:
+                self._insert(key, entry)
+        if entry is None:
+            self.stats['misses'] += 1
+            return None
+        expires, value = entry
+        if expires is not None and expires <= time.time():
+            self.stats['expired'] += 1
+            self.stats['misses'] += 1
+            self.remove(key)
+            return None
+        self.stats['hits'] += 1
+        self.cache.move_to_end(key)
+        return value
+
+    def store(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.ttl
+        entry = (None if ttl is None else time.time() + ttl, value)
+        self._insert(key, entry)
+        if self.backend is not None:
+            self._save(key, entry)
+        return True
+
+    def remove(self, key):
+        self.cache.pop(key, None)
+        if self.backend is not None:
+            self.backend.remove(self._backend_key(key))
+        return True
+
+    def clear(self):
+        """Forget the entries kept in memory."""
+        self.cache.clear()
+
+    def _backend_key(self, key):
+        if isinstance(key, str):
+            return key
+        return hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+
+    def _load(self, key):
+        entry = self.backend.retrieve(self._backend_key(key))
+        if entry is None or self.encode is None:
+            return entry
+        try:
+            expires, value = entry.split('\n', 1)
+            return (float(expires) if expires else None, self.decode(value))
+        except Exception:
+            log.debug('Failed to decode %s from cache:', key, exc_info=True)
+            return None
+
+    def _save(self, key, entry):
+        if self.encode is not None:
+            expires, value = entry
+            entry = '%s\n%s' % ('' if expires is None else repr(expires),
+                                 self.encode(value))
+        self.backend.store(self._backend_key(key), entry)
+
+    def _insert(self, key, entry):
+        self.cache[key] = entry
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.size:
+            self.cache.popitem(last=False)
+            self.stats['evicted'] += 1
+
 class FileSystemStorage:
     def __init__(self, encode, decode, binary):
         self.encode = encode if encode is not None else lambda x: x
@@ -15,10 +15,12 @@
     :license: MIT, see LICENSE for more details
 """
 
+import hashlib
 import hmac
 import random
 
 from base64 import b64encode, b64decode
+from collections import OrderedDict
 
 from slixmpp.util import bytes, hash, XOR, quote, num_to_bytes
 from slixmpp.util.sasl.client import sasl_mech, Mech, \
@@ -26,6 +28,50 @@ from slixmpp.util.sasl.client import sasl_mech, Mech, \
                                        SASLMutualAuthFailed
 
 
+class SCRAMKeyStore(object):
+
+    """
+    Storage for the keys derived from a password by the SCRAM mechanisms.
+
+    Once a login succeeded with a password, :meth:`set` is given the
+    ClientKey and ServerKey computed for it, which are enough to log in
+    again as long as the server keeps the same salt and iteration count
+    (RFC 5802, section 5.1). A client which persists them may then
+    connect without knowing the plaintext password, in which case
+    :meth:`get` is used.
+
+    This base class stores nothing. Meant to be overridden.
+    """
+
+    def get(self, mech, username, salt, iterations):
+        """Return the stored ``(client_key, server_key)`` tuple, or
+        ``None``.
+
+        :param str mech: The name of the mechanism, e.g. ``'SCRAM-SHA-1'``.
+        :param bytes username: The SASLprep'd username.
+        :param bytes salt: The salt given by the server.
+        :param int iterations: The iteration count given by the server.
+        """
+        return None
+
+    def set(self, mech, username, salt, iterations, client_key, server_key):
+        """Store the keys derived for a login.
+
+        :param bytes client_key: The SCRAM ClientKey.
+        :param bytes server_key: The SCRAM ServerKey.
+        """
+        pass
+
+
+#: The keys derived from recently used passwords, mapped by
+#: ``(hash name, HMAC of the password under the salt, salt, iterations)``,
+#: least recently used first. Passwords themselves are never kept.
+_scram_keys = OrderedDict()
+
+#: The number of entries kept in the SCRAM key cache.
+SCRAM_CACHE_SIZE = 1024
+
+
 @sasl_mech(0)
 class ANONYMOUS(Mech):
 
@@ -184,10 +230,14 @@ class SCRAM(Mech):
     name = 'SCRAM'
     use_hashes = True
     channel_binding = True
-    required_credentials = {'username', 'password'}
-    optional_credentials = {'authzid', 'channel_binding'}
+    required_credentials = {'username'}
+    optional_credentials = {'password', 'authzid', 'channel_binding'}
     security = {'encrypted', 'unencrypted_scram'}
 
+    #: The :class:`SCRAMKeyStore` used to save derived keys, and to log
+    #: in when no password is given.
+    key_store = SCRAMKeyStore()
+
     def setup(self, name):
         self.use_channel_binding = False
         if name[-5:] == '-PLUS':
@@ -205,12 +255,19 @@ class SCRAM(Mech):
 
         self.step = 0
         self._mutual_auth = False
+        self._new_keys = None
 
     def HMAC(self, key, msg):
         return hmac.HMAC(key=key, msg=msg, digestmod=self.hash).digest()
 
     def Hi(self, text, salt, iterations):
         text = bytes(text)
+        try:
+            return hashlib.pbkdf2_hmac(self.hash().name, text, salt,
+                                       iterations)
+        except ValueError:
+            # Not an algorithm known to OpenSSL.
+            pass
         ui1 = self.HMAC(text, salt + b'\0\0\0\01')
         ui = ui1
         for i in range(iterations - 1):
@@ -218,6 +275,42 @@ class SCRAM(Mech):
             ui = XOR(ui, ui1)
         return ui
 
+    def derive_keys(self, salt, iterations):
+        """Return the ClientKey and ServerKey for the current credentials.
+
+        The keys only depend on the password, salt and iteration count,
+        so they are cached for later logins and reconnections, which
+        would otherwise spend most of their time in :meth:`Hi`.
+
+        :param bytes salt: The salt given by the server.
+        :param int iterations: The iteration count given by the server.
+        """
+        password = self.credentials['password']
+        if not password:
+            keys = self.key_store.get('SCRAM-%s' % self.hash_name,
+                                      self.credentials['username'],
+                                      salt, iterations)
+            if keys is None:
+                raise SASLCancelled('Missing credential: password')
+            return keys
+
+        cache_key = (self.hash_name, self.HMAC(salt, password), salt,
+                     iterations)
+        keys = _scram_keys.get(cache_key)
+        if keys is not None:
+            _scram_keys.move_to_end(cache_key)
+            return keys
+
+        salted_password = self.Hi(password, salt, iterations)
+        keys = (self.HMAC(salted_password, b'Client Key'),
+                self.HMAC(salted_password, b'Server Key'))
+        _scram_keys[cache_key] = keys
+        if len(_scram_keys) > SCRAM_CACHE_SIZE:
+            _scram_keys.popitem(last=False)
+        # Handed to the key store once the server proved it knows them.
+        self._new_keys = (salt, iterations) + keys
+        return keys
+
     def H(self, text):
         return self.hash(text).digest()
 
@@ -293,17 +386,13 @@ class SCRAM(Mech):
 
         client_final_message_without_proof = channel_binding + b',r=' + nonce
 
-        salted_password = self.Hi(self.credentials['password'],
-                                       salt,
-                                       iteration_count)
-        client_key = self.HMAC(salted_password, b'Client Key')
+        client_key, server_key = self.derive_keys(salt, iteration_count)
         stored_key = self.H(client_key)
         auth_message = self.client_first_message_bare + b',' + \
                        challenge + b',' + \
                        client_final_message_without_proof
         client_signature = self.HMAC(stored_key, auth_message)
         client_proof = XOR(client_key, client_signature)
-        server_key = self.HMAC(salted_password, b'Server Key')
 
         self.server_signature = self.HMAC(server_key, auth_message)
 
@@ -324,6 +413,10 @@ class SCRAM(Mech):
             raise SASLMutualAuthFailed()
 
         self._mutual_auth = True
+        if self._new_keys is not None:
+            self.key_store.set('SCRAM-%s' % self.hash_name,
+                               self.credentials['username'],
+                               *self._new_keys)
 
         return b''
 
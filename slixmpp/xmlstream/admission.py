@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+    slixmpp.xmlstream.admission
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    This module limits the rate of incoming stanzas and the number of
+    coroutine handlers they may start.
+
+    Part of Slixmpp: The Slick XMPP Library
+
+    :copyright: (c) 2011 Nathanael C. Fritz
+    :license: MIT, see LICENSE for more details
+"""
+
+import time
+
+from collections import OrderedDict
+
+
+class Admission(object):
+
+    """
+    Admission control for the stanzas received on a stream.
+
+    Each sender, identified by the bare JID in the ``from`` attribute,
+    gets a token bucket refilled at ``rate`` stanzas per second and holding
+    at most ``burst`` tokens. Stanzas arriving with an empty bucket are
+    dropped before being parsed into stanza objects.
+    Stanzas from the server itself and replies to our own requests are
+    always admitted.
+
+    When ``max_tasks`` coroutine handlers are running, the stream stops
+    reading from its transport; stanzas already received are deferred
+    until fewer than ``resume_tasks`` are left.
+
+    Both limits are disabled by default. A component facing untrusted
+    servers could use, for example::
+
+        xmpp.admission = Admission(rate=20, burst=100, max_tasks=500)
+
+    :param float rate: Stanzas per second allowed for each sender. ``0``
+                       disables rate limiting.
+    :param int burst: The size of each bucket. Defaults to ``rate``.
+    :param int max_senders: The number of buckets to keep, the least
+                            recently active senders being forgotten first.
+    :param int max_tasks: The number of running coroutine handlers
+                          which pauses reading. ``0`` disables it.
+    :param int resume_tasks: The number of running coroutine handlers
+                             below which reading resumes. Defaults to
+                             half of ``max_tasks``.
+    """
+
+    def __init__(self, rate=0, burst=None, max_senders=4096,
+                 max_tasks=0, resume_tasks=None):
+        self.rate = rate
+        self.burst = max(burst or rate, 1)
+        self.max_senders = max_senders
+        self.max_tasks = max_tasks
+        if resume_tasks is None:
+            resume_tasks = max_tasks // 2
+        self.resume_tasks = resume_tasks
+
+        #: The number of coroutine handlers currently running.
+        self.tasks = 0
+
+        #: Counters: ``'dropped'`` is the number of stanzas over the rate
+        #: of their sender, ``'deferred'`` the number of stanzas whose
+        #: processing waited for handlers to finish, and ``'pauses'`` the
+        #: number of times reading was paused.
+        self.stats = {'dropped': 0, 'deferred': 0, 'pauses': 0}
+
+        self._buckets = OrderedDict()
+
+    def admit(self, sender):
+        """Take a token from the bucket of a sender.
+
+        :param str sender: The bare JID of the sender.
+        :returns: ``False`` if the stanza must be dropped.
+        """
+        if not self.rate:
+            return True
+        now = time.monotonic()
+        buckets = self._buckets
+        bucket = buckets.get(sender)
+        if bucket is None:
+            if len(buckets) >= self.max_senders:
+                buckets.popitem(last=False)
+            bucket = buckets[sender] = [self.burst, now]
+        else:
+            buckets.move_to_end(sender)
+            bucket[0] = min(self.burst,
+                            bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] < 1:
+            self.stats['dropped'] += 1
+            return False
+        bucket[0] -= 1
+        return True
+
+    def reset(self):
+        """Forget all the buckets."""
+        self._buckets.clear()
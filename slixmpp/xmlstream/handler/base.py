@@ -54,6 +54,17 @@ class BaseHandler(object):
         """
         return self._matcher.match(xml)
 
+    def index_keys(self):
+        """Return the kinds of stanzas the handler's matcher may accept,
+        or ``None`` if it must be tried against every stanza.
+
+        See :meth:`~slixmpp.xmlstream.matcher.base.MatcherBase.index_keys`.
+        """
+        index_keys = getattr(self._matcher, 'index_keys', None)
+        if index_keys is None:
+            return None
+        return index_keys()
+
     def prerun(self, payload):
         """Prepare the handler for execution while the XML
         stream is being processed.
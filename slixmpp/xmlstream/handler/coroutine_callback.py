@@ -77,7 +77,10 @@ class CoroutineCallback(BaseHandler):
                               :meth:`prerun()`. Defaults to ``False``.
         """
         if not self._instream or instream:
-            asyncio.ensure_future(self._pointer(payload))
+            future = asyncio.ensure_future(self._pointer(payload))
+            stream = self.stream() if self.stream is not None else None
+            if stream is not None:
+                stream.track_task(future)
             if self._once:
                 self._destroy = True
                 del self._pointer
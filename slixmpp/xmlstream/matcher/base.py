@@ -10,6 +10,21 @@
 """
 
 
+def split_tag(tag):
+    """Split an ``'{namespace}name'`` element tag into its namespace
+    and local name. Elements without a namespace get an empty one.
+
+    :param string tag: The element tag, possibly followed by
+                       ``@attribute`` checks or an XPath predicate.
+    """
+    namespace = ''
+    if tag.startswith('{'):
+        namespace, _, tag = tag[1:].partition('}')
+    for sep in ('@', '['):
+        tag = tag.split(sep, 1)[0]
+    return namespace, tag
+
+
 class MatcherBase(object):
 
     """
@@ -29,3 +44,19 @@ class MatcherBase(object):
         Meant to be overridden.
         """
         return False
+
+    def index_keys(self):
+        """Return the kinds of stanzas this matcher may possibly accept,
+        so that the stream only tries it against those.
+
+        The result is a set of ``(name, namespace)`` pairs, where
+        ``name`` is the local name of the stanza's root element and
+        ``namespace`` the namespace of one of its direct children, or
+        ``None`` if any child (or no child at all) is acceptable.
+
+        Return ``None`` if the matcher can not be analysed, in which
+        case it will be tried against every stanza.
+
+        Meant to be overridden.
+        """
+        return None
@@ -38,3 +38,18 @@ class MatchMany(MatcherBase):
             if m.match(xml):
                 return True
         return False
+
+    def index_keys(self):
+        """
+        Return the union of the kinds of stanzas accepted by each of
+        the criteria, or ``None`` if one of them can not be analysed.
+
+        Overrides MatcherBase.index_keys.
+        """
+        keys = set()
+        for m in self._criteria:
+            sub_keys = getattr(m, 'index_keys', lambda: None)()
+            if sub_keys is None:
+                return None
+            keys.update(sub_keys)
+        return keys
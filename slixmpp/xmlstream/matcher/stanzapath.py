@@ -9,8 +9,8 @@
     :license: MIT, see LICENSE for more details
 """
 
-from slixmpp.xmlstream.matcher.base import MatcherBase
-from slixmpp.xmlstream.stanzabase import fix_ns
+from slixmpp.xmlstream.matcher.base import MatcherBase, split_tag
+from slixmpp.xmlstream.stanzabase import compile_stanza_path
 
 
 class StanzaPath(MatcherBase):
@@ -20,13 +20,16 @@ class StanzaPath(MatcherBase):
     which is similar to a normal XPath except that it uses the interfaces and
     plugins of the stanza instead of the actual, underlying XML.
 
+    The stanza path is compiled once, when the matcher is created; see
+    :func:`~slixmpp.xmlstream.stanzabase.compile_stanza_path`.
+
     :param criteria: Object to compare some aspect of a stanza against.
     """
 
     def __init__(self, criteria):
-        self._criteria = fix_ns(criteria, split=True,
-                                          propagate_ns=False,
-                                          default_ns='jabber:client')
+        if isinstance(criteria, list):
+            criteria = tuple(criteria)
+        self._criteria = compile_stanza_path(criteria)
         self._raw_criteria = criteria
 
     def match(self, stanza):
@@ -40,4 +43,17 @@ class StanzaPath(MatcherBase):
         :param stanza: The :class:`~slixmpp.xmlstream.stanzabase.ElementBase`
                        stanza to compare against.
         """
-        return stanza.match(self._criteria) or stanza.match(self._raw_criteria)
+        return stanza._match_steps(self._criteria)
+
+    def index_keys(self):
+        """Return the name of the stanza required by the stanza path.
+
+        The following steps of the path refer to stanza plugins, which
+        may have any namespace, so the children are not restricted.
+
+        Overrides MatcherBase.index_keys.
+        """
+        name = split_tag(self._criteria[0][1])[1]
+        if not name or '*' in name:
+            return None
+        return {(name, None)}
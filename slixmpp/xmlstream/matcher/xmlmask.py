@@ -11,7 +11,7 @@ import logging
 from xml.parsers.expat import ExpatError
 
 from slixmpp.xmlstream.stanzabase import ET
-from slixmpp.xmlstream.matcher.base import MatcherBase
+from slixmpp.xmlstream.matcher.base import MatcherBase, split_tag
 
 
 log = logging.getLogger(__name__)
@@ -61,6 +61,19 @@ class MatchXMLMask(MatcherBase):
             xml = xml.xml
         return self._mask_cmp(xml, self._criteria, True)
 
+    def index_keys(self):
+        """Return the root element name and first child namespace
+        required by the mask.
+
+        Overrides MatcherBase.index_keys.
+        """
+        if not hasattr(self._criteria, 'attrib'):
+            return None
+        name = split_tag(self._criteria.tag)[1]
+        for child in self._criteria:
+            return {(name, split_tag(child.tag)[0])}
+        return {(name, None)}
+
     def _mask_cmp(self, source, mask, use_ns=False, default_ns='__no_ns__'):
         """Compare an XML object against an XML mask.
 
@@ -9,8 +9,35 @@
     :license: MIT, see LICENSE for more details
 """
 
+from functools import lru_cache
+
 from slixmpp.xmlstream.stanzabase import ET, fix_ns
-from slixmpp.xmlstream.matcher.base import MatcherBase
+from slixmpp.xmlstream.matcher.base import MatcherBase, split_tag
+
+
+@lru_cache(maxsize=1024)
+def compile_xpath(criteria):
+    """Split an XPath expression into the tag expected for the root
+    element and the path to look for below it.
+
+    Returns a ``(root_tag, subpath)`` tuple, with ``subpath`` set to
+    ``None`` if only the root element has to be checked. If the first
+    step of the expression is not a plain tag name, ``None`` is
+    returned instead and the expression has to be evaluated as is.
+
+    :param string criteria: The XPath expression, with namespaces.
+    """
+    path = fix_ns(criteria, split=True)
+    if not path:
+        return None
+    root = path[0]
+    if root[0] in '*.' or '*' in root or '[' in root:
+        return None
+    if root.startswith('{}'):
+        root = root[2:]
+    if len(path) == 1:
+        return root, None
+    return root, '/'.join(path[1:])
 
 
 class MatchXPath(MatcherBase):
@@ -34,6 +61,7 @@ class MatchXPath(MatcherBase):
 
     def __init__(self, criteria):
         self._criteria = fix_ns(criteria)
+        self._compiled = compile_xpath(self._criteria)
 
     def match(self, xml):
         """
@@ -53,7 +81,30 @@ class MatchXPath(MatcherBase):
         """
         if hasattr(xml, 'xml'):
             xml = xml.xml
-        x = ET.Element('x')
-        x.append(xml)
+        if self._compiled is None:
+            x = ET.Element('x')
+            x.append(xml)
+            return x.find(self._criteria) is not None
+
+        root, subpath = self._compiled
+        if xml.tag != root:
+            return False
+        return subpath is None or xml.find(subpath) is not None
 
-        return x.find(self._criteria) is not None
+    def index_keys(self):
+        """Return the root element name and first child namespace
+        required by the XPath expression.
+
+        Overrides MatcherBase.index_keys.
+        """
+        path = fix_ns(self._criteria, split=True)
+        if not path:
+            return None
+        name = split_tag(path[0])[1]
+        if not name or name[0] == '.' or '*' in name:
+            return None
+        if len(path) > 1:
+            namespace, child = split_tag(path[1])
+            if child and child[0] != '.' and '*' not in child:
+                return {(name, namespace)}
+        return {(name, None)}
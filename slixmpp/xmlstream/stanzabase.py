@@ -17,6 +17,7 @@ from __future__ import with_statement, unicode_literals
 import copy
 import logging
 import weakref
+from functools import lru_cache
 from xml.etree import cElementTree as ET
 
 from slixmpp.xmlstream import JID
@@ -199,6 +200,34 @@ def fix_ns(xpath, split=False, propagate_ns=True, default_ns=''):
     return '/'.join(fixed)
 
 
+@lru_cache(maxsize=1024)
+def compile_stanza_path(xpath):
+    """Compile a "stanza path" for use with :meth:`ElementBase.match`.
+
+    The result is a tuple with one step per element of the path, each
+    step being a ``(raw, tag, attributes, plugin)`` tuple where ``raw``
+    is the original step, ``tag`` its element name, ``attributes`` the
+    ``(interface, value)`` pairs to check, and ``plugin`` the name of
+    the plugin to descend into.
+
+    Results are cached, so that matching the same expression again does
+    not need to split any string.
+
+    :param xpath: The stanza path, either as a string or as a tuple
+                  of element names with attribute checks.
+    """
+    if isinstance(xpath, str):
+        xpath = fix_ns(xpath, split=True, propagate_ns=False)
+    steps = []
+    for raw in xpath:
+        components = raw.split('@')
+        tag = components[0]
+        attributes = tuple(tuple(attribute.split('=', 1))
+                           for attribute in components[1:])
+        steps.append((raw, tag, attributes, tag.split('}')[-1]))
+    return tuple(steps)
+
+
 class ElementBase(object):
 
     """
@@ -383,6 +412,12 @@ class ElementBase(object):
     #: The default XML namespace: ``http://www.w3.org/XML/1998/namespace``.
     xml_ns = XML_NS
 
+    # Most stanzas never use some of their containers, which are only
+    # created on first access through the properties below.
+    __slots__ = ('xml', 'tag', 'parent', '_index', '_plugins',
+                 '_loaded_plugins', '_iterables', '_lazy_children',
+                 '__weakref__')
+
     def __init__(self, xml=None, parent=None):
         self._index = 0
 
@@ -390,14 +425,14 @@ class ElementBase(object):
         #: :class:`xml.etree.cElementTree` object.
         self.xml = xml
 
-        #: An ordered dictionary of plugin stanzas, mapped by their
-        #: :attr:`plugin_attrib` value.
-        self.plugins = OrderedDict()
-        self.loaded_plugins = set()
+        self._plugins = None
+        self._loaded_plugins = None
+        self._iterables = None
 
-        #: A list of child stanzas whose class is included in
-        #: :attr:`plugin_iterables`.
-        self.iterables = []
+        # ``True`` while the plugins for the children of the given XML
+        # have not been created, or the set of the tags of the children
+        # which were loaded on their own by :meth:`_load_plugin`.
+        self._lazy_children = None
 
         #: The name of the tag for the stanza's root element. It is the
         #: same as calling :meth:`tag_name()` and is formatted as
@@ -417,13 +452,96 @@ class ElementBase(object):
             # If we generated our own XML, then everything is ready.
             return
 
-        # Initialize values using provided XML
+        # Plugins for the children of the provided XML are created on
+        # first access, as many received stanzas are only routed or
+        # dropped.
+        if xml is not None and self.plugin_tag_map:
+            self._lazy_children = True
+            return
+
+        # Initialize values using the XML generated by the setup method.
+        self._load_children()
+
+    def _load_children(self):
+        """Create the plugins for the children of the stanza's XML which
+        have not been loaded yet, in document order."""
+        loaded, self._lazy_children = self._lazy_children, None
+        plugin_tag_map = self.plugin_tag_map
+        for child in self.xml:
+            plugin_class = plugin_tag_map.get(child.tag)
+            if plugin_class is not None and \
+                    (loaded is None or loaded is True or
+                     plugin_class.plugin_attrib not in loaded):
+                self._init_plugin(plugin_class.plugin_attrib,
+                                  existing_xml=child,
+                                  reuse=False)
+
+    def _load_plugin(self, name):
+        """Create the plugin ``name`` for the children of the stanza's
+        XML, without loading the other ones.
+
+        Iterable plugins need all the children to be loaded, to keep the
+        order of :attr:`iterables`.
+        """
+        loaded = self._lazy_children
+        if loaded is not True and name in loaded:
+            return
+        plugin_tag_map = self.plugin_tag_map
+        children = []
         for child in self.xml:
-            if child.tag in self.plugin_tag_map:
-                plugin_class = self.plugin_tag_map[child.tag]
-                self.init_plugin(plugin_class.plugin_attrib,
-                                 existing_xml=child,
-                                 reuse=False)
+            plugin_class = plugin_tag_map.get(child.tag)
+            if plugin_class is not None and plugin_class.plugin_attrib == name:
+                if plugin_class in self.plugin_iterables:
+                    self._load_children()
+                    return
+                children.append(child)
+        if loaded is True:
+            loaded = self._lazy_children = set()
+        loaded.add(name)
+        for child in children:
+            self._init_plugin(name, existing_xml=child, reuse=False)
+
+    @property
+    def plugins(self):
+        """A dictionary of plugin stanzas, in the order they were loaded,
+        mapped by their ``(plugin_attrib, lang)`` key."""
+        if self._lazy_children is not None:
+            self._load_children()
+        if self._plugins is None:
+            self._plugins = OrderedDict()
+        return self._plugins
+
+    @plugins.setter
+    def plugins(self, value):
+        self._plugins = value
+
+    @property
+    def loaded_plugins(self):
+        """The set of the :attr:`plugin_attrib` values of the loaded
+        plugins."""
+        if self._lazy_children is not None:
+            self._load_children()
+        if self._loaded_plugins is None:
+            self._loaded_plugins = set()
+        return self._loaded_plugins
+
+    @loaded_plugins.setter
+    def loaded_plugins(self, value):
+        self._loaded_plugins = value
+
+    @property
+    def iterables(self):
+        """A list of child stanzas whose class is included in
+        :attr:`plugin_iterables`."""
+        if self._lazy_children is not None:
+            self._load_children()
+        if self._iterables is None:
+            self._iterables = []
+        return self._iterables
+
+    @iterables.setter
+    def iterables(self, value):
+        self._iterables = value
 
     def setup(self, xml=None):
         """Initialize the stanza's XML contents.
@@ -474,16 +592,20 @@ class ElementBase(object):
         if name not in self.plugin_attrib_map:
             return None
 
+        if self._lazy_children is not None:
+            self._load_plugin(name)
+
         plugin_class = self.plugin_attrib_map[name]
+        plugins = self._plugins or {}
 
         if plugin_class.is_extension:
-            if (name, None) in self.plugins:
-                return self.plugins[(name, None)]
+            if (name, None) in plugins:
+                return plugins[(name, None)]
             else:
                 return None if check else self.init_plugin(name, lang)
         else:
-            if (name, lang) in self.plugins:
-                return self.plugins[(name, lang)]
+            if (name, lang) in plugins:
+                return plugins[(name, lang)]
             else:
                 return None if check else self.init_plugin(name, lang)
 
@@ -493,32 +615,44 @@ class ElementBase(object):
         :param string attrib: The :attr:`plugin_attrib` value of the
                               plugin to enable.
         """
+        if self._lazy_children is not None:
+            self._load_children()
+        return self._init_plugin(attrib, lang, existing_xml, reuse)
+
+    def _init_plugin(self, attrib, lang=None, existing_xml=None, reuse=True):
         default_lang = self.get_lang()
         if not lang:
             lang = default_lang
 
         plugin_class = self.plugin_attrib_map[attrib]
 
-        if plugin_class.is_extension and (attrib, None) in self.plugins:
-            return self.plugins[(attrib, None)]
-        if reuse and (attrib, lang) in self.plugins:
-            return self.plugins[(attrib, lang)]
+        plugins = self._plugins
+        if plugins is None:
+            plugins = self._plugins = OrderedDict()
+        if plugin_class.is_extension and (attrib, None) in plugins:
+            return plugins[(attrib, None)]
+        if reuse and (attrib, lang) in plugins:
+            return plugins[(attrib, lang)]
 
         plugin = plugin_class(parent=self, xml=existing_xml)
 
         if plugin.is_extension:
-            self.plugins[(attrib, None)] = plugin
+            plugins[(attrib, None)] = plugin
         else:
             if lang != default_lang:
                 plugin['lang'] = lang
-            self.plugins[(attrib, lang)] = plugin
+            plugins[(attrib, lang)] = plugin
 
         if plugin_class in self.plugin_iterables:
-            self.iterables.append(plugin)
+            if self._iterables is None:
+                self._iterables = []
+            self._iterables.append(plugin)
             if plugin_class.plugin_multi_attrib:
-                self.init_plugin(plugin_class.plugin_multi_attrib)
+                self._init_plugin(plugin_class.plugin_multi_attrib)
 
-        self.loaded_plugins.add(attrib)
+        if self._loaded_plugins is None:
+            self._loaded_plugins = set()
+        self._loaded_plugins.add(attrib)
 
         return plugin
 
@@ -1073,50 +1207,72 @@ class ElementBase(object):
                              may be either a string or a list of element
                              names with attribute checks.
         """
-        if not isinstance(xpath, list):
-            xpath = self._fix_ns(xpath, split=True, propagate_ns=False)
+        if isinstance(xpath, list):
+            xpath = tuple(xpath)
+        return self._match_steps(compile_stanza_path(xpath))
 
-        # Extract the tag name and attribute checks for the first XPath node.
-        components = xpath[0].split('@')
-        tag = components[0]
-        attributes = components[1:]
+    def _match_steps(self, steps):
+        """Compare a stanza object with a compiled stanza path.
 
+        :param tuple steps: The result of :func:`compile_stanza_path`.
+        """
+        # Check the tag name of the first node.
+        tag = steps[0][1]
         if tag not in (self.name, "{%s}%s" % (self.namespace, self.name)) and \
-            tag not in self.loaded_plugins and tag not in self.plugin_attrib:
-            # The requested tag is not in this stanza, so no match.
-            return False
+            tag not in self.plugin_attrib:
+            if self._lazy_children is not None and \
+                    tag in self.plugin_attrib_map:
+                self._load_plugin(tag)
+            if tag not in (self._loaded_plugins or ()):
+                # The requested tag is not in this stanza, so no match.
+                return False
 
-        # Check the rest of the XPath against any substanzas.
+        # Check the rest of the path against any substanzas.
+        rest = steps[1:]
         matched_substanzas = False
-        for substanza in self.iterables:
-            if xpath[1:] == []:
-                break
-            matched_substanzas = substanza.match(xpath[1:])
-            if matched_substanzas:
-                break
+        if rest:
+            if self._lazy_children is not None:
+                # Only the substanzas which may match the next step
+                # need to be loaded.
+                next_tag = rest[0][1]
+                for plugin_class in self.plugin_iterables:
+                    if next_tag in (plugin_class.name,
+                                    plugin_class.tag_name(),
+                                    plugin_class.plugin_attrib) or \
+                            next_tag in plugin_class.plugin_attrib_map:
+                        self._load_plugin(plugin_class.plugin_attrib)
+                        if self._lazy_children is None:
+                            break
+            for substanza in self._iterables or ():
+                matched_substanzas = substanza._match_steps(rest)
+                if matched_substanzas:
+                    break
 
         # Check attribute values.
-        for attribute in attributes:
-            name, value = attribute.split('=')
+        for name, value in steps[0][2]:
             if self[name] != value:
                 return False
 
-        # Check sub interfaces.
-        if len(xpath) > 1:
-            next_tag = xpath[1]
+        if rest:
+            # Check sub interfaces.
+            next_tag = rest[0][0]
             if next_tag in self.sub_interfaces and self[next_tag]:
                 return True
 
-        # Attempt to continue matching the XPath using the stanza's plugins.
-        if not matched_substanzas and len(xpath) > 1:
-            # Convert {namespace}tag@attribs to just tag
-            next_tag = xpath[1].split('@')[0].split('}')[-1]
-            langs = [name[1] for name in self.plugins if name[0] == next_tag]
-            for lang in langs:
-                plugin = self._get_plugin(next_tag, lang)
-                if plugin and plugin.match(xpath[1:]):
-                    return True
-            return False
+            # Attempt to continue matching the path using the stanza's
+            # plugins.
+            if not matched_substanzas:
+                next_tag = rest[0][3]
+                if self._lazy_children is not None and \
+                        next_tag in self.plugin_attrib_map:
+                    self._load_plugin(next_tag)
+                langs = [name[1] for name in self._plugins or ()
+                         if name[0] == next_tag]
+                for lang in langs:
+                    plugin = self._get_plugin(next_tag, lang)
+                    if plugin and plugin._match_steps(rest):
+                        return True
+                return False
 
         # Everything matched.
         return True
@@ -1168,6 +1324,8 @@ class ElementBase(object):
                 return self.appendxml(item)
             else:
                 raise TypeError
+        if self._lazy_children is not None:
+            self._load_children()
         self.xml.append(item.xml)
         self.iterables.append(item)
         if item.__class__ in self.plugin_iterables:
@@ -1187,6 +1345,8 @@ class ElementBase(object):
 
         :param XML xml: The XML object to add to the stanza.
         """
+        if self._lazy_children is not None:
+            self._load_children()
         self.xml.append(xml)
         return self
 
@@ -1214,8 +1374,10 @@ class ElementBase(object):
         for child in list(self.xml):
             self.xml.remove(child)
 
-        for plugin in list(self.plugins.keys()):
-            del self.plugins[plugin]
+        # The removed children do not need plugins anymore.
+        self._lazy_children = None
+        if self._plugins:
+            self._plugins.clear()
         return self
 
     @classmethod
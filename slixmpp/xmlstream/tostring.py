@@ -15,6 +15,12 @@
 
 XML_NS = 'http://www.w3.org/XML/1998/namespace'
 
+ESCAPES = {'&': '&amp;',
+           '<': '&lt;',
+           '>': '&gt;',
+           "'": '&apos;',
+           '"': '&quot;'}
+
 
 def tostring(xml=None, xmlns='', stream=None, outbuffer='',
              top_level=False, open_only=False, namespaces=None):
@@ -139,18 +145,22 @@ def escape(text, use_cdata=False):
     :param string text: The XML text to convert.
     :rtype: Unicode string
     """
-    escapes = {'&': '&amp;',
-               '<': '&lt;',
-               '>': '&gt;',
-               "'": '&apos;',
-               '"': '&quot;'}
-
     if not use_cdata:
-        return ''.join(escapes.get(c, c) for c in text)
+        if '&' in text:
+            text = text.replace('&', '&amp;')
+        if '<' in text:
+            text = text.replace('<', '&lt;')
+        if '>' in text:
+            text = text.replace('>', '&gt;')
+        if "'" in text:
+            text = text.replace("'", '&apos;')
+        if '"' in text:
+            text = text.replace('"', '&quot;')
+        return text
     else:
         escape_needed = False
         for c in text:
-            if c in escapes:
+            if c in ESCAPES:
                 escape_needed = True
                 break
         if escape_needed:
@@ -159,6 +169,162 @@ def escape(text, use_cdata=False):
         return text
 
 
+class Serializer(object):
+
+    """Serialize XML objects for a given stream, directly to UTF-8 bytes.
+
+    The output is the same as the one of :func:`tostring`, but the
+    opening and closing tags of elements, and the escaped form of
+    attributes, are cached between calls instead of being computed for
+    every element of every stanza. The caches are cleared whenever the
+    namespaces or the escaping settings of the stream change.
+
+    :param stream: The XML stream the serialized objects are sent on.
+
+    :type stream: :class:`~slixmpp.xmlstream.xmlstream.XMLStream`
+    """
+
+    #: The maximum number of entries kept in each cache; a full cache
+    #: is emptied before adding a new entry.
+    cache_size = 4096
+
+    def __init__(self, stream=None):
+        self.stream = stream
+        self._buffer = bytearray()
+        self._state = None
+        self._tags = {}
+        self._attributes = {}
+
+    def _check_state(self):
+        stream = self.stream
+        if stream is None:
+            state = ('', '', False, {})
+        else:
+            state = (stream.default_ns, stream.stream_ns, stream.use_cdata,
+                     stream.namespace_map)
+        if state != self._state:
+            self._state = (state[0], state[1], state[2], dict(state[3]))
+            self._tags.clear()
+            self._attributes.clear()
+
+    def serialize(self, xml, xmlns='', top_level=False, open_only=False):
+        """Serialize an XML object to UTF-8 encoded bytes.
+
+        :param XML xml: The XML object to serialize.
+        :param string xmlns: Optional namespace of an element wrapping the
+                             XML object.
+        :param bool top_level: Indicates that the element is the outermost
+                               element.
+        :param bool open_only: Only serialize the opening tag.
+
+        :rtype: bytes
+        """
+        self._check_state()
+        buffer = self._buffer
+        try:
+            self._write(buffer, xml, xmlns, top_level, open_only, None)
+            return bytes(buffer)
+        finally:
+            del buffer[:]
+
+    def _get_tag(self, tag, xmlns, top_level):
+        key = (tag, xmlns, top_level)
+        cached = self._tags.get(key)
+        if cached is not None:
+            return cached
+
+        default_ns, stream_ns, _, namespace_map = self._state
+        if '}' in tag:
+            tag_xmlns, tag_name = tag.split('}', 1)
+            tag_xmlns = tag_xmlns[1:]
+        else:
+            tag_xmlns, tag_name = '', tag
+        namespace = ''
+        if tag_xmlns:
+            if top_level and tag_xmlns not in (default_ns, xmlns, stream_ns) \
+              or not top_level and tag_xmlns != xmlns:
+                namespace = ' xmlns="%s"' % tag_xmlns
+        if self.stream is not None and namespace_map.get(tag_xmlns):
+            tag_name = "%s:%s" % (namespace_map[tag_xmlns], tag_name)
+        cached = (tag_xmlns,
+                  ('<%s%s' % (tag_name, namespace)).encode('utf-8'),
+                  ('</%s>' % tag_name).encode('utf-8'))
+        if len(self._tags) >= self.cache_size:
+            self._tags.clear()
+        self._tags[key] = cached
+        return cached
+
+    def _get_attribute(self, attrib, value):
+        key = (attrib, value)
+        cached = self._attributes.get(key)
+        if cached is not None:
+            return cached
+
+        value = escape(value, self._state[2])
+        if '}' not in attrib:
+            cached = ' %s="%s"' % (attrib, value)
+        else:
+            attrib_ns, attrib = attrib[1:].split('}', 1)
+            if attrib_ns != XML_NS:
+                # Attributes in namespaces declared on the fly can not
+                # be cached.
+                return None
+            cached = ' xml:%s="%s"' % (attrib, value)
+        cached = cached.encode('utf-8')
+        if len(self._attributes) >= self.cache_size:
+            self._attributes.clear()
+        self._attributes[key] = cached
+        return cached
+
+    def _write(self, buffer, xml, xmlns, top_level, open_only, namespaces):
+        use_cdata = self._state[2]
+        tag_xmlns, open_tag, close_tag = self._get_tag(xml.tag, xmlns,
+                                                       top_level)
+        buffer += open_tag
+
+        new_namespaces = None
+        for attrib, value in xml.attrib.items():
+            cached = self._get_attribute(attrib, value)
+            if cached is not None:
+                buffer += cached
+                continue
+            attrib_ns, attrib = attrib[1:].split('}', 1)
+            mapped_ns = self._state[3].get(attrib_ns) \
+                    if self.stream is not None else None
+            if mapped_ns:
+                if namespaces is None:
+                    namespaces = set()
+                if attrib_ns not in namespaces:
+                    namespaces.add(attrib_ns)
+                    if new_namespaces is None:
+                        new_namespaces = set()
+                    new_namespaces.add(attrib_ns)
+                    buffer += (' xmlns:%s="%s"' % (
+                        mapped_ns, attrib_ns)).encode('utf-8')
+                buffer += (' %s:%s="%s"' % (
+                    mapped_ns, attrib,
+                    escape(value, use_cdata))).encode('utf-8')
+
+        if open_only:
+            buffer += b'>'
+            return
+
+        if len(xml) or xml.text:
+            buffer += b'>'
+            if xml.text:
+                buffer += escape(xml.text, use_cdata).encode('utf-8')
+            for child in xml:
+                self._write(buffer, child, tag_xmlns, False, False,
+                            namespaces)
+            buffer += close_tag
+        else:
+            buffer += b' />'
+        if xml.tail:
+            buffer += escape(xml.tail, use_cdata).encode('utf-8')
+        if new_namespaces:
+            namespaces.difference_update(new_namespaces)
+
+
 def _get_highlight():
     try:
         from pygments import highlight
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+    slixmpp.xmlstream.trace
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    This module keeps a bounded record of the raw data exchanged
+    on a stream, to be dumped after an error.
+
+    Part of Slixmpp: The Slick XMPP Library
+
+    :copyright: (c) 2011 Nathanael C. Fritz
+    :license: MIT, see LICENSE for more details
+"""
+
+import logging
+import random
+import time
+
+from collections import deque
+
+
+log = logging.getLogger(__name__)
+
+
+class WireTrace(object):
+
+    """
+    A ring buffer of the last raw frames sent and received on a stream.
+
+    Recording is disabled unless a ``size`` is given, and frames are kept
+    as the bytes or strings given to the transport, so tracing never
+    serializes anything. Callers must check :attr:`enabled` before
+    calling :meth:`record`.
+
+    :param int size: The number of frames to keep. ``0`` disables
+                     tracing.
+    :param float sample_rate: The fraction of frames to record, between
+                              ``0`` and ``1``.
+    """
+
+    def __init__(self, size=0, sample_rate=1.0):
+        #: Whether frames are being recorded.
+        self.enabled = size > 0 and sample_rate > 0
+        self.sample_rate = sample_rate
+        #: A :class:`~collections.deque` of ``(timestamp, direction, data)``
+        #: tuples, oldest first.
+        self.frames = deque(maxlen=size or None)
+
+    def record(self, direction, data):
+        """Record a frame.
+
+        :param str direction: Either ``'SEND'`` or ``'RECV'``.
+        :param data: The raw bytes or string.
+        """
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        self.frames.append((time.time(), direction, data))
+
+    def clear(self):
+        """Forget all the recorded frames."""
+        self.frames.clear()
+
+    def dump(self, logger=None, level=logging.ERROR):
+        """Log all the recorded frames, oldest first.
+
+        :param logger: The :class:`logging.Logger` to use. Defaults to the
+                       logger of this module.
+        :param int level: The logging level to use.
+        """
+        if logger is None:
+            logger = log
+        if not logger.isEnabledFor(level):
+            return
+        for timestamp, direction, data in list(self.frames):
+            if isinstance(data, bytes):
+                data = data.decode('utf-8', 'replace')
+            logger.log(level, '%s %s: %s',
+                       time.strftime('%H:%M:%S', time.localtime(timestamp)),
+                       direction, data)
@@ -14,6 +14,7 @@
 
 from typing import Optional
 
+import collections
 import functools
 import logging
 import socket as Socket
@@ -23,14 +24,25 @@ import uuid
 
 import xml.etree.ElementTree as ET
 
+from slixmpp.jid import JID, InvalidJID
 from slixmpp.xmlstream.asyncio import asyncio
 from slixmpp.xmlstream import tostring
+from slixmpp.xmlstream.tostring import Serializer
+from slixmpp.xmlstream.trace import WireTrace
+from slixmpp.xmlstream.admission import Admission
 from slixmpp.xmlstream.stanzabase import StanzaBase, ElementBase
 from slixmpp.xmlstream.resolver import resolve, default_resolver
 
 #: The time in seconds to wait before timing out waiting for response stanzas.
 RESPONSE_TIMEOUT = 30
 
+#: Priority in the outgoing queue of data others are waiting on, such as
+#: replies to requests or stream management acks.
+PRIORITY_HIGH = 0
+
+#: Default priority in the outgoing queue.
+PRIORITY_NORMAL = 1
+
 log = logging.getLogger(__name__)
 
 class NotConnectedError(Exception):
@@ -39,6 +51,23 @@ class NotConnectedError(Exception):
     connected.
     """
 
+class PendingIq(object):
+
+    """
+    A request waiting for its response, as stored by
+    :meth:`XMLStream.add_pending_iq()`.
+    """
+
+    __slots__ = ('keys', 'callback', 'handle')
+
+    def __init__(self, keys, callback):
+        #: The ``(id, sender)`` pairs this request is indexed under.
+        self.keys = keys
+        self.callback = callback
+        #: The :class:`asyncio.TimerHandle` of the timeout, if any.
+        self.handle = None
+
+
 class XMLStream(asyncio.BaseProtocol):
     """
     An XML stream connection manager and event dispatcher.
@@ -196,10 +225,77 @@ class XMLStream(asyncio.BaseProtocol):
         #: A mapping of XML namespaces to well-known prefixes.
         self.namespace_map = {StanzaBase.xml_ns: 'xml'}
 
+        #: The :class:`~slixmpp.xmlstream.tostring.Serializer` used to
+        #: convert outgoing stanzas to bytes.
+        self.serializer = Serializer(self)
+
+        #: A :class:`~slixmpp.xmlstream.trace.WireTrace` of the last raw
+        #: frames sent and received, dumped on parse errors. Disabled
+        #: by default; enable it with, for example::
+        #:
+        #:     xmpp.wire_trace = WireTrace(size=200)
+        self.wire_trace = WireTrace()
+
+        #: If set to ``True``, the data given to :meth:`send_raw` is
+        #: buffered and written to the transport in a single call, at the
+        #: end of the current event loop iteration (or after
+        #: :attr:`coalesce_max_delay`), to save on system calls and TLS
+        #: records when sending bursts of stanzas. Stanzas still go through
+        #: the ``out_sync`` filters when :meth:`send` is called, in the
+        #: order they are written, so stream management counters match
+        #: what ends up on the wire.
+        self.coalesce_writes = False
+
+        #: The number of seconds data may wait in the write buffer.
+        #: ``0`` flushes it as soon as the event loop is idle.
+        self.coalesce_max_delay = 0
+
+        #: The number of buffered bytes triggering an immediate flush.
+        self.coalesce_max_bytes = 65536
+
+        #: Counters of the data written to the transport: ``'records'``
+        #: is the number of :meth:`send_raw` calls, ``'writes'`` the
+        #: number of transport writes, and ``'bytes'`` the amount of data.
+        self.write_stats = {'records': 0, 'writes': 0, 'bytes': 0}
+
+        self._write_buffer = []
+        self._write_buffer_size = 0
+        self._flush_handle = None
+        self._piggyback = []
+        self._piggyback_handle = None
+
+        #: The number of queued records above which
+        #: :meth:`send_when_ready` waits, while the transport asked us to
+        #: stop writing (see :meth:`pause_writing`).
+        self.send_queue_high_water = 1000
+
+        #: Counters of the outgoing queue: ``'pauses'`` is the number of
+        #: times the transport paused writing, ``'queued'`` the number of
+        #: records which had to wait, and ``'max_depth'`` the largest
+        #: number of records waiting at once.
+        self.send_queue_stats = {'pauses': 0, 'queued': 0, 'max_depth': 0}
+
+        self._writing_paused = False
+        self._send_queue = {}
+        self._send_queue_depth = 0
+        self._send_waiters = []
+
+        #: The :class:`~slixmpp.xmlstream.admission.Admission` policy
+        #: applied to incoming stanzas. Nothing is limited by default.
+        self.admission = Admission()
+
+        self._reading_paused = False
+        self._deferred_stanzas = collections.deque()
+
         self.__root_stanza = []
         self.__handlers = []
+        self.__handler_order = {}
+        self.__handler_index = {}
+        self.__handler_fallback = []
+        self.__handler_counter = 0
+        self.__pending_iqs = {}
         self.__event_handlers = {}
-        self.__filters = {'in': [], 'out': [], 'out_sync': []}
+        self.__filters = {'in': [], 'out': [], 'out_sync': [], 'out_raw': []}
 
         # Current connection attempt (Future)
         self._current_connection_attempt = None
@@ -379,6 +475,8 @@ class XMLStream(asyncio.BaseProtocol):
             log.warning('Received data before the connection is established: %r',
                         data)
             return
+        if self.wire_trace.enabled:
+            self.wire_trace.record('RECV', data)
         self.parser.feed(data)
         try:
             for event, xml in self.parser.read_events():
@@ -386,11 +484,12 @@ class XMLStream(asyncio.BaseProtocol):
                     if self.xml_depth == 0:
                         # We have received the start of the root element.
                         self.xml_root = xml
-                        log.debug('RECV: %s', tostring(self.xml_root,
-                                                       xmlns=self.default_ns,
-                                                       stream=self,
-                                                       top_level=True,
-                                                       open_only=True))
+                        if log.isEnabledFor(logging.DEBUG):
+                            log.debug('RECV: %s', tostring(self.xml_root,
+                                                           xmlns=self.default_ns,
+                                                           stream=self,
+                                                           top_level=True,
+                                                           open_only=True))
                         self.start_stream_handler(self.xml_root)
                     self.xml_depth += 1
                 if event == 'end':
@@ -405,13 +504,18 @@ class XMLStream(asyncio.BaseProtocol):
                     elif self.xml_depth == 1:
                         # A stanza is an XML element that is a direct child of
                         # the root element, hence the check of depth == 1
-                        self._spawn_event(xml)
+                        if self._reading_paused:
+                            self._deferred_stanzas.append(xml)
+                            self.admission.stats['deferred'] += 1
+                        else:
+                            self._spawn_event(xml)
                         if self.xml_root is not None:
                             # Keep the root element empty of children to
                             # save on memory use.
                             self.xml_root.clear()
         except ET.ParseError:
             log.error('Parse error: %r', data)
+            self.wire_trace.dump(log)
 
             # Due to cyclic dependencies, this can’t be imported at the module
             # level.
@@ -425,6 +529,86 @@ class XMLStream(asyncio.BaseProtocol):
     def is_connected(self):
         return self.transport is not None
 
+    def pause_writing(self):
+        """Called by the transport when its buffer goes over the high-water
+        mark.
+
+        Until :meth:`resume_writing` is called, stanzas and raw data are kept
+        in a queue, ordered by priority (see :meth:`get_send_priority`),
+        instead of piling up in the transport buffer.
+        """
+        log.debug('Transport buffer full, pausing writes')
+        self._writing_paused = True
+        self.send_queue_stats['pauses'] += 1
+
+    def resume_writing(self):
+        """Called by the transport when its buffer drained below the
+        low-water mark.
+
+        Writes the queued records, most urgent first, until the queue is
+        empty or the transport is paused again.
+        """
+        log.debug('Transport buffer drained, resuming writes')
+        self._writing_paused = False
+        while self._send_queue_depth and not self._writing_paused:
+            data, use_filters = self._pop_send_queue()
+            if isinstance(data, ElementBase):
+                self._send_stanza(data, use_filters)
+            else:
+                self.send_raw(data)
+        if not self._writing_paused:
+            self._send_piggyback()
+        self._wake_send_waiters()
+
+    @property
+    def send_queue_depth(self):
+        """The number of stanzas and raw records waiting to be written."""
+        return self._send_queue_depth
+
+    def get_send_priority(self, data):
+        """Return the priority of a stanza in the outgoing queue, used
+        while the transport is paused. Lower values are written first.
+
+        Meant to be overridden.
+
+        :param data: The :class:`~slixmpp.xmlstream.stanzabase.ElementBase`
+                     stanza about to be queued.
+        """
+        return PRIORITY_NORMAL
+
+    def _queue_send(self, data, use_filters, priority):
+        queue = self._send_queue.get(priority)
+        if queue is None:
+            queue = self._send_queue[priority] = collections.deque()
+        queue.append((data, use_filters))
+        self._send_queue_depth += 1
+        stats = self.send_queue_stats
+        stats['queued'] += 1
+        if self._send_queue_depth > stats['max_depth']:
+            stats['max_depth'] = self._send_queue_depth
+
+    def _pop_send_queue(self):
+        priority = min(p for p, queue in self._send_queue.items() if queue)
+        self._send_queue_depth -= 1
+        return self._send_queue[priority].popleft()
+
+    def _wake_send_waiters(self):
+        if self._send_queue_depth >= self.send_queue_high_water:
+            return
+        waiters, self._send_waiters = self._send_waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _clear_send_queue(self):
+        if self._send_queue_depth:
+            log.warning('Connection lost with %d records left unsent',
+                        self._send_queue_depth)
+        self._writing_paused = False
+        self._send_queue = {}
+        self._send_queue_depth = 0
+        self._wake_send_waiters()
+
     def eof_received(self):
         """When the TCP connection is properly closed by the remote end
         """
@@ -440,6 +624,10 @@ class XMLStream(asyncio.BaseProtocol):
             self.event('session_end')
         # All these objects are associated with one TCP connection.  Since
         # we are not connected anymore, destroy them
+        self._clear_write_buffer()
+        self._clear_send_queue()
+        self._deferred_stanzas.clear()
+        self._reading_paused = False
         self.parser = None
         self.transport = None
         self.socket = None
@@ -489,6 +677,7 @@ class XMLStream(asyncio.BaseProtocol):
         """
         self.cancel_connection_attempt()
         if self.transport:
+            self.flush()
             self.transport.close()
             self.transport.abort()
             self.event("killed")
@@ -554,6 +743,7 @@ class XMLStream(asyncio.BaseProtocol):
         to be restarted.
         """
         self.event_when_connected = "tls_success"
+        self.flush()
         ssl_context = self.get_ssl_context()
         try:
             if hasattr(self.loop, 'start_tls'):
@@ -656,7 +846,12 @@ class XMLStream(asyncio.BaseProtocol):
         ``None``, then the stanza will be dropped from being
         processed for events or from being sent.
 
-        :param mode: One of ``'in'`` or ``'out'``.
+        The ``'out_raw'`` filters are given the serialized bytes of
+        each outgoing stanza instead, right before they are written,
+        and must return bytes or ``None``.
+
+        :param mode: One of ``'in'``, ``'out'``, ``'out_sync'`` or
+                     ``'out_raw'``.
         :param handler: The filter function.
         :param int order: The position to insert the filter in
                           the list of active filters.
@@ -680,6 +875,16 @@ class XMLStream(asyncio.BaseProtocol):
         """
         if handler.stream is None:
             self.__handlers.append(handler)
+            self.__handler_counter += 1
+            index_keys = handler.index_keys()
+            self.__handler_order[handler] = (self.__handler_counter,
+                                             index_keys)
+            if index_keys is None:
+                self.__handler_fallback.append(handler)
+            else:
+                for name, namespace in index_keys:
+                    buckets = self.__handler_index.setdefault(name, {})
+                    buckets.setdefault(namespace, []).append(handler)
             handler.stream = weakref.ref(self)
 
     def remove_handler(self, name):
@@ -687,14 +892,139 @@ class XMLStream(asyncio.BaseProtocol):
 
         :param name: The name of the handler.
         """
-        idx = 0
         for handler in self.__handlers:
             if handler.name == name:
-                self.__handlers.pop(idx)
+                self._unregister_handler(handler)
                 return True
-            idx += 1
         return False
 
+    def _unregister_handler(self, handler):
+        """Remove a handler object from the list and from the index."""
+        if handler not in self.__handler_order:
+            return
+        _, index_keys = self.__handler_order.pop(handler)
+        self.__handlers.remove(handler)
+        if index_keys is None:
+            self.__handler_fallback.remove(handler)
+            return
+        for name, namespace in index_keys:
+            buckets = self.__handler_index[name]
+            bucket = buckets[namespace]
+            bucket.remove(handler)
+            if not bucket:
+                del buckets[namespace]
+                if not buckets:
+                    del self.__handler_index[name]
+
+    def _candidate_handlers(self, xml):
+        """Return, in registration order, the handlers whose matcher may
+        accept the given stanza's XML.
+
+        :param xml: The :class:`~xml.etree.ElementTree.Element` of the
+                    stanza.
+        """
+        buckets = self.__handler_index.get(xml.tag.rpartition('}')[2])
+        if not buckets:
+            return list(self.__handler_fallback)
+        candidates = [buckets.get(None, ()), self.__handler_fallback]
+        if len(buckets) > 1:
+            namespaces = set()
+            for child in xml:
+                tag = child.tag
+                if isinstance(tag, str):
+                    namespaces.add(tag[1:].partition('}')[0]
+                                   if tag[0] == '{' else '')
+            for namespace in namespaces:
+                bucket = buckets.get(namespace)
+                if bucket:
+                    candidates.append(bucket)
+        candidates = [bucket for bucket in candidates if bucket]
+        if len(candidates) == 1:
+            return list(candidates[0])
+        order = self.__handler_order
+        return sorted(set().union(*candidates), key=lambda h: order[h][0])
+
+    def add_pending_iq(self, iq_id, callback, peers=None, timeout=None,
+                       timeout_callback=None):
+        """Register a callback for the response to an outgoing request.
+
+        Pending requests are indexed by ``(id, sender)`` so that matching
+        a ``result`` or ``error`` reply is a dictionary lookup, instead of
+        a linear scan over the registered stream handlers.
+
+        :param str iq_id: The ``id`` of the request stanza.
+        :param callback: The function to execute with the reply stanza.
+        :param peers: An iterable of the JIDs (as strings) allowed to
+                      send the reply, or ``None`` to accept a reply from
+                      any sender.
+        :param timeout: The number of seconds to wait for a reply, or
+                        ``None`` to wait forever.
+        :param timeout_callback: The function to execute, with no
+                                 argument, if the timeout expires first.
+        """
+        if peers is None:
+            peers = (None,)
+        pending = PendingIq([(iq_id, peer) for peer in set(peers)], callback)
+        if timeout is not None:
+            pending.handle = self.loop.call_later(timeout,
+                                                  self._pending_iq_timeout,
+                                                  pending, timeout_callback)
+        for key in pending.keys:
+            self.__pending_iqs[key] = pending
+
+    def del_pending_iq(self, iq_id, peer=None):
+        """Stop waiting for the response to an outgoing request.
+
+        :param str iq_id: The ``id`` of the request stanza.
+        :param peer: One of the JIDs allowed to reply, as given to
+                     :meth:`add_pending_iq()`, or ``None``.
+        :returns: ``True`` if a pending request was removed.
+        """
+        pending = self.__pending_iqs.get((iq_id, peer), None)
+        if pending is None:
+            return False
+        self._forget_pending_iq(pending)
+        return True
+
+    def _forget_pending_iq(self, pending):
+        for key in pending.keys:
+            if self.__pending_iqs.get(key, None) is pending:
+                del self.__pending_iqs[key]
+        if pending.handle is not None:
+            pending.handle.cancel()
+            pending.handle = None
+
+    def _pending_iq_timeout(self, pending, timeout_callback):
+        pending.handle = None
+        self._forget_pending_iq(pending)
+        if timeout_callback is not None:
+            try:
+                timeout_callback()
+            except Exception as e:
+                self.exception(e)
+
+    def _dispatch_pending_iq(self, stanza):
+        """Execute the pending callback this stanza is a reply to, if any.
+
+        :returns: ``True`` if the stanza was a reply to a pending request.
+        """
+        if not self.__pending_iqs:
+            return False
+        if stanza['type'] not in ('result', 'error'):
+            return False
+        iq_id = stanza['id']
+        pending = self.__pending_iqs.get((iq_id, stanza['from'].full), None)
+        if pending is None:
+            pending = self.__pending_iqs.get((iq_id, None), None)
+            if pending is None:
+                return False
+        self._forget_pending_iq(pending)
+        try:
+            pending.callback(stanza)
+        except Exception as e:
+            stanza.exception(e)
+        return True
+
     async def get_dns_records(self, domain, port=None):
         """Get the DNS records for a domain.
 
@@ -780,7 +1110,8 @@ class XMLStream(asyncio.BaseProtocol):
                      Defaults to an empty dictionary, but is usually
                      a stanza object.
         """
-        log.debug("Event triggered: %s", name)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Event triggered: %s", name)
 
         handlers = self.__event_handlers.get(name, [])
         for handler in handlers:
@@ -798,10 +1129,10 @@ class XMLStream(asyncio.BaseProtocol):
                             old_exception(e)
                         else:
                             self.exception(e)
-                asyncio.ensure_future(
+                self.track_task(asyncio.ensure_future(
                     handler_callback_routine(handler_callback),
                     loop=self.loop,
-                )
+                ))
             else:
                 try:
                     handler_callback(data)
@@ -853,7 +1184,7 @@ class XMLStream(asyncio.BaseProtocol):
             handle = self.scheduled_events.pop(name)
             handle.cancel()
         except KeyError:
-            log.debug("Tried to cancel unscheduled event: %s" % (name,))
+            log.debug("Tried to cancel unscheduled event: %s", name)
 
     def _safe_cb_run(self, name, cb):
         log.debug('Scheduled event: %s', name)
@@ -908,17 +1239,51 @@ class XMLStream(asyncio.BaseProtocol):
                         return
 
         if isinstance(data, ElementBase):
-            if use_filters:
-                for filter in self.__filters['out_sync']:
-                    data = filter(data)
-                    if data is None:
-                        return
-            str_data = tostring(data.xml, xmlns=self.default_ns,
-                                stream=self, top_level=True)
-            self.send_raw(str_data)
+            if self._writing_paused and self.transport:
+                self._queue_send(data, use_filters,
+                                 self.get_send_priority(data))
+            else:
+                self._send_stanza(data, use_filters)
         else:
             self.send_raw(data)
 
+    async def send_when_ready(self, data, use_filters=True):
+        """Like :meth:`send`, but first wait until the outgoing queue is
+        below :attr:`send_queue_high_water`.
+
+        Use it to produce large amounts of stanzas without letting them
+        accumulate in memory when the other end does not read fast enough.
+
+        :param data: The :class:`~slixmpp.xmlstream.stanzabase.ElementBase`
+                     stanza to send on the stream.
+        :param bool use_filters: Indicates if outgoing filters should be
+                                 applied to the given stanza data.
+        """
+        while self._send_queue_depth >= self.send_queue_high_water:
+            waiter = self.loop.create_future()
+            self._send_waiters.append(waiter)
+            await waiter
+        self.send(data, use_filters)
+
+    def _send_stanza(self, data, use_filters):
+        # The out_sync filters run here, in the order stanzas are
+        # written, so stream management counters match the wire even
+        # when queued stanzas get reordered.
+        if use_filters:
+            for filter in self.__filters['out_sync']:
+                data = filter(data)
+                if data is None:
+                    return
+        data = self.serializer.serialize(data.xml,
+                                         xmlns=self.default_ns,
+                                         top_level=True)
+        if use_filters:
+            for filter in self.__filters['out_raw']:
+                data = filter(data)
+                if data is None:
+                    return
+        self.send_raw(data)
+
     def send_xml(self, data):
         """Send an XML object on the stream
 
@@ -927,17 +1292,112 @@ class XMLStream(asyncio.BaseProtocol):
         """
         return self.send(tostring(data))
 
-    def send_raw(self, data):
+    def send_raw(self, data, priority=PRIORITY_NORMAL):
         """Send raw data across the stream.
 
         :param string data: Any bytes or utf-8 string value.
+        :param int priority: The position of the data in the outgoing
+                             queue, if the transport is paused.
+                             Nonzas which should not wait behind queued
+                             stanzas use :data:`PRIORITY_HIGH`.
         """
-        log.debug("SEND: %s", data)
         if not self.transport:
             raise NotConnectedError()
+        if self._writing_paused:
+            self._queue_send(data, None, priority)
+            return
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("SEND: %s", data if isinstance(data, str) else
+                                  data.decode('utf-8', 'replace'))
         if isinstance(data, str):
             data = data.encode('utf-8')
+        if self.wire_trace.enabled:
+            self.wire_trace.record('SEND', data)
+        self.write_stats['records'] += 1
+        if not self.coalesce_writes:
+            self._write(data)
+            return
+        self._write_buffer.append(data)
+        self._write_buffer_size += len(data)
+        if self._write_buffer_size >= self.coalesce_max_bytes:
+            self.flush()
+        elif self._flush_handle is None:
+            if self.coalesce_max_delay:
+                self._flush_handle = self.loop.call_later(
+                        self.coalesce_max_delay, self.flush)
+            else:
+                self._flush_handle = self.loop.call_soon(self.flush)
+
+    def flush(self):
+        """Write the data buffered by :meth:`send_raw` to the transport,
+        when :attr:`coalesce_writes` is enabled.
+        """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._write_buffer:
+            return
+        if len(self._write_buffer) == 1:
+            data = self._write_buffer[0]
+        else:
+            data = b''.join(self._write_buffer)
+        self._write_buffer = []
+        self._write_buffer_size = 0
+        if self.transport:
+            self._write(data)
+
+    def piggyback(self, data):
+        """Send raw data along with the next write to the transport.
+
+        Meant for nonzas, like acks, which do not need to be sent right
+        away. The data is appended to whatever is written next during
+        this turn of the event loop, or sent on its own at the end of it.
+
+        :param string data: Any bytes or utf-8 string value.
+        """
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("SEND (piggyback): %s", data if isinstance(data, str)
+                      else data.decode('utf-8', 'replace'))
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if self.wire_trace.enabled:
+            self.wire_trace.record('SEND', data)
+        self.write_stats['records'] += 1
+        self._piggyback.append(data)
+        if self._piggyback_handle is None:
+            self._piggyback_handle = self.loop.call_soon(self._send_piggyback)
+
+    def _send_piggyback(self):
+        self._piggyback_handle = None
+        # Coalesced data is waiting for its flush, which writes the
+        # piggybacked data after it.
+        if self._write_buffer:
+            return
+        # While the transport is paused, wait for resume_writing().
+        if self._piggyback and self.transport and not self._writing_paused:
+            data = b''.join(self._piggyback)
+            self._piggyback = []
+            self._write(data)
+
+    def _write(self, data):
+        if self._piggyback:
+            self._piggyback.insert(0, data)
+            data = b''.join(self._piggyback)
+            self._piggyback = []
         self.transport.write(data)
+        self.write_stats['writes'] += 1
+        self.write_stats['bytes'] += len(data)
+
+    def _clear_write_buffer(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._piggyback_handle is not None:
+            self._piggyback_handle.cancel()
+            self._piggyback_handle = None
+        self._piggyback = []
+        self._write_buffer = []
+        self._write_buffer_size = 0
 
     def _build_stanza(self, xml, default_ns=None):
         """Create a stanza object from a given XML object.
@@ -964,6 +1424,83 @@ class XMLStream(asyncio.BaseProtocol):
             stanza['lang'] = self.peer_default_lang
         return stanza
 
+    def track_task(self, future):
+        """Count a running coroutine handler against
+        :attr:`admission` ``max_tasks``, pausing reading from the transport
+        while there are too many.
+
+        :param future: The :class:`asyncio.Future` of the handler.
+        """
+        admission = self.admission
+        if not admission.max_tasks or future.done():
+            return
+        admission.tasks += 1
+        future.add_done_callback(self._task_done)
+        if admission.tasks >= admission.max_tasks \
+                and not self._reading_paused and self.transport:
+            log.debug('%d handlers running, pausing reads', admission.tasks)
+            self._reading_paused = True
+            admission.stats['pauses'] += 1
+            self.transport.pause_reading()
+
+    def _task_done(self, future):
+        admission = self.admission
+        admission.tasks -= 1
+        if not self._reading_paused:
+            return
+        deferred = self._deferred_stanzas
+        while deferred and admission.tasks < admission.max_tasks:
+            self._spawn_event(deferred.popleft())
+        if not deferred and admission.tasks <= admission.resume_tasks \
+                and self.transport:
+            log.debug('%d handlers running, resuming reads', admission.tasks)
+            self._reading_paused = False
+            self.transport.resume_reading()
+
+    def _admission_exempt(self, xml):
+        """Return ``True`` for the stanzas never rate limited: those
+        from the server itself, which carry no ``from`` or the server's
+        domain, and the replies to our own requests.
+
+        :param xml: The :class:`~xml.etree.ElementTree.Element` received.
+        """
+        sender = xml.get('from', '')
+        if not sender:
+            return True
+        if xml.get('type') in ('result', 'error') \
+                and xml.tag.endswith('}iq'):
+            iq_id = xml.get('id', '')
+            pending = self.__pending_iqs
+            if (iq_id, sender) in pending or (iq_id, None) in pending:
+                return True
+        return self._admission_server(sender) in self._admission_domains()
+
+    def _admission_server(self, sender):
+        """Return the normalized domain of a sender without a local
+        part, or ``None`` if it is not a server JID."""
+        try:
+            sender = JID(sender)
+        except InvalidJID:
+            return None
+        if sender.user:
+            return None
+        return sender.domain
+
+    def _admission_domains(self):
+        """The domains whose stanzas are never rate limited."""
+        return (self.default_domain,)
+
+    def reject_stanza(self, xml):
+        """Called with the stanzas dropped by :attr:`admission`.
+
+        Meant to be overridden.
+
+        :param xml: The :class:`~xml.etree.ElementTree.Element` XML object
+                    which was dropped.
+        """
+        log.debug('Dropped stanza from %s over the rate limit',
+                  xml.get('from'))
+
     def _spawn_event(self, xml):
         """
         Analyze incoming XML stanzas and convert them into stanza
@@ -973,6 +1510,17 @@ class XMLStream(asyncio.BaseProtocol):
         :param xml: The :class:`~slixmpp.xmlstream.stanzabase.ElementBase`
                     stanza to analyze.
         """
+        admission = self.admission
+        if admission.rate and not self._admission_exempt(xml):
+            sender = xml.get('from', '')
+            try:
+                sender = JID(sender).bare
+            except InvalidJID:
+                sender = sender.split('/', 1)[0]
+            if not admission.admit(sender):
+                self.reject_stanza(xml)
+                return
+
         # Apply any preprocessing filters.
         xml = self.incoming_filter(xml)
 
@@ -985,13 +1533,18 @@ class XMLStream(asyncio.BaseProtocol):
         if stanza is None:
             return
 
-        log.debug("RECV: %s", stanza)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("RECV: %s", stanza)
+
+        # Replies to our own requests are resolved first, without going
+        # through the list of handlers.
+        handled = self._dispatch_pending_iq(stanza)
 
         # Match the stanza against registered handlers. Handlers marked
         # to run "in stream" will be executed immediately; the rest will
         # be queued.
-        handled = False
-        matched_handlers = [h for h in self.__handlers if h.match(stanza)]
+        matched_handlers = [h for h in self._candidate_handlers(stanza.xml)
+                            if h.match(stanza)]
         for handler in matched_handlers:
             handler.prerun(stanza)
             try:
@@ -999,7 +1552,7 @@ class XMLStream(asyncio.BaseProtocol):
             except Exception as e:
                 stanza.exception(e)
             if handler.check_delete():
-                self.__handlers.remove(handler)
+                self._unregister_handler(handler)
             handled = True
 
         # Some stanzas require responses, such as Iq queries. A default
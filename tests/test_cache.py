@@ -2,7 +2,7 @@ import unittest
 from slixmpp.test import SlixTest
 from slixmpp.util import (
     MemoryCache, MemoryPerJidCache,
-    FileSystemCache, FileSystemPerJidCache
+    FileSystemCache, FileSystemPerJidCache, LRUCache
 )
 from tempfile import TemporaryDirectory
 
@@ -71,4 +71,56 @@ class TestCacheClass(SlixTest):
                 None
             )
 
+    def testLRUCache(self):
+        cache = LRUCache(size=2, ttl=60)
+
+        cache.store("a", 1)
+        cache.store("b", 2)
+        self.assertEqual(cache.retrieve("a"), 1)
+        cache.store("c", 3)
+        self.assertEqual(cache.retrieve("b"), None)
+        self.assertEqual(cache.retrieve("a"), 1)
+        self.assertEqual(cache.retrieve("c"), 3)
+
+        cache.store("c", 4, ttl=0)
+        self.assertEqual(cache.retrieve("c"), None)
+        self.assertEqual(cache.stats,
+                         {'hits': 3, 'misses': 2, 'expired': 1, 'evicted': 1})
+
+    def testLRUCacheBackend(self):
+        backend = MemoryCache()
+        cache = LRUCache(size=1, backend=backend)
+
+        cache.store("a", 1)
+        cache.store("b", 2)
+        self.assertEqual(list(cache.cache), ["b"])
+        self.assertEqual(cache.retrieve("a"), 1)
+
+        cache.clear()
+        self.assertEqual(cache.retrieve("b"), 2)
+        cache.remove("b")
+        self.assertEqual(backend.retrieve("b"), None)
+
+    def testLRUCacheFileSystem(self):
+        with TemporaryDirectory() as tmpdir:
+            backend = FileSystemCache(tmpdir, "test")
+            cache = LRUCache(size=1, ttl=60, backend=backend,
+                             encode=str, decode=int)
+
+            cache.store(("info", "user@example.com/a", ""), 1)
+            cache.store(("info", "user@example.com/b", ""), 2)
+            cache.clear()
+            self.assertEqual(
+                cache.retrieve(("info", "user@example.com/a", "")),
+                1
+            )
+
+            cache.store(("info", "user@example.com/a", ""), 3, ttl=0)
+            cache.clear()
+            self.assertEqual(
+                cache.retrieve(("info", "user@example.com/a", "")),
+                None
+            )
+            self.assertEqual(cache.stats['expired'], 1)
+
 suite = unittest.TestLoader().loadTestsFromTestCase(TestCacheClass)
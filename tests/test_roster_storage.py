@@ -0,0 +1,94 @@
+import gc
+import os
+import asyncio
+import unittest
+from tempfile import TemporaryDirectory
+from slixmpp.test import SlixTest
+from slixmpp.roster import (RosterStorage, SQLiteRosterStorage,
+                            WriteBehindRoster)
+
+
+class TestRosterStorage(SlixTest):
+
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'roster.db')
+        self.stream_start(mode='client', jid='tester@localhost')
+
+    def tearDown(self):
+        self.stream_close()
+        self.tmpdir.cleanup()
+
+    def open(self, **kwargs):
+        backend = WriteBehindRoster(SQLiteRosterStorage(self.path), **kwargs)
+        self.xmpp.loop.run_until_complete(backend.open())
+        return backend
+
+    def testWriteBehind(self):
+        """Test batching the roster changes to SQLite."""
+        backend = self.open(interval=60, batch_size=100)
+        self.xmpp.roster.set_backend(backend, save=False)
+        roster = self.xmpp.roster['tester@localhost']
+
+        roster.add('romeo@montague.lit', name='Romeo', groups=['Friends'],
+                   afrom=True, save=True)
+        roster['romeo@montague.lit']['to'] = True
+        roster['romeo@montague.lit'].save()
+        roster['juliet@capulet.lit'].save()
+        # Both changes to romeo@montague.lit are coalesced.
+        self.assertEqual(backend.pending, 2)
+
+        roster['juliet@capulet.lit'].save(remove=True)
+        self.xmpp.loop.run_until_complete(backend.close())
+
+        backend = self.open()
+        self.assertEqual(backend.entries(None), ['tester@localhost'])
+        self.assertEqual(backend.entries('tester@localhost'),
+                         ['romeo@montague.lit'])
+        self.assertEqual(backend.load('tester@localhost',
+                                      'romeo@montague.lit', {}),
+                         {'name': 'Romeo', 'groups': ['Friends'],
+                          'from': True, 'to': True, 'pending_in': False,
+                          'pending_out': False, 'whitelisted': False})
+        self.xmpp.loop.run_until_complete(backend.close())
+
+    def testBatchSize(self):
+        """Test writing the changes once enough have been made."""
+        backend = self.open(interval=60, batch_size=2)
+        self.xmpp.roster.set_backend(backend, save=False)
+        roster = self.xmpp.roster['tester@localhost']
+        roster.add('romeo@montague.lit', save=True)
+        roster.add('juliet@capulet.lit', save=True)
+        self.xmpp.loop.run_until_complete(backend._lock.acquire())
+        backend._lock.release()
+        self.assertEqual(backend.pending, 0)
+        self.xmpp.loop.run_until_complete(backend.close())
+
+    def testFailedFlush(self):
+        """Test keeping the changes which failed to be written."""
+        class FailingStorage(RosterStorage):
+            async def load_all(self):
+                return {}
+
+            async def save_many(self, changes, versions):
+                raise OSError('Disk full')
+
+        errors = []
+        loop = self.xmpp.loop
+        loop.set_exception_handler(lambda loop, context: errors.append(context))
+        backend = WriteBehindRoster(FailingStorage(), batch_size=1)
+        loop.run_until_complete(backend.open())
+        self.xmpp.roster.set_backend(backend, save=False)
+
+        self.xmpp.roster['tester@localhost'].add('romeo@montague.lit',
+                                                 save=True)
+        loop.run_until_complete(asyncio.sleep(0))
+        gc.collect()
+        loop.set_exception_handler(None)
+        self.assertEqual(errors, [])
+        self.assertEqual(backend.pending, 1)
+
+        self.assertRaises(OSError, loop.run_until_complete, backend.flush())
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestRosterStorage)
@@ -0,0 +1,72 @@
+import unittest
+from slixmpp.test import SlixTest
+from slixmpp.util import sasl
+from slixmpp.util.sasl import mechanisms
+
+
+class KeyStore(sasl.SCRAMKeyStore):
+
+    def __init__(self):
+        self.keys = {}
+
+    def get(self, mech, username, salt, iterations):
+        return self.keys.get((mech, username, salt, iterations))
+
+    def set(self, mech, username, salt, iterations, client_key, server_key):
+        self.keys[(mech, username, salt, iterations)] = (client_key,
+                                                         server_key)
+
+
+class TestSCRAM(SlixTest):
+
+    """Check SCRAM-SHA-1 against the example exchange of RFC 5802."""
+
+    def setUp(self):
+        mechanisms._scram_keys.clear()
+
+    def login(self, password, key_store=None):
+        def credentials(required, optional):
+            return {'username': 'user', 'password': password}
+
+        def security(values):
+            return {'encrypted': True}
+
+        mech = sasl.choose({'SCRAM-SHA-1'}, credentials, security)
+        if key_store is not None:
+            mech.key_store = key_store
+        mech.process()
+        # Use the client nonce of the example.
+        mech.cnonce = b'fyko+d2lbbFgONRv9qkxdawL'
+        mech.client_first_message_bare = b'n=user,r=' + mech.cnonce
+
+        final = mech.process(b'r=fyko+d2lbbFgONRv9qkxdawL3rfcNHYJY1ZVvWVs7j,'
+                             b's=QSXCR+Q6sek8bf92,i=4096')
+        self.assertEqual(final,
+                         b'c=biws,r=fyko+d2lbbFgONRv9qkxdawL3rfcNHYJY1ZVvWVs7j,'
+                         b'p=v0X8v3Bz2T0CJGbJQyF0X+HI4Ts=')
+        mech.process(b'v=rmF9pqV8S7suAoZWja4dJRkFsKQ=')
+        return mech
+
+    def testExchange(self):
+        """Test that derived keys are cached between logins."""
+        self.login('pencil')
+        self.assertEqual(len(mechanisms._scram_keys), 1)
+        self.login('pencil')
+        self.assertEqual(len(mechanisms._scram_keys), 1)
+        for key in mechanisms._scram_keys:
+            self.assertNotIn(b'pencil', key)
+
+    def testKeyStore(self):
+        """Test logging in with stored keys instead of a password."""
+        store = KeyStore()
+        self.login('pencil', store)
+        self.assertEqual(list(store.keys),
+                         [('SCRAM-SHA-1', b'user', b'A%\xc2G\xe4:\xb1\xe9<m\xffv', 4096)])
+
+        mechanisms._scram_keys.clear()
+        self.login('', store)
+
+        self.assertRaises(sasl.SASLCancelled, self.login, '')
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestSCRAM)
@@ -0,0 +1,96 @@
+import asyncio
+import unittest
+from tempfile import TemporaryFile
+from slixmpp.test import SlixTest
+from slixmpp.plugins.xep_0065 import Socks5Protocol
+
+
+class EchoProxy(asyncio.Protocol):
+
+    """Accept one SOCKS5 connect request, then echo everything."""
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.state = 'methods'
+
+    def data_received(self, data):
+        if self.state == 'methods':
+            self.state = 'request'
+            self.transport.write(b'\x05\x00')
+        elif self.state == 'request':
+            self.state = 'connected'
+            self.transport.write(b'\x05\x00\x00' + data[3:])
+        else:
+            self.transport.write(data)
+
+
+class TestSocks5(SlixTest):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.events = []
+
+    def tearDown(self):
+        self.loop.close()
+
+    def event(self, name, data):
+        self.events.append(name)
+
+    def testStreams(self):
+        """Test using a SOCKS5 session as a pair of streams."""
+        async def run():
+            server = await self.loop.create_server(EchoProxy, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            _, socks5 = await self.loop.create_connection(
+                    lambda: Socks5Protocol('dest', 0, self.event),
+                    '127.0.0.1', port)
+            await socks5.connected
+
+            reader, writer = socks5.get_streams()
+            self.assertEqual(socks5.get_streams(), (reader, writer))
+            writer.write(b'Hello ')
+            with TemporaryFile() as file:
+                file.write(b'world!' * 1000)
+                file.seek(0)
+                self.assertEqual(await writer.sendfile(file), 6000)
+            data = await reader.readexactly(6006)
+            self.assertEqual(data, b'Hello ' + b'world!' * 1000)
+
+            writer.close()
+            self.assertEqual(await reader.read(), b'')
+            server.close()
+            await server.wait_closed()
+            return socks5.stats()
+
+        stats = self.loop.run_until_complete(run())
+        self.assertEqual((stats['bytes_sent'], stats['bytes_received']),
+                         (6006, 6006))
+        self.assertTrue(stats['duration'] > 0)
+        self.assertTrue(stats['send_rate'] > 0)
+        self.assertEqual(self.events, ['socks5_connected', 'socks5_closed'])
+
+    def testSendfileFallback(self):
+        """Test sending part of a file without loop.sendfile()."""
+        async def run():
+            server = await self.loop.create_server(EchoProxy, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            _, socks5 = await self.loop.create_connection(
+                    lambda: Socks5Protocol('dest', 0, self.event),
+                    '127.0.0.1', port)
+            await socks5.connected
+
+            reader, writer = socks5.get_streams()
+            with TemporaryFile() as file:
+                file.write(b'Hello world!')
+                sent = await socks5._sendfile_fallback(file, 6, 5)
+            data = await reader.readexactly(5)
+
+            writer.close()
+            server.close()
+            await server.wait_closed()
+            return sent, data
+
+        self.assertEqual(self.loop.run_until_complete(run()), (5, b'world'))
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestSocks5)
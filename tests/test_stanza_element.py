@@ -1,6 +1,8 @@
 import unittest
 from slixmpp.test import SlixTest
 from slixmpp.xmlstream.stanzabase import ElementBase, register_stanza_plugin, ET
+from slixmpp.xmlstream.stanzabase import compile_stanza_path
+from slixmpp.xmlstream.matcher import MatchXPath, StanzaPath
 from collections import OrderedDict
 
 
@@ -522,6 +524,87 @@ class TestElementBase(SlixTest):
         self.assertTrue(stanza.match("foo/{baz}sub"),
             "Stanza did not match with namespaced substanza.")
 
+    def testCompiledMatch(self):
+        """Test matching against compiled stanza paths and XPaths."""
+
+        class TestStanza(ElementBase):
+            name = "foo"
+            namespace = "foo"
+            interfaces = {'bar'}
+
+        stanza = TestStanza()
+        stanza['bar'] = 'a=b'
+
+        self.assertTrue(compile_stanza_path("foo@bar=a=b") is
+                        compile_stanza_path("foo@bar=a=b"),
+            "Compiled stanza path was not cached.")
+
+        self.assertTrue(stanza.match(["foo@bar=a=b"]),
+            "Stanza did not match attribute value containing '='.")
+
+        self.assertTrue(StanzaPath("foo@bar=a=b").match(stanza),
+            "StanzaPath did not match the stanza.")
+
+        self.assertFalse(StanzaPath("foo@bar=a").match(stanza),
+            "StanzaPath matched the wrong attribute value.")
+
+        self.assertTrue(MatchXPath("{foo}foo").match(stanza),
+            "XPath did not match the root element.")
+
+        self.assertFalse(MatchXPath("{foo}foo/{foo}qux").match(stanza),
+            "XPath matched a missing child element.")
+
+        self.assertTrue(MatchXPath("{foo}foo[@bar='a=b']").match(stanza),
+            "XPath with a predicate did not match the root element.")
+
+    def testLazyPlugins(self):
+        """Test that plugins for received XML are created on access."""
+
+        class TestStanza(ElementBase):
+            name = "foo"
+            namespace = "foo"
+            interfaces = {'bar'}
+
+        class TestPlugin(ElementBase):
+            name = "plugin"
+            namespace = "foo"
+            interfaces = {'val'}
+            plugin_attrib = "plugin"
+
+        class TestItem(ElementBase):
+            name = "item"
+            namespace = "foo"
+            interfaces = {'id'}
+            plugin_attrib = "item"
+
+        register_stanza_plugin(TestStanza, TestPlugin)
+        register_stanza_plugin(TestStanza, TestItem, iterable=True)
+
+        xml = ET.fromstring('<foo xmlns="foo" bar="a">'
+                            '<item id="1" />'
+                            '<plugin val="x" />'
+                            '<item id="2" />'
+                            '</foo>')
+        stanza = TestStanza(xml=xml)
+
+        self.assertEqual(stanza['bar'], 'a')
+        self.assertTrue(stanza._plugins is None,
+            "Plugins were created before being accessed.")
+
+        self.assertTrue(stanza.match('foo/plugin@val=x'))
+        self.assertEqual(list(stanza._plugins), [('plugin', '')],
+            "Matching a path created plugins outside of it.")
+
+        self.assertEqual(stanza['plugin']['val'], 'x')
+        self.assertEqual(list(stanza._plugins), [('plugin', '')],
+            "Other plugins were created with the requested one.")
+
+        self.assertEqual([item['id'] for item in stanza['substanzas']],
+                         ['1', '2'])
+        self.assertTrue(TestStanza(xml=xml).match('foo/item@id=2'))
+        self.assertEqual(len(xml), 3,
+            "Loading plugins modified the XML.")
+
     def testComparisons(self):
         """Test comparing ElementBase objects."""
 
@@ -1,6 +1,9 @@
+import asyncio
 import time
 import unittest
 from slixmpp.test import SlixTest
+from slixmpp.xmlstream.trace import WireTrace
+from slixmpp.xmlstream.admission import Admission
 
 
 class TestStreamTester(SlixTest):
@@ -58,4 +61,150 @@ class TestStreamTester(SlixTest):
         self.stream_start(mode='client', skip=False)
         self.send_header(sto='localhost')
 
+    def testWireTrace(self):
+        """Test that the wire trace keeps the last raw frames."""
+        self.stream_start(mode='client')
+        self.xmpp.wire_trace = WireTrace(size=2)
+
+        self.recv("""<message><body>One</body></message>""")
+        self.xmpp.send_raw("""<message><body>Two</body></message>""")
+        self.recv("""<message><body>Three</body></message>""")
+
+        frames = [(direction, data) for _, direction, data
+                  in self.xmpp.wire_trace.frames]
+        self.assertEqual(frames, [
+            ('SEND', b"""<message><body>Two</body></message>"""),
+            ('RECV', """<message><body>Three</body></message>"""),
+        ])
+
+    def testCoalesceWrites(self):
+        """Test that buffered writes are flushed in a single write."""
+        self.stream_start(mode='client')
+        self.xmpp.coalesce_writes = True
+        stats = dict(self.xmpp.write_stats)
+
+        for body in ('One', 'Two', 'Three'):
+            msg = self.Message()
+            msg['body'] = body
+            msg.send()
+        self.send(None)
+
+        self.xmpp.loop.run_until_complete(asyncio.sleep(0))
+
+        self.assertEqual(self.xmpp.socket.next_sent(),
+                         b'<message><body>One</body></message>'
+                         b'<message><body>Two</body></message>'
+                         b'<message><body>Three</body></message>')
+        self.assertEqual(self.xmpp.write_stats['records'] - stats['records'], 3)
+        self.assertEqual(self.xmpp.write_stats['writes'] - stats['writes'], 1)
+
+    def testPausedWrites(self):
+        """Test that replies overtake queued stanzas while paused."""
+        self.stream_start(mode='client')
+        self.xmpp.send_queue_high_water = 2
+        self.xmpp.pause_writing()
+
+        msg = self.Message()
+        msg['body'] = 'One'
+        msg.send()
+        iq = self.Iq()
+        iq['type'] = 'result'
+        iq['id'] = 'r1'
+        iq.send()
+        self.assertEqual(self.xmpp.send_queue_depth, 2)
+        self.assertEqual(self.xmpp.socket.next_sent(), None)
+
+        msg = self.Message()
+        msg['body'] = 'Two'
+        future = asyncio.ensure_future(self.xmpp.send_when_ready(msg))
+        self.xmpp.loop.run_until_complete(asyncio.sleep(0))
+        self.assertFalse(future.done())
+
+        self.xmpp.resume_writing()
+        self.xmpp.loop.run_until_complete(future)
+
+        self.send('<iq type="result" id="r1" />')
+        self.send('<message><body>One</body></message>')
+        self.send('<message><body>Two</body></message>')
+        self.assertEqual(self.xmpp.send_queue_depth, 0)
+        self.assertEqual(self.xmpp.send_queue_stats['pauses'], 1)
+        self.assertEqual(self.xmpp.send_queue_stats['max_depth'], 2)
+
+    def testAdmissionRate(self):
+        """Test that requests over the rate of a sender are refused."""
+        self.stream_start(mode='client')
+        self.xmpp.admission = Admission(rate=0.001, burst=1)
+
+        self.recv('<message from="bad@example.com/a"><body>Hi</body></message>')
+        self.recv('<iq type="get" id="2" from="bad@example.com/b" />')
+        self.send('''
+          <iq type="error" id="2" to="bad@example.com/b">
+            <error type="wait" code="500">
+              <resource-constraint
+                  xmlns="urn:ietf:params:xml:ns:xmpp-stanzas" />
+            </error>
+          </iq>
+        ''')
+        self.assertEqual(self.xmpp.admission.stats['dropped'], 1)
+
+    def testAdmissionExempt(self):
+        """Test that server traffic and replies are not rate limited."""
+        self.stream_start(mode='client')
+        self.xmpp.admission = Admission(rate=0.001, burst=1)
+        futures = []
+        for i in range(5):
+            iq = self.xmpp.Iq(sto='bad@example.com/a', stype='get', sid=str(i))
+            iq.enable('roster')
+            futures.append(iq.send())
+        for i in range(5):
+            self.recv('<a xmlns="urn:xmpp:sm:3" h="0" />')
+            self.recv('<iq type="result" id="%d" from="bad@example.com/a" />'
+                      % i)
+            self.recv('<iq type="result" id="%d" from="localhost" />' % i)
+        self.xmpp.loop.run_until_complete(asyncio.sleep(0))
+
+        self.assertTrue(all(future.done() for future in futures))
+        self.assertEqual(self.xmpp.admission.stats['dropped'], 0)
+
+    def testAdmissionNormalized(self):
+        """Test that senders are compared as normalized JIDs."""
+        self.stream_start(mode='client')
+        self.xmpp.admission = Admission(rate=0.001, burst=1)
+
+        for sender in ('localhost', 'LocalHost', 'localhost/admin'):
+            self.recv('<message from="%s"><body>Hi</body></message>'
+                      % sender)
+        self.assertEqual(self.xmpp.admission.stats['dropped'], 0)
+
+        self.recv('<message from="bad@example.com/a"><body>Hi</body></message>')
+        self.recv('<message from="BAD@Example.com/b"><body>Hi</body></message>')
+        self.assertEqual(self.xmpp.admission.stats['dropped'], 1)
+
+    def testAdmissionTasks(self):
+        """Test that reading pauses while too many handlers run."""
+        self.stream_start(mode='client')
+        self.xmpp.admission = Admission(max_tasks=1)
+        release = asyncio.Future()
+        bodies = []
+
+        async def on_message(msg):
+            bodies.append(msg['body'])
+            await release
+
+        self.xmpp.add_event_handler('message', on_message)
+        self.recv('<message><body>One</body></message>'
+                  '<message><body>Two</body></message>')
+        self.xmpp.loop.run_until_complete(asyncio.sleep(0))
+
+        self.assertEqual(bodies, ['One'])
+        self.assertFalse(self.xmpp.transport.reading)
+        self.assertEqual(self.xmpp.admission.stats['deferred'], 1)
+
+        release.set_result(None)
+        for _ in range(3):
+            self.xmpp.loop.run_until_complete(asyncio.sleep(0))
+        self.assertEqual(bodies, ['One', 'Two'])
+        self.assertTrue(self.xmpp.transport.reading)
+
+
 suite = unittest.TestLoader().loadTestsFromTestCase(TestStreamTester)
@@ -1,10 +1,11 @@
+import asyncio
 import time
 import threading
 
 import unittest
 from slixmpp.test import SlixTest
 from slixmpp.exceptions import IqTimeout
-from slixmpp import Callback, MatchXPath
+from slixmpp import Callback, MatchXPath, MatcherId, StanzaPath
 
 
 class TestHandlers(SlixTest):
@@ -40,6 +41,38 @@ class TestHandlers(SlixTest):
         msg['body'] = 'Success!'
         self.send(msg)
 
+    def testHandlerOrder(self):
+        """Test that indexed and non-indexed handlers keep their order."""
+        events = []
+
+        def make_handler(name):
+            return lambda stanza: events.append(name)
+
+        self.xmpp.register_handler(
+                Callback('Test Any',
+                         MatcherId('order'),
+                         make_handler('any')))
+        self.xmpp.register_handler(
+                Callback('Test Child',
+                         MatchXPath('{%s}message/{test}tester' % (
+                             self.xmpp.default_ns)),
+                         make_handler('child')))
+        self.xmpp.register_handler(
+                Callback('Test Other',
+                         MatchXPath('{%s}iq' % self.xmpp.default_ns),
+                         make_handler('other')))
+        self.xmpp.register_handler(
+                Callback('Test Root',
+                         StanzaPath('message'),
+                         make_handler('root'),
+                         once=True))
+
+        self.recv("""<message id="order"><tester xmlns="test" /></message>""")
+        self.recv("""<message id="order"><body>Testing</body></message>""")
+
+        self.assertEqual(events, ['any', 'child', 'root', 'any'])
+        self.assertFalse(self.xmpp.remove_handler('Test Root'))
+
     def testWaiter(self):
         """Test using stream waiter handler."""
 
@@ -148,6 +181,64 @@ class TestHandlers(SlixTest):
         self.assertTrue(events == ['foo'],
                 "Iq callback was not executed: %s" % events)
 
+    def testIqCallbackOnce(self):
+        """Test that an Iq callback is only executed for the first reply."""
+        events = []
+
+        def handle_foo(iq):
+            events.append(iq['id'])
+
+        iq = self.Iq()
+        iq['type'] = 'get'
+        iq['id'] = 'test-once'
+        iq['to'] = 'user@localhost'
+        iq['query'] = 'foo'
+        iq.send(callback=handle_foo)
+
+        self.send("""
+          <iq type="get" id="test-once" to="user@localhost">
+            <query xmlns="foo" />
+          </iq>
+        """)
+
+        for _ in range(2):
+            self.recv("""
+              <iq type="result" id="test-once"
+                  to="test@localhost"
+                  from="user@localhost" />
+            """)
+
+        self.assertEqual(events, ['test-once'])
+        self.assertFalse(self.xmpp.del_pending_iq('test-once',
+                                                  'user@localhost'))
+
+    def testIqTimeoutCallback(self):
+        """Test that the timeout callback of an Iq is executed."""
+        events = []
+
+        def handle_timeout(iq):
+            events.append('timeout')
+
+        iq = self.Iq()
+        iq['type'] = 'get'
+        iq['id'] = 'test-timeout'
+        iq['to'] = 'user@localhost'
+        iq['query'] = 'foo'
+        future = iq.send(timeout=0, timeout_callback=handle_timeout)
+
+        self.send("""
+          <iq type="get" id="test-timeout" to="user@localhost">
+            <query xmlns="foo" />
+          </iq>
+        """)
+
+        self.xmpp.loop.run_until_complete(asyncio.sleep(0.01))
+
+        self.assertEqual(events, ['timeout'])
+        self.assertIsInstance(future.exception(), IqTimeout)
+        self.assertFalse(self.xmpp.del_pending_iq('test-timeout',
+                                                  'user@localhost'))
+
     def testMultipleHandlersForStanza(self):
         """
         Test that multiple handlers for a single stanza work
@@ -1,7 +1,11 @@
 # -*- encoding:utf-8 -*-
 from __future__ import unicode_literals
 
+import asyncio
+import os
+import sqlite3
 import unittest
+from tempfile import TemporaryDirectory
 from slixmpp.exceptions import IqTimeout
 from slixmpp.test import SlixTest
 import time
@@ -307,5 +311,101 @@ class TestStreamRoster(SlixTest):
           <iq to="tester@localhost" type="result" id="1" />
         """)
 
+    def testRosterCache(self):
+        """Test reusing the roster saved by a previous session."""
+        with TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'roster.db')
+
+            self.stream_start()
+            self.xmpp.features.add('rosterver')
+            self.xmpp.set_roster_cache(path)
+            task = self.xmpp.get_roster()
+            self.xmpp.loop.run_until_complete(self.xmpp._load_roster_cache())
+            self.send("""
+              <iq type="get" id="1">
+                <query xmlns="jabber:iq:roster" ver="" />
+              </iq>
+            """)
+            self.recv("""
+              <iq to="tester@localhost" type="result" id="1">
+                <query xmlns="jabber:iq:roster" ver="1">
+                  <item jid="romeo@montague.lit" subscription="both" />
+                  <item jid="juliet@capulet.lit" subscription="to" />
+                </query>
+              </iq>
+            """)
+            self.xmpp.loop.run_until_complete(task)
+            self.xmpp.loop.run_until_complete(self.xmpp.roster_cache.close())
+            self.stream_close()
+
+            # The server only sends the changes, if any.
+            self.stream_start()
+            self.xmpp.features.add('rosterver')
+            self.xmpp.set_roster_cache(path)
+            task = self.xmpp.get_roster()
+            self.xmpp.loop.run_until_complete(self.xmpp._load_roster_cache())
+            self.send("""
+              <iq type="get" id="1">
+                <query xmlns="jabber:iq:roster" ver="1" />
+              </iq>
+            """)
+            self.recv("""
+              <iq to="tester@localhost" type="result" id="1" />
+            """)
+            self.xmpp.loop.run_until_complete(task)
+            self.check_roster('tester@localhost', 'romeo@montague.lit',
+                              subscription='both')
+            self.check_roster('tester@localhost', 'juliet@capulet.lit',
+                              subscription='to')
+
+            # A full roster replaces the cached one.
+            task = self.xmpp.get_roster()
+            self.xmpp.loop.run_until_complete(asyncio.sleep(0))
+            self.send("""
+              <iq type="get" id="2">
+                <query xmlns="jabber:iq:roster" ver="1" />
+              </iq>
+            """)
+            self.recv("""
+              <iq to="tester@localhost" type="result" id="2">
+                <query xmlns="jabber:iq:roster" ver="3">
+                  <item jid="romeo@montague.lit" subscription="both" />
+                </query>
+              </iq>
+            """)
+            self.xmpp.loop.run_until_complete(task)
+            self.assertFalse(
+                    self.xmpp.client_roster.has_jid('juliet@capulet.lit'))
+            self.assertEqual(self.xmpp.client_roster.version, '3')
+            self.xmpp.loop.run_until_complete(self.xmpp.roster_cache.close())
+
+    def testRosterCacheFailure(self):
+        """Test loading the roster cache again after a failure."""
+        with TemporaryDirectory() as tmpdir:
+            self.stream_start()
+            # A directory can not be opened as a database.
+            self.xmpp.set_roster_cache(tmpdir)
+            self.assertRaises(sqlite3.OperationalError,
+                              self.xmpp.loop.run_until_complete,
+                              self.xmpp.get_roster())
+            self.assertEqual(self.xmpp._roster_cache_loading, None)
+
+            self.xmpp.roster_cache.storage.path = os.path.join(tmpdir,
+                                                               'roster.db')
+            task = self.xmpp.get_roster()
+            self.xmpp.loop.run_until_complete(self.xmpp._load_roster_cache())
+            self.send("""
+              <iq type="get" id="1">
+                <query xmlns="jabber:iq:roster" />
+              </iq>
+            """)
+            self.recv("""
+              <iq to="tester@localhost" type="result" id="1">
+                <query xmlns="jabber:iq:roster" />
+              </iq>
+            """)
+            self.xmpp.loop.run_until_complete(task)
+            self.xmpp.loop.run_until_complete(self.xmpp.roster_cache.close())
+
 
 suite = unittest.TestLoader().loadTestsFromTestCase(TestStreamRoster)
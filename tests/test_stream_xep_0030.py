@@ -1,8 +1,12 @@
+import asyncio
 import time
 import threading
 
 import unittest
+from tempfile import TemporaryDirectory
+from slixmpp.exceptions import IqTimeout
 from slixmpp.test import SlixTest
+from slixmpp.util import FileSystemCache
 
 
 class TestStreamDisco(SlixTest):
@@ -40,6 +44,96 @@ class TestStreamDisco(SlixTest):
           </iq>
         """)
 
+    def testInfoSnapshot(self):
+        """
+        Test that disco#info replies are reused until the
+        local info changes.
+        """
+        self.stream_start(mode='client',
+                          plugins=['xep_0030'])
+        disco = self.xmpp['xep_0030']
+        disco.add_feature('urn:xmpp:ping')
+
+        for id in ('1', '2'):
+            self.recv("""
+              <iq type="get" id="%s" to="tester@localhost/resource">
+                <query xmlns="http://jabber.org/protocol/disco#info" />
+              </iq>
+            """ % id)
+            self.send("""
+              <iq type="result" id="%s">
+                <query xmlns="http://jabber.org/protocol/disco#info">
+                  <identity category="client" type="bot" />
+                  <feature var="urn:xmpp:ping" />
+                </query>
+              </iq>
+            """ % id)
+        self.assertEqual(list(disco.static.snapshots),
+                         [('tester@localhost/resource', '')])
+
+        version = disco.static.version
+        disco.add_feature('urn:xmpp:time')
+        self.assertEqual(disco.static.snapshots, {})
+        self.assertEqual(disco.static.version, version + 1)
+
+        self.recv("""
+          <iq type="get" id="3" to="tester@localhost/resource">
+            <query xmlns="http://jabber.org/protocol/disco#info" />
+          </iq>
+        """)
+        self.send("""
+          <iq type="result" id="3">
+            <query xmlns="http://jabber.org/protocol/disco#info">
+              <identity category="client" type="bot" />
+              <feature var="urn:xmpp:ping" />
+              <feature var="urn:xmpp:time" />
+            </query>
+          </iq>
+        """)
+
+    def testInfoSnapshotHandlers(self):
+        """
+        Test that disco#info replies are not reused over custom
+        handlers or changes made to the returned info.
+        """
+        self.stream_start(mode='client',
+                          plugins=['xep_0030'])
+        disco = self.xmpp['xep_0030']
+        disco.add_feature('urn:xmpp:ping')
+        query = """
+          <iq type="get" id="%s" to="tester@localhost/resource">
+            <query xmlns="http://jabber.org/protocol/disco#info" />
+          </iq>
+        """
+        reply = """
+          <iq type="result" id="%s">
+            <query xmlns="http://jabber.org/protocol/disco#info">
+              <identity category="client" type="bot" />
+              %s
+            </query>
+          </iq>
+        """
+
+        self.recv(query % '1')
+        self.send(reply % ('1', '<feature var="urn:xmpp:ping" />'))
+
+        def custom_info(jid, node, ifrom, data):
+            info = self.xmpp['xep_0030'].stanza.DiscoInfo()
+            info.add_feature('urn:xmpp:time')
+            return info
+
+        disco.api.register(custom_info, 'get_info',
+                           jid='tester@localhost/resource')
+        self.recv(query % '2')
+        self.send(reply % ('2', '<feature var="urn:xmpp:time" />'))
+
+        disco.api.unregister('get_info', jid='tester@localhost/resource')
+        info = disco.get_info(local=True).result()
+        info.add_feature('urn:xmpp:receipts')
+        self.recv(query % '3')
+        self.send(reply % ('3', '<feature var="urn:xmpp:ping" />'
+                                '<feature var="urn:xmpp:receipts" />'))
+
     def testInfoEmptyDefaultNodeComponent(self):
         """
         Test requesting an empty, default node using a Component.
@@ -310,6 +404,82 @@ class TestStreamDisco(SlixTest):
         self.assertEqual(events, {'disco_info'},
                 "Disco info event was not triggered: %s" % events)
 
+    def testGetInfoCoalesced(self):
+        """
+        Test that identical disco#info queries in flight
+        share a single request.
+        """
+        self.stream_start(mode='client',
+                          plugins=['xep_0030'])
+        disco = self.xmpp['xep_0030']
+
+        results = []
+        first = disco.get_info('user@localhost', 'foo')
+        second = disco.get_info('user@localhost', 'foo',
+                                callback=results.append)
+        third = disco.get_info('user@localhost', 'foo')
+        third.cancel()
+
+        self.send("""
+          <iq type="get" to="user@localhost" id="1">
+            <query xmlns="http://jabber.org/protocol/disco#info"
+                   node="foo" />
+          </iq>
+        """)
+        self.send(None)
+
+        self.recv("""
+          <iq type="result" to="tester@localhost" id="1">
+            <query xmlns="http://jabber.org/protocol/disco#info"
+                   node="foo">
+              <feature var="urn:xmpp:ping" />
+            </query>
+          </iq>
+        """)
+        self.xmpp.loop.run_until_complete(asyncio.sleep(0))
+
+        self.assertEqual(first.result()['disco_info']['features'],
+                         {'urn:xmpp:ping'})
+        self.assertEqual(results, [second.result()])
+        self.assertEqual(disco.request_stats,
+                         {'sent': 1, 'coalesced': 2, 'cancelled': 0})
+
+        # Once all the callers are gone, the query is abandoned.
+        fut = disco.get_info('user@localhost', 'foo')
+        (shared, iq, callers), = disco._in_flight.values()
+        fut.cancel()
+        self.xmpp.loop.run_until_complete(asyncio.sleep(0))
+        self.assertEqual(disco.request_stats['cancelled'], 1)
+        self.assertEqual(disco._in_flight, {})
+        self.assertFalse(self.xmpp.del_pending_iq(iq['id'], ''))
+
+    def testGetInfoCoalescedTimeouts(self):
+        """
+        Test that a coalesced disco#info query does not expire
+        with the timeout of its first caller.
+        """
+        self.stream_start(mode='client',
+                          plugins=['xep_0030'])
+        disco = self.xmpp['xep_0030']
+
+        first = disco.get_info('user@localhost', 'foo', timeout=0.01)
+        second = disco.get_info('user@localhost', 'foo', timeout=10)
+        self.xmpp.loop.run_until_complete(asyncio.sleep(0.05))
+        self.assertIsInstance(first.exception(), IqTimeout)
+        self.assertFalse(second.done())
+
+        self.recv("""
+          <iq type="result" to="tester@localhost" id="1">
+            <query xmlns="http://jabber.org/protocol/disco#info"
+                   node="foo">
+              <feature var="urn:xmpp:ping" />
+            </query>
+          </iq>
+        """)
+        self.xmpp.loop.run_until_complete(asyncio.sleep(0))
+        self.assertEqual(second.result()['disco_info']['features'],
+                         {'urn:xmpp:ping'})
+
     def testDynamicItemsJID(self):
         """
         Test using a dynamic items handler for a particular JID.
@@ -509,6 +679,83 @@ class TestStreamDisco(SlixTest):
         self.assertEqual(results, items,
                 "Unexpected items: %s" % results)
 
+    def testGetItemsCached(self):
+        """
+        Test that disco#items results are cached, and that
+        cached results expire.
+        """
+        self.stream_start(mode='client',
+                          plugins=['xep_0030'])
+        disco = self.xmpp['xep_0030']
+
+        disco.get_items('user@localhost', 'foo')
+        self.send("""
+          <iq type="get" to="user@localhost" id="1">
+            <query xmlns="http://jabber.org/protocol/disco#items"
+                   node="foo" />
+          </iq>
+        """)
+        self.recv("""
+          <iq type="result" from="user@localhost"
+              to="tester@localhost" id="1">
+            <query xmlns="http://jabber.org/protocol/disco#items"
+                   node="foo">
+              <item jid="user@localhost" node="bar" name="Test" />
+            </query>
+          </iq>
+        """)
+
+        result = disco.get_items('user@localhost', 'foo',
+                                 cached=True).result()
+        self.assertEqual(result['items'],
+                         {('user@localhost', 'bar', 'Test')})
+        self.send(None)
+        self.assertEqual(disco.cache.stats['hits'], 1)
+
+        # Static nodes are not mixed with cached results.
+        self.assertFalse(disco.static.node_exists('user@localhost', 'foo'))
+
+        disco.cache.store(('items', 'user@localhost', 'foo', ''),
+                          result, ttl=0)
+        disco.get_items('user@localhost', 'foo', cached=True)
+        self.send("""
+          <iq type="get" to="user@localhost" id="2">
+            <query xmlns="http://jabber.org/protocol/disco#items"
+                   node="foo" />
+          </iq>
+        """)
+        self.assertEqual(disco.cache.stats['expired'], 1)
+
+    def testCacheFileSystem(self):
+        """Test persisting disco#info results to the file system."""
+        with TemporaryDirectory() as tmpdir:
+            self.stream_start(mode='client',
+                              plugins=['xep_0030'],
+                              plugin_config={'xep_0030': {
+                                  'cache_backend': FileSystemCache(tmpdir,
+                                                                   'disco')}})
+            disco = self.xmpp['xep_0030']
+
+            disco.get_info('user@localhost', 'foo')
+            self.recv("""
+              <iq type="result" from="user@localhost"
+                  to="tester@localhost" id="1">
+                <query xmlns="http://jabber.org/protocol/disco#info"
+                       node="foo">
+                  <identity category="client" type="pc" />
+                  <feature var="urn:xmpp:ping" />
+                </query>
+              </iq>
+            """)
+
+            disco.cache.clear()
+            result = disco.get_info('user@localhost', 'foo',
+                                    cached=True).result()
+            self.assertEqual(result['features'], {'urn:xmpp:ping'})
+            self.assertEqual(result['identities'],
+                             {('client', 'pc', None, None)})
+            self.assertEqual(disco.cache.stats['hits'], 1)
+
     '''
     def testGetItemsIterator(self):
         """Test interaction between XEP-0030 and XEP-0059 plugins."""
@@ -1,8 +1,10 @@
 import asyncio
+import io
 import threading
 import time
 
 import unittest
+from slixmpp.exceptions import IqError
 from slixmpp.test import SlixTest
 
 
@@ -156,5 +158,194 @@ class TestInBandByteStreams(SlixTest):
 
         self.assertEqual(data, [b'it works!'])
 
+    def testSendWindow(self):
+        """Test sending several chunks before they are acknowledged."""
+        streams = []
+        self.xmpp.add_event_handler('ibb_stream_start', streams.append)
+
+        self.xmpp['xep_0047'].open_stream('tester@localhost/receiver',
+                                          sid='testing', block_size=4,
+                                          window=2)
+        self.send("""
+          <iq type="set" to="tester@localhost/receiver" id="1">
+            <open xmlns="http://jabber.org/protocol/ibb"
+                  sid="testing"
+                  block-size="4"
+                  stanza="iq" />
+          </iq>
+        """)
+        self.recv("""
+          <iq type="result" id="1"
+              to="tester@localhost"
+              from="tester@localhost/receiver" />
+        """)
+
+        stream = streams[0]
+        future = asyncio.ensure_future(stream.sendall(b'Testing!!'))
+        self.xmpp.loop.run_until_complete(asyncio.sleep(0))
+
+        for id, seq, data in (('2', '0', 'VGVzdA=='), ('3', '1', 'aW5nIQ==')):
+            self.send("""
+              <iq type="set" id="%s"
+                  from="tester@localhost"
+                  to="tester@localhost/receiver">
+                <data xmlns="http://jabber.org/protocol/ibb"
+                      seq="%s"
+                      sid="testing">%s</data>
+              </iq>
+            """ % (id, seq, data))
+        # The window is full.
+        self.send(None)
+
+        self.recv("""
+          <iq type="result" id="3"
+              to="tester@localhost"
+              from="tester@localhost/receiver" />
+        """)
+        self.xmpp.loop.run_until_complete(asyncio.sleep(0))
+        self.send("""
+          <iq type="set" id="4"
+              from="tester@localhost"
+              to="tester@localhost/receiver">
+            <data xmlns="http://jabber.org/protocol/ibb"
+                  seq="2"
+                  sid="testing">IQ==</data>
+          </iq>
+        """)
+        self.assertFalse(future.done())
+
+        for id in ('2', '4'):
+            self.recv("""
+              <iq type="result" id="%s"
+                  to="tester@localhost"
+                  from="tester@localhost/receiver" />
+            """ % id)
+        self.xmpp.loop.run_until_complete(future)
+
+    def testSendError(self):
+        """Test that a failed chunk is reported once."""
+        streams = []
+        self.xmpp.add_event_handler('ibb_stream_start', streams.append)
+
+        self.xmpp['xep_0047'].open_stream('tester@localhost/receiver',
+                                          sid='testing', block_size=4,
+                                          window=2)
+        self.recv("""
+          <iq type="result" id="1"
+              to="tester@localhost"
+              from="tester@localhost/receiver" />
+        """)
+
+        stream = streams[0]
+        self.xmpp.loop.run_until_complete(stream.send(b'Test'))
+        self.recv("""
+          <iq type="error" id="2"
+              to="tester@localhost"
+              from="tester@localhost/receiver">
+            <error type="cancel">
+              <not-acceptable xmlns="urn:ietf:params:xml:ns:xmpp-stanzas" />
+            </error>
+          </iq>
+        """)
+        self.assertRaises(IqError, self.xmpp.loop.run_until_complete,
+                          stream.drain())
+        self.xmpp.loop.run_until_complete(stream.drain())
+
+    def testSendErrorNoWindow(self):
+        """Test that a failed chunk sent without a window is only raised
+        by its own send()."""
+        streams = []
+        self.xmpp.add_event_handler('ibb_stream_start', streams.append)
+
+        self.xmpp['xep_0047'].open_stream('tester@localhost/receiver',
+                                          sid='testing', block_size=4)
+        self.recv("""
+          <iq type="result" id="1"
+              to="tester@localhost"
+              from="tester@localhost/receiver" />
+        """)
+
+        stream = streams[0]
+        future = asyncio.ensure_future(stream.send(b'Test'))
+        self.xmpp.loop.run_until_complete(asyncio.sleep(0))
+        self.recv("""
+          <iq type="error" id="2"
+              to="tester@localhost"
+              from="tester@localhost/receiver">
+            <error type="cancel">
+              <not-acceptable xmlns="urn:ietf:params:xml:ns:xmpp-stanzas" />
+            </error>
+          </iq>
+        """)
+        self.assertRaises(IqError, self.xmpp.loop.run_until_complete, future)
+
+        for id in ('3', '4'):
+            future = asyncio.ensure_future(stream.send(b'Test'))
+            self.xmpp.loop.run_until_complete(asyncio.sleep(0))
+            self.recv("""
+              <iq type="result" id="%s"
+                  to="tester@localhost"
+                  from="tester@localhost/receiver" />
+            """ % id)
+            self.assertEqual(self.xmpp.loop.run_until_complete(future), 4)
+        self.xmpp.loop.run_until_complete(stream.drain())
+
+    def testRecvBuffer(self):
+        """Test delaying acknowledgements while the reader falls behind."""
+        streams = []
+        self.xmpp.add_event_handler('ibb_stream_start', streams.append)
+        self.xmpp['xep_0047'].auto_accept = True
+        self.xmpp['xep_0047'].max_buffer = 4
+
+        self.recv("""
+          <iq type="set" id="1"
+              to="tester@localhost"
+              from="tester@localhost/sender">
+            <open xmlns="http://jabber.org/protocol/ibb"
+                  sid="testing"
+                  block-size="4"
+                  stanza="iq" />
+          </iq>
+        """)
+        self.send("""
+          <iq type="result" id="1" to="tester@localhost/sender" />
+        """)
+
+        for id, seq, data in (('2', '0', 'VGVzdA=='), ('3', '1', 'aW5nIQ==')):
+            self.recv("""
+              <iq type="set" id="%s"
+                  to="tester@localhost"
+                  from="tester@localhost/sender">
+                <data xmlns="http://jabber.org/protocol/ibb"
+                      seq="%s"
+                      sid="testing">%s</data>
+              </iq>
+            """ % (id, seq, data))
+        self.send("""
+          <iq type="result" id="2" to="tester@localhost/sender" />
+        """)
+        # The buffer is over its limit.
+        self.send(None)
+
+        reader = streams[0].reader
+        data = self.xmpp.loop.run_until_complete(reader.readexactly(5))
+        self.assertEqual(data, b'Testi')
+        self.send("""
+          <iq type="result" id="3" to="tester@localhost/sender" />
+        """)
+        self.assertEqual(streams[0].recv_queue.qsize(), 1)
+
+        output = io.BytesIO()
+        future = asyncio.ensure_future(streams[0].recvfile(output))
+        self.recv("""
+          <iq type="set" id="4"
+              to="tester@localhost"
+              from="tester@localhost/sender">
+            <close xmlns="http://jabber.org/protocol/ibb" sid="testing" />
+          </iq>
+        """)
+        self.assertEqual(self.xmpp.loop.run_until_complete(future), 3)
+        self.assertEqual(output.getvalue(), b'ng!')
+
 
 suite = unittest.TestLoader().loadTestsFromTestCase(TestInBandByteStreams)
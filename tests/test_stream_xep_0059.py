@@ -0,0 +1,113 @@
+import asyncio
+import unittest
+from slixmpp.test import SlixTest
+
+
+PAGE = """
+  <iq type="result" id="%s" from="pubsub.example.com" to="tester@localhost">
+    <query xmlns="http://jabber.org/protocol/disco#items">
+      %s
+      <set xmlns="http://jabber.org/protocol/rsm">
+        <first index="%d">%s</first>
+        <last>%s</last>
+        <count>25</count>
+      </set>
+    </query>
+  </iq>
+"""
+
+
+class TestResultSetIterator(SlixTest):
+
+    def setUp(self):
+        self.stream_start(plugins=['xep_0030', 'xep_0059'])
+
+    def tearDown(self):
+        self.stream_close()
+
+    def run_tasks(self):
+        for _ in range(5):
+            self.xmpp.loop.run_until_complete(asyncio.sleep(0))
+
+    def page(self, id, index, amount):
+        items = ''.join('<item jid="item%d" />' % i
+                        for i in range(index, index + amount))
+        return PAGE % (id, items, index, 'item%d' % index,
+                       'item%d' % (index + amount - 1))
+
+    def iterate(self, **kwargs):
+        iq = self.xmpp.Iq(sto='pubsub.example.com', stype='get')
+        iq.enable('disco_items')
+        return self.xmpp['xep_0059'].iterate(iq, 'disco_items', **kwargs)
+
+    def testPrefetch(self):
+        """Test requesting the next page before it is needed."""
+        pages = self.iterate(prefetch=1)
+        page = asyncio.ensure_future(pages.next())
+        self.run_tasks()
+        self.send("""
+          <iq type="get" id="2" to="pubsub.example.com">
+            <query xmlns="http://jabber.org/protocol/disco#items">
+              <set xmlns="http://jabber.org/protocol/rsm"><max>10</max></set>
+            </query>
+          </iq>
+        """)
+        self.recv(self.page('2', 0, 10))
+        self.run_tasks()
+        self.assertEqual(min(page.result()['disco_items']['items'])[0],
+                         'item0')
+
+        # The second page is already on its way.
+        self.send("""
+          <iq type="get" id="3" to="pubsub.example.com">
+            <query xmlns="http://jabber.org/protocol/disco#items">
+              <set xmlns="http://jabber.org/protocol/rsm">
+                <max>10</max>
+                <after>item9</after>
+              </set>
+            </query>
+          </iq>
+        """)
+        pages.cancel()
+
+    def testParallel(self):
+        """Test fetching the pages by index, at once, in order."""
+        pages = self.iterate(parallel=2)
+        received = []
+
+        async def consume():
+            async for page in pages:
+                received.append(min(page['disco_items']['items'])[0])
+
+        task = asyncio.ensure_future(consume())
+        self.run_tasks()
+        self.send("""
+          <iq type="get" id="2" to="pubsub.example.com">
+            <query xmlns="http://jabber.org/protocol/disco#items">
+              <set xmlns="http://jabber.org/protocol/rsm"><max>10</max></set>
+            </query>
+          </iq>
+        """)
+        self.recv(self.page('2', 0, 10))
+        self.run_tasks()
+
+        for id, index, amount in (('3', 10, 10), ('4', 20, 5)):
+            self.send("""
+              <iq type="get" id="%s" to="pubsub.example.com">
+                <query xmlns="http://jabber.org/protocol/disco#items">
+                  <set xmlns="http://jabber.org/protocol/rsm">
+                    <max>%d</max>
+                    <index>%d</index>
+                  </set>
+                </query>
+              </iq>
+            """ % (id, amount, index))
+
+        # Out of order replies.
+        self.recv(self.page('4', 20, 5))
+        self.recv(self.page('3', 10, 10))
+        self.xmpp.loop.run_until_complete(task)
+        self.assertEqual(received, ['item0', 'item10', 'item20'])
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestResultSetIterator)
@@ -0,0 +1,135 @@
+import asyncio
+import unittest
+from slixmpp.test import SlixTest
+
+
+class Proxy(asyncio.Protocol):
+
+    """Accept SOCKS5 connect requests, unless ``answer`` is False."""
+
+    answer = True
+    lost = []
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.methods = False
+
+    def data_received(self, data):
+        if not self.methods:
+            self.methods = True
+            self.transport.write(b'\x05\x00')
+        elif self.answer:
+            self.transport.write(b'\x05\x00\x00' + data[3:])
+
+    def connection_lost(self, exc):
+        self.lost.append(self)
+
+
+class SlowProxy(Proxy):
+    answer = False
+    lost = []
+
+
+class TestSocks5Bytestreams(SlixTest):
+
+    def setUp(self):
+        self.stream_start(plugins=['xep_0030', 'xep_0065', 'xep_0086'],
+                          plugin_config={'xep_0065': {'auto_accept': True,
+                                                      'race_delay': 0.01,
+                                                      'connect_timeout': 0.2}})
+        self.s5b = self.xmpp['xep_0065']
+        Proxy.lost = []
+        SlowProxy.lost = []
+        loop = self.xmpp.loop
+        self.servers = [loop.run_until_complete(
+                            loop.create_server(factory, '127.0.0.1', 0))
+                        for factory in (SlowProxy, Proxy)]
+        self.ports = [server.sockets[0].getsockname()[1]
+                      for server in self.servers]
+
+    def tearDown(self):
+        self.s5b.close()
+        for server in self.servers:
+            server.close()
+        self.stream_close()
+
+    def testRace(self):
+        """Test using the first streamhost to answer."""
+        self.recv("""
+          <iq type="set" id="1"
+              to="tester@localhost" from="requester@localhost/a">
+            <query xmlns="http://jabber.org/protocol/bytestreams" sid="s">
+              <streamhost jid="slow.localhost" host="127.0.0.1" port="%d" />
+              <streamhost jid="fast.localhost" host="127.0.0.1" port="%d" />
+            </query>
+          </iq>
+        """ % tuple(self.ports))
+        self.xmpp.loop.run_until_complete(asyncio.sleep(0.1))
+
+        self.send("""
+          <iq type="result" id="1" to="requester@localhost/a">
+            <query xmlns="http://jabber.org/protocol/bytestreams" sid="s">
+              <streamhost-used jid="fast.localhost" />
+            </query>
+          </iq>
+        """)
+        self.assertTrue(self.s5b.get_socket('s').connected.done())
+        self.assertTrue(self.s5b.latency['fast.localhost'] < 0.2)
+        # The slow streamhost was tried first, then dropped.
+        self.assertEqual(len(SlowProxy.lost), 1)
+        self.assertFalse('slow.localhost' in self.s5b.latency)
+
+        # Later sessions try the fast streamhost first.
+        self.assertEqual(self.s5b._by_latency(['slow.localhost',
+                                               'fast.localhost']),
+                         ['fast.localhost', 'slow.localhost'])
+
+    def testTimeout(self):
+        """Test failing when no streamhost answers in time."""
+        self.recv("""
+          <iq type="set" id="1"
+              to="tester@localhost" from="requester@localhost/a">
+            <query xmlns="http://jabber.org/protocol/bytestreams" sid="s">
+              <streamhost jid="slow.localhost" host="127.0.0.1" port="%d" />
+            </query>
+          </iq>
+        """ % self.ports[0])
+        self.xmpp.loop.run_until_complete(asyncio.sleep(0.3))
+
+        self.send("""
+          <iq type="error" id="1" to="requester@localhost/a">
+            <error type="cancel" code="404">
+              <item-not-found xmlns="urn:ietf:params:xml:ns:xmpp-stanzas" />
+            </error>
+          </iq>
+        """)
+        self.assertEqual(self.s5b.latency['slow.localhost'], 0.2)
+
+    def testSameJid(self):
+        """Test trying every address offered for a streamhost JID."""
+        self.recv("""
+          <iq type="set" id="1"
+              to="tester@localhost" from="requester@localhost/a">
+            <query xmlns="http://jabber.org/protocol/bytestreams" sid="s">
+              <streamhost jid="proxy.localhost" host="127.0.0.1" port="%d" />
+              <streamhost jid="proxy.localhost" host="127.0.0.1" port="%d" />
+            </query>
+          </iq>
+        """ % tuple(self.ports))
+        self.xmpp.loop.run_until_complete(asyncio.sleep(0.1))
+
+        self.send("""
+          <iq type="result" id="1" to="requester@localhost/a">
+            <query xmlns="http://jabber.org/protocol/bytestreams" sid="s">
+              <streamhost-used jid="proxy.localhost" />
+            </query>
+          </iq>
+        """)
+        self.assertTrue(self.s5b.get_socket('s').connected.done())
+        self.assertEqual(len(SlowProxy.lost), 1)
+        self.assertEqual(list(self.s5b.address_latency),
+                         [('proxy.localhost', '127.0.0.1', str(self.ports[1]))])
+        self.assertTrue(self.s5b.latency['proxy.localhost'] < 0.2)
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestSocks5Bytestreams)
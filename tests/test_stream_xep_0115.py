@@ -0,0 +1,114 @@
+import asyncio
+import unittest
+from tempfile import TemporaryDirectory
+from slixmpp.test import SlixTest
+
+
+PRESENCE = """
+  <presence from="%s" to="tester@localhost">
+    <c xmlns="http://jabber.org/protocol/caps" hash="sha-1"
+       node="http://code.google.com/p/exodus"
+       ver="QgayPKawpkPSDYmwT/WM94uAlu0=" />
+  </presence>
+"""
+
+
+class TestStreamCaps(SlixTest):
+
+    """
+    Test using the XEP-0115 plugin.
+    """
+
+    def tearDown(self):
+        self.stream_close()
+
+    def start(self, cache_dir=None):
+        self.stream_start(mode='client',
+                          plugins=['xep_0030', 'xep_0115'],
+                          plugin_config={'xep_0115': {'cache_dir': cache_dir}})
+        self.caps = self.xmpp['xep_0115']
+
+    def run_tasks(self):
+        for _ in range(5):
+            self.xmpp.loop.run_until_complete(asyncio.sleep(0))
+
+    def testQueryOnce(self):
+        """Test that a verification string is only queried once."""
+        with TemporaryDirectory() as tmpdir:
+            self.start(tmpdir)
+            self.recv(PRESENCE % 'romeo@montague.lit/orchard')
+            self.recv(PRESENCE % 'juliet@capulet.lit/balcony')
+            self.run_tasks()
+
+            self.send("""
+              <iq type="get" to="romeo@montague.lit/orchard" id="1">
+                <query xmlns="http://jabber.org/protocol/disco#info"
+                       node="http://code.google.com/p/exodus#QgayPKawpkPSDYmwT/WM94uAlu0=" />
+              </iq>
+            """)
+            self.send(None)
+
+            self.recv("""
+              <iq type="result" from="romeo@montague.lit/orchard"
+                  to="tester@localhost" id="1">
+                <query xmlns="http://jabber.org/protocol/disco#info"
+                       node="http://code.google.com/p/exodus#QgayPKawpkPSDYmwT/WM94uAlu0=">
+                  <identity category="client" name="Exodus 0.9.1" type="pc"/>
+                  <feature var="http://jabber.org/protocol/caps"/>
+                  <feature var="http://jabber.org/protocol/disco#info"/>
+                  <feature var="http://jabber.org/protocol/disco#items"/>
+                  <feature var="http://jabber.org/protocol/muc"/>
+                </query>
+              </iq>
+            """)
+            self.run_tasks()
+
+            for jid in ('romeo@montague.lit/orchard',
+                        'juliet@capulet.lit/balcony'):
+                self.assertEqual(self.caps.get_verstring(jid),
+                                 'QgayPKawpkPSDYmwT/WM94uAlu0=')
+
+            # A new client loads the saved caps instead of asking again.
+            self.stream_close()
+            self.start(tmpdir)
+            info = self.caps.get_caps(verstring='QgayPKawpkPSDYmwT/WM94uAlu0=')
+            self.assertTrue('http://jabber.org/protocol/muc' in info['features'])
+
+            self.recv(PRESENCE % 'romeo@montague.lit/orchard')
+            self.run_tasks()
+            self.send(None)
+            self.assertEqual(
+                    self.caps.get_verstring('romeo@montague.lit/orchard'),
+                    'QgayPKawpkPSDYmwT/WM94uAlu0=')
+
+    def testStamps(self):
+        """Test that our stamped verification string is only dropped
+        when ours changes."""
+        self.start()
+        caps = """
+          <presence>
+            <c xmlns="http://jabber.org/protocol/caps" hash="sha-1"
+               node="%s" ver="%s" />
+          </presence>
+        """
+        self.caps.assign_verstring(None, 'first')
+        self.xmpp.send_presence()
+        self.send(caps % (self.caps.caps_node, 'first'))
+        self.assertEqual(self.caps._stamps, {'': 'first'})
+
+        info = self.xmpp['xep_0030'].stanza.DiscoInfo()
+        info.add_feature('http://jabber.org/protocol/muc')
+        self.caps.cache_caps('QgayPKawpkPSDYmwT/WM94uAlu0=', info)
+        self.recv(PRESENCE % 'romeo@montague.lit/orchard')
+        self.run_tasks()
+        self.assertEqual(
+                self.caps.get_verstring('romeo@montague.lit/orchard'),
+                'QgayPKawpkPSDYmwT/WM94uAlu0=')
+        self.assertEqual(self.caps._stamps, {'': 'first'})
+
+        self.caps.assign_verstring(None, 'second')
+        self.xmpp.send_presence()
+        self.send(caps % (self.caps.caps_node, 'second'))
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestStreamCaps)
@@ -0,0 +1,164 @@
+import asyncio
+import unittest
+from slixmpp.test import SlixTest
+from slixmpp import Message
+from slixmpp.plugins.xep_0198 import stanza
+from slixmpp.util import MemoryCache
+
+
+class TestStreamManagement(SlixTest):
+
+    """
+    Test using the XEP-0198 plugin.
+    """
+
+    def tearDown(self):
+        self.stream_close()
+
+    def start(self, **config):
+        self.stream_start(mode='client',
+                          plugins=['xep_0198'],
+                          plugin_config={'xep_0198': config})
+        self.sm = self.xmpp['xep_0198']
+        self.sm.enabled = True
+        self.sm.sm_id = 'some-long-sm-id'
+
+    def testUnackedBytes(self):
+        """Test that unacked stanzas are kept serialized."""
+        self.start()
+        acked = []
+        self.xmpp.add_event_handler('stanza_acked', acked.append)
+
+        self.xmpp.send_message(mto='romeo@montague.lit', mbody='Hi!')
+        self.send("""
+          <message to="romeo@montague.lit"><body>Hi!</body></message>
+        """)
+        entry = self.sm.unacked_queue[0]
+        self.assertEqual((entry.seq, entry.name, entry.to),
+                         (1, 'message', 'romeo@montague.lit'))
+        self.assertEqual(entry.data,
+                         b'<message to="romeo@montague.lit">'
+                         b'<body>Hi!</body></message>')
+        self.assertEqual(self.sm.unacked_bytes, len(entry.data))
+
+        self.recv("""<a xmlns="urn:xmpp:sm:3" h="1" />""")
+        self.assertEqual(len(acked), 1)
+        self.assertEqual(acked[0]['to'], 'romeo@montague.lit')
+        self.assertEqual(acked[0]['body'], 'Hi!')
+        self.assertEqual(self.sm.unacked_bytes, 0)
+
+    def testDroppedStanza(self):
+        """Test that a stanza dropped by another filter is not counted,
+        nor mistaken for the next data written."""
+        self.start()
+
+        def drop(stanza):
+            if isinstance(stanza, Message) and stanza['body'] == 'Drop':
+                return None
+            return stanza
+
+        self.xmpp.add_filter('out_sync', drop)
+        self.xmpp.send_message(mto='romeo@montague.lit', mbody='Drop')
+        self.xmpp.send(stanza.Enable(self.xmpp))
+        self.assertEqual(self.xmpp.socket.next_sent(),
+                         b'<enable xmlns="urn:xmpp:sm:3" />')
+        self.assertEqual(len(self.sm.unacked_queue), 0)
+        self.assertEqual(self.sm.seq, 0)
+
+    def testMemoryCeiling(self):
+        """Test that an ack is requested when too much is unacked."""
+        self.start(max_unacked_bytes=60)
+
+        self.xmpp.send_message(mto='romeo@montague.lit', mbody='Hi!')
+        self.send("""
+          <message to="romeo@montague.lit"><body>Hi!</body></message>
+        """)
+        # The request is sent along with the stanza.
+        self.xmpp.send_message(mto='romeo@montague.lit', mbody='Hi again!')
+        self.assertEqual(self.xmpp.socket.next_sent(),
+                         b'<message to="romeo@montague.lit">'
+                         b'<body>Hi again!</body></message>'
+                         b'<r xmlns="urn:xmpp:sm:3" />')
+
+        # Only once until the server answers.
+        self.xmpp.send_message(mto='romeo@montague.lit', mbody='Still?')
+        self.send("""
+          <message to="romeo@montague.lit"><body>Still?</body></message>
+        """)
+
+    def testCoalescedRequest(self):
+        """Test that ack requests follow coalesced writes."""
+        self.start(window=1)
+        self.xmpp.coalesce_writes = True
+
+        self.xmpp.send_message(mto='romeo@montague.lit', mbody='Hi!')
+        self.xmpp.loop.run_until_complete(asyncio.sleep(0))
+        self.assertEqual(self.xmpp.socket.next_sent(),
+                         b'<message to="romeo@montague.lit">'
+                         b'<body>Hi!</body></message>'
+                         b'<r xmlns="urn:xmpp:sm:3" />')
+
+    def testNoAckDelay(self):
+        """Test that requests go on each window without the timer."""
+        self.start(window=1, max_ack_delay=0)
+
+        for body in ('One', 'Two'):
+            self.xmpp.send_message(mto='romeo@montague.lit', mbody=body)
+            self.assertEqual(self.xmpp.socket.next_sent(),
+                             b'<message to="romeo@montague.lit">'
+                             b'<body>%s</body></message>'
+                             b'<r xmlns="urn:xmpp:sm:3" />'
+                             % body.encode('utf-8'))
+
+    def testAckDelay(self):
+        """Test that few stanzas do not stay unacked forever."""
+        self.start(max_ack_delay=0.01)
+
+        self.xmpp.send_message(mto='romeo@montague.lit', mbody='Hi!')
+        self.send("""
+          <message to="romeo@montague.lit"><body>Hi!</body></message>
+        """)
+        self.send(None)
+        # Wait longer before asking again.
+        self.sm.max_ack_delay = 60
+        self.xmpp.loop.run_until_complete(asyncio.sleep(0.05))
+        self.send("""<r xmlns="urn:xmpp:sm:3" />""")
+        self.send(None)
+
+        self.recv("""<a xmlns="urn:xmpp:sm:3" h="1" />""")
+        stats = self.sm.ack_stats
+        self.assertEqual((stats['requests'], stats['acks'], stats['acked']),
+                         (1, 1, 1))
+        self.assertTrue(stats['latency_last'] >= 0.01)
+        self.assertEqual(stats['latency_last'], stats['latency_avg'])
+
+    def testPersistence(self):
+        """Test resuming the stream of another process."""
+        cache = MemoryCache()
+        self.start(state_cache=cache)
+        self.xmpp.send_message(mto='romeo@montague.lit', mbody='Hi!')
+        self.send("""
+          <message to="romeo@montague.lit"><body>Hi!</body></message>
+        """)
+        self.recv("""
+          <message from="romeo@montague.lit"><body>Hello</body></message>
+        """)
+        self.xmpp.loop.run_until_complete(asyncio.sleep(0))
+        self.stream_close()
+
+        self.stream_start(mode='client',
+                          plugins=['xep_0198'],
+                          plugin_config={'xep_0198': {'state_cache': cache}})
+        sm = self.xmpp['xep_0198']
+        self.assertEqual((sm.sm_id, sm.handled, sm.seq),
+                         ('some-long-sm-id', 1, 1))
+
+        sm.enabled = True
+        self.recv("""<resumed xmlns="urn:xmpp:sm:3" h="0"
+                              previd="some-long-sm-id" />""")
+        self.send("""
+          <message to="romeo@montague.lit"><body>Hi!</body></message>
+        """)
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestStreamManagement)
@@ -0,0 +1,120 @@
+import asyncio
+import unittest
+from slixmpp.test import SlixTest
+from slixmpp.util import MemoryCache
+
+
+RESULT = """
+  <message to="tester@localhost" from="tester@localhost">
+    <result xmlns="urn:xmpp:mam:2" queryid="%s" id="%s">
+      <forwarded xmlns="urn:xmpp:forward:0">
+        <message xmlns="jabber:client" from="romeo@montague.lit"
+                 to="tester@localhost">
+          <body>%s</body>
+        </message>
+      </forwarded>
+    </result>
+  </message>
+"""
+
+FIN = """
+  <iq type="result" id="%s" to="tester@localhost">
+    <fin xmlns="urn:xmpp:mam:2" %s>
+      <set xmlns="http://jabber.org/protocol/rsm">
+        <first>%s</first>
+        <last>%s</last>
+      </set>
+    </fin>
+  </iq>
+"""
+
+
+class TestMAM(SlixTest):
+
+    def setUp(self):
+        self.cache = MemoryCache()
+        self.stream_start(plugins=['xep_0313'],
+                          plugin_config={'xep_0313': {
+                              'checkpoint_cache': self.cache}})
+
+    def tearDown(self):
+        self.stream_close()
+
+    def run_tasks(self):
+        for _ in range(5):
+            self.xmpp.loop.run_until_complete(asyncio.sleep(0))
+
+    def testIterate(self):
+        """Test yielding archived messages page after page."""
+        bodies = []
+
+        async def sync():
+            async for msg in self.xmpp['xep_0313'].iterate(amount=2,
+                                                           checkpoint='sync'):
+                bodies.append(msg['mam_result']['forwarded']['stanza']['body'])
+
+        task = asyncio.ensure_future(sync())
+        self.run_tasks()
+        self.send("""
+          <iq type="set" id="2">
+            <query xmlns="urn:xmpp:mam:2" queryid="1">
+              <x xmlns="jabber:x:data" type="submit">
+                <field var="FORM_TYPE"><value>urn:xmpp:mam:2</value></field>
+              </x>
+              <set xmlns="http://jabber.org/protocol/rsm"><max>2</max></set>
+            </query>
+          </iq>
+        """, use_values=False)
+
+        self.recv(RESULT % ('1', 'a', 'One'))
+        self.run_tasks()
+        # Messages are yielded before the page is complete.
+        self.assertEqual(bodies, ['One'])
+
+        self.recv(RESULT % ('1', 'b', 'Two'))
+        self.recv(FIN % ('2', '', 'a', 'b'))
+        self.run_tasks()
+        self.send("""
+          <iq type="set" id="3">
+            <query xmlns="urn:xmpp:mam:2" queryid="1">
+              <x xmlns="jabber:x:data" type="submit">
+                <field var="FORM_TYPE"><value>urn:xmpp:mam:2</value></field>
+              </x>
+              <set xmlns="http://jabber.org/protocol/rsm">
+                <max>2</max>
+                <after>b</after>
+              </set>
+            </query>
+          </iq>
+        """, use_values=False)
+        self.assertEqual(self.cache.retrieve('sync'), 'b')
+
+        self.recv(RESULT % ('1', 'c', 'Three'))
+        self.recv(FIN % ('3', 'complete="true"', 'c', 'c'))
+        self.xmpp.loop.run_until_complete(task)
+        self.assertEqual(bodies, ['One', 'Two', 'Three'])
+        self.assertEqual(self.cache.retrieve('sync'), 'c')
+
+        # Another sync resumes after the checkpoint.
+        task = asyncio.ensure_future(sync())
+        self.run_tasks()
+        self.send("""
+          <iq type="set" id="5">
+            <query xmlns="urn:xmpp:mam:2" queryid="4">
+              <x xmlns="jabber:x:data" type="submit">
+                <field var="FORM_TYPE"><value>urn:xmpp:mam:2</value></field>
+              </x>
+              <set xmlns="http://jabber.org/protocol/rsm">
+                <max>2</max>
+                <after>c</after>
+              </set>
+            </query>
+          </iq>
+        """, use_values=False)
+        task.cancel()
+        self.run_tasks()
+        # The results handler is gone with the iteration.
+        self.assertFalse(self.xmpp.remove_handler('MAM_Stream_4'))
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestMAM)
@@ -1,7 +1,7 @@
 import unittest
 from slixmpp.test import SlixTest
 from slixmpp.xmlstream.stanzabase import ET
-from slixmpp.xmlstream.tostring import tostring, escape
+from slixmpp.xmlstream.tostring import tostring, escape, Serializer
 
 
 class TestToString(SlixTest):
@@ -26,6 +26,8 @@ class TestToString(SlixTest):
             xml=original
         result = tostring(xml, **kwargs)
         self.assertTrue(result == expected, "%s: %s" % (message, result))
+        result = Serializer().serialize(xml, **kwargs).decode('utf-8')
+        self.assertTrue(result == expected, "%s: %s" % (message, result))
 
     def testXMLEscape(self):
         """Test escaping XML special characters."""
@@ -115,5 +117,31 @@ class TestToString(SlixTest):
         self.assertTrue(expected == result,
             "Serialization with xml:lang failed: %s" % result)
 
+    def testStreamSerializer(self):
+        """Test that the stream serializer matches tostring."""
+        self.stream_start()
+
+        msg = self.Message()
+        msg['to'] = 'user@example.com'
+        msg['body'] = 'Hi & <welcome>!'
+        msg._set_attr('{%s}lang' % msg.xml_ns, "no")
+        msg['chat_state'] = 'active'
+
+        for i in range(2):
+            expected = tostring(msg.xml, xmlns=self.xmpp.default_ns,
+                                stream=self.xmpp, top_level=True)
+            result = self.xmpp.serializer.serialize(msg.xml,
+                                                    xmlns=self.xmpp.default_ns,
+                                                    top_level=True)
+            self.assertEqual(result.decode('utf-8'), expected)
+
+        # The cached tags must follow changes to the namespace map.
+        self.xmpp.namespace_map['http://jabber.org/protocol/chatstates'] = 'cs'
+        result = self.xmpp.serializer.serialize(msg.xml,
+                                                xmlns=self.xmpp.default_ns,
+                                                top_level=True)
+        self.assertTrue(b'<cs:active' in result,
+            "Serializer did not use the new namespace prefix: %s" % result)
+
 
 suite = unittest.TestLoader().loadTestsFromTestCase(TestToString)